@@ -4,7 +4,6 @@ from flask_migrate import Migrate
 from flask_login import LoginManager
 from flask_wtf.csrf import CSRFProtect
 from config import Config
-import markdown
 import logging
 from sqlalchemy import MetaData
 
@@ -47,12 +46,18 @@ def create_app(config_class=Config):
     from app.tasks import bp as tasks_bp
     app.register_blueprint(tasks_bp, url_prefix='/tasks')
 
-    # Add this function to create the markdown filter
-    def markdown_filter(text):
-        return markdown.markdown(text)
+    # Register the markdown filter with Jinja; rendered messages are cached by content
+    from app.utils.markdown_cache import render_markdown
+    app.jinja_env.filters['markdown'] = render_markdown
 
-    # Register the markdown filter with Jinja
-    app.jinja_env.filters['markdown'] = markdown_filter
+    # Opt-in per request query counts, database time and N+1 warnings
+    if app.config['SQL_INSTRUMENTATION']:
+        from app.utils.sql_instrumentation import init_sql_instrumentation
+        with app.app_context():
+            init_sql_instrumentation(app, db.engine)
+
+    from app import cli
+    cli.register(app)
 
     return app
 
@@ -0,0 +1,212 @@
+import click
+import markdown
+from flask import current_app
+from flask.cli import with_appcontext
+from app import db
+from app.jobs import run_worker
+from app.utils.llm_cache import SQLiteCache, get_llm_cache
+from app.utils.dataset_import import IMPORT_BATCH_SIZE, import_prompts as import_prompt_records, read_records
+from app.utils.ranking_scores import SCORE_KEYS, get_ranking_scores
+from app.utils.export import EXPORT_BATCH_SIZE, export_increment as export_increment_shards, iter_conversation_trees, iter_jsonl
+from app.models import Evaluation, EvaluationTask, Prompt, RankingTaskItem, UserScore
+
+BATCH_SIZE = 10000
+
+
+@click.command('rebuild-evaluation-counts')
+@with_appcontext
+def rebuild_evaluation_counts():
+    """Recount evaluations for every evaluation task and fix drifted counters."""
+    max_id = db.session.query(db.func.max(EvaluationTask.id)).scalar() or 0
+    actual_count = db.select(db.func.count(Evaluation.id)).where(
+        Evaluation.task_id == EvaluationTask.id
+    ).scalar_subquery()
+
+    fixed = 0
+    for start in range(0, max_id + 1, BATCH_SIZE):
+        result = db.session.execute(
+            db.update(EvaluationTask)
+            .where(EvaluationTask.id >= start, EvaluationTask.id < start + BATCH_SIZE)
+            .where(EvaluationTask.evaluation_count != actual_count)
+            .values(evaluation_count=actual_count)
+            .execution_options(synchronize_session=False)
+        )
+        fixed += result.rowcount
+        db.session.commit()
+
+    click.echo(f"Fixed evaluation counts on {fixed} tasks.")
+
+
+@click.command('rebuild-user-scores')
+@with_appcontext
+def rebuild_user_scores():
+    """Recompute the leaderboard table from revisions and evaluations."""
+    # Count each kind of contribution in one pass over a union, avoiding a join fan-out
+    contributions = db.union_all(
+        db.select(
+            Prompt.revision_author_id.label('user_id'),
+            db.literal(1).label('prompts_ranked'),
+            db.literal(0).label('evaluations_performed')
+        ).where(Prompt.revision_author_id != None, Prompt.is_revision == True),
+        db.select(
+            Evaluation.user_id,
+            db.literal(0),
+            db.literal(1)
+        )
+    ).subquery()
+    prompts_ranked = db.func.sum(contributions.c.prompts_ranked)
+    evaluations_performed = db.func.sum(contributions.c.evaluations_performed)
+    scores = db.select(
+        contributions.c.user_id,
+        prompts_ranked,
+        evaluations_performed,
+        prompts_ranked + evaluations_performed,
+        db.func.now()
+    ).group_by(contributions.c.user_id)
+
+    db.session.execute(db.delete(UserScore))
+    db.session.execute(db.insert(UserScore).from_select(
+        ['user_id', 'prompts_ranked', 'evaluations_performed', 'total_score', 'updated_at'], scores
+    ))
+    db.session.commit()
+
+    click.echo(f"Rebuilt scores for {UserScore.query.count()} users.")
+
+
+@click.command('generation-worker')
+@click.option('--concurrency', type=int, default=None, help='Maximum number of jobs running at once.')
+@click.option('--poll-interval', type=float, default=None, help='Seconds to wait between polls when idle.')
+@with_appcontext
+def generation_worker(concurrency, poll_interval):
+    """Run queued LLM generation jobs."""
+    app = current_app._get_current_object()
+    run_worker(
+        app,
+        concurrency=concurrency or app.config['GENERATION_WORKER_CONCURRENCY'],
+        poll_interval=poll_interval or app.config['GENERATION_WORKER_POLL_INTERVAL'],
+        lease_seconds=app.config['GENERATION_JOB_LEASE_SECONDS']
+    )
+
+
+@click.command('import-prompts')
+@click.argument('source', type=click.File('r', encoding='utf-8'))
+@click.option('--format', 'file_format', type=click.Choice(['jsonl', 'csv']), default=None,
+              help='Input format; guessed from the file extension if not given.')
+@click.option('--source-dataset', default=None, help='Dataset name for records that do not have their own.')
+@click.option('--batch-size', type=int, default=IMPORT_BATCH_SIZE, help='Records inserted per transaction.')
+@with_appcontext
+def import_prompts(source, file_format, source_dataset, batch_size):
+    """Bulk import prompts and references from a JSONL or CSV file ('-' for stdin)."""
+    file_format = file_format or ('csv' if source.name.endswith('.csv') else 'jsonl')
+
+    def report(imported, skipped, seconds):
+        click.echo(f"Imported {imported} prompts, skipped {skipped} ({imported / seconds:,.0f} prompts/s)", err=True)
+
+    result = import_prompt_records(read_records(source, file_format), source_dataset, batch_size, report)
+    click.echo(f"Done: imported {result['imported']} prompts and skipped {result['skipped']} "
+               f"in {result['seconds']:.1f} s.")
+    if result['orphaned']:
+        click.echo(f"{result['orphaned']} records were not imported because their parent was not found.", err=True)
+
+
+@click.command('export')
+@click.option('--output', '-o', type=click.File('w', encoding='utf-8'), default='-',
+              help='File to write JSON Lines to (default: stdout).')
+@click.option('--language', default=None, help='Only export conversations started in this language.')
+@click.option('--batch-size', type=int, default=EXPORT_BATCH_SIZE, help='Conversation trees loaded per query.')
+@with_appcontext
+def export(output, language, batch_size):
+    """Stream every conversation tree with its evaluations and rankings as JSON Lines."""
+    count = 0
+    for line in iter_jsonl(iter_conversation_trees(language, batch_size)):
+        output.write(line)
+        count += 1
+    click.echo(f"Exported {count} conversations.", err=True)
+
+
+@click.command('export-increment')
+@click.option('--consumer', required=True, help='Name of the pipeline reading the export; each keeps its own watermark.')
+@click.option('--output-dir', required=True, type=click.Path(file_okay=False), help='Directory to write new shards to.')
+@click.option('--shard-size', type=int, default=100000, help='Maximum records per shard.')
+@with_appcontext
+def export_increment(consumer, output_dir, shard_size):
+    """Write prompts, evaluations and completed rankings added since this consumer's last export."""
+    shards = export_increment_shards(consumer, output_dir, shard_size, current_app.config['EXPORT_SETTLE_SECONDS'])
+    for stream, paths in shards.items():
+        click.echo(f"{stream}: {len(paths)} new shards")
+        for path in paths:
+            click.echo(f"  {path}")
+
+
+@click.command('ranking-scores')
+@click.option('--by', type=click.Choice(list(SCORE_KEYS)), default='postfix', help='Score responses or postfixes.')
+@click.option('--limit', type=int, default=20, help='Number of rows to show.')
+@with_appcontext
+def ranking_scores(by, limit):
+    """Show Bradley-Terry ratings fitted to the completed ranking tasks."""
+    scores = get_ranking_scores(by)
+    click.echo(f"{scores.tasks} ranked tasks, {len(scores.players)} scored")
+    rows = scores.ratings()[:limit]
+    if by == 'response':
+        # How often each response was ranked first, read from ix_ranking_task_item_prompt_id_rank
+        win_rates = RankingTaskItem.win_rates([row['player'] for row in rows])
+        click.echo(f"{'rating':>8} {'comparisons':>12} {'won':>6}  {by}")
+        for row in rows:
+            click.echo(f"{row['rating']:>8.0f} {row['comparisons']:>12} {win_rates.get(row['player'], 0.0):>6.0%}  {row['player']}")
+        return
+    click.echo(f"{'rating':>8} {'comparisons':>12}  {by}")
+    for row in rows:
+        player = row['player'] if row['player'] != '' else '(none)'
+        click.echo(f"{row['rating']:>8.0f} {row['comparisons']:>12}  {str(player)[:100]}")
+
+
+@click.command('llm-cache-stats')
+@with_appcontext
+def llm_cache_stats():
+    """Show how often the LLM response cache answered a request."""
+    cache = get_llm_cache()
+    if cache is None:
+        click.echo("The LLM cache is off; set LLM_CACHE_BACKEND to turn it on.")
+        return
+    stats = cache.stats()
+    click.echo(f"{stats['backend']}: {stats['hits']} hits, {stats['misses']} misses "
+               f"({stats['hit_rate']:.1%} hit rate), {stats['entries']} entries")
+    if not isinstance(cache, SQLiteCache):
+        click.echo("Counts of the memory backend only cover this process; the app and worker log theirs.")
+
+
+@click.command('render-markdown')
+@click.option('--all', 'rerender', is_flag=True, help='Render every prompt again, not only those without HTML.')
+@click.option('--batch-size', type=int, default=1000, help='Prompts rendered per transaction.')
+@with_appcontext
+def render_markdown(rerender, batch_size):
+    """Store the rendered HTML of prompts saved before it was kept, e.g. imported ones."""
+    update = db.update(Prompt.__table__).where(Prompt.__table__.c.id == db.bindparam('b_id')).values(
+        prompt_html=db.bindparam('b_html')
+    )
+    last_id = rendered = 0
+    while True:
+        query = db.select(Prompt.id, Prompt.prompt_text).where(Prompt.id > last_id, Prompt.prompt_text != None)
+        if not rerender:
+            query = query.where(Prompt.prompt_html == None)
+        rows = db.session.execute(query.order_by(Prompt.id).limit(batch_size)).all()
+        if not rows:
+            break
+        db.session.execute(update, [{'b_id': prompt_id, 'b_html': markdown.markdown(text)} for prompt_id, text in rows])
+        db.session.commit()
+        last_id = rows[-1].id
+        rendered += len(rows)
+
+    click.echo(f"Rendered {rendered} prompts.")
+
+
+def register(app):
+    app.cli.add_command(rebuild_evaluation_counts)
+    app.cli.add_command(rebuild_user_scores)
+    app.cli.add_command(generation_worker)
+    app.cli.add_command(import_prompts)
+    app.cli.add_command(export)
+    app.cli.add_command(export_increment)
+    app.cli.add_command(ranking_scores)
+    app.cli.add_command(llm_cache_stats)
+    app.cli.add_command(render_markdown)
@@ -0,0 +1,179 @@
+import logging
+import os
+import socket
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from datetime import datetime, timedelta
+from sqlalchemy.exc import IntegrityError
+from app import db
+from app.models import GenerationJob
+
+# Maps GenerationJob.job_type to a function taking (prompt_id, app)
+JOB_HANDLERS = {}
+
+def job_handler(job_type):
+    """Register a function as the handler for a job type."""
+    def decorator(func):
+        JOB_HANDLERS[job_type] = func
+        return func
+    return decorator
+
+def _active_job(job_type, prompt_id):
+    return GenerationJob.query.filter(
+        GenerationJob.job_type == job_type,
+        GenerationJob.prompt_id == prompt_id,
+        GenerationJob.status.in_(('pending', 'running'))
+    ).first()
+
+def enqueue_job(job_type, prompt_id):
+    """
+    Queue a job for the generation worker and commit it.
+
+    If the same job is already pending or running, that job is returned instead of queueing
+    another, e.g. when a retry is requested while the first attempt is still in progress.
+    """
+    if job_type not in JOB_HANDLERS:
+        raise ValueError(f"Unknown job type: {job_type}")
+    job = _active_job(job_type, prompt_id)
+    if job is not None:
+        return job
+    job = GenerationJob(job_type=job_type, prompt_id=prompt_id)
+    db.session.add(job)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Queued by a concurrent request between the check and the insert
+        db.session.rollback()
+        job = _active_job(job_type, prompt_id)
+    return job
+
+def _claimable(now):
+    return db.or_(
+        (GenerationJob.status == 'pending') & (GenerationJob.available_at <= now),
+        # Jobs whose worker died before finishing
+        (GenerationJob.status == 'running') & (GenerationJob.lease_expires_at < now)
+    )
+
+def claim_jobs(worker_id, limit, lease_seconds):
+    """
+    Lease up to `limit` jobs to a worker.
+
+    On PostgreSQL candidates are locked with FOR UPDATE SKIP LOCKED so concurrent workers
+    never wait on each other. SQLite ignores the lock clause, so each claim is a conditional
+    UPDATE that only succeeds if no other worker got to the job first.
+
+    Returns:
+    List[Tuple[int, str, int]]: (job id, job type, prompt id) for each claimed job.
+    """
+    now = datetime.utcnow()
+
+    # Give up on jobs whose lease expired on their last attempt
+    db.session.execute(
+        db.update(GenerationJob).where(
+            GenerationJob.status == 'running',
+            GenerationJob.lease_expires_at < now,
+            GenerationJob.attempts >= GenerationJob.max_attempts
+        ).values(status='failed', last_error='Lease expired', finished_at=now, lease_expires_at=None)
+    )
+
+    candidates = db.session.execute(
+        db.select(GenerationJob.id, GenerationJob.job_type, GenerationJob.prompt_id)
+        .where(_claimable(now))
+        .order_by(GenerationJob.id)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    ).all()
+
+    claimed = []
+    for job_id, job_type, prompt_id in candidates:
+        result = db.session.execute(
+            db.update(GenerationJob).where(GenerationJob.id == job_id, _claimable(now)).values(
+                status='running',
+                attempts=GenerationJob.attempts + 1,
+                locked_by=worker_id,
+                lease_expires_at=now + timedelta(seconds=lease_seconds),
+                started_at=now
+            )
+        )
+        if result.rowcount:
+            claimed.append((job_id, job_type, prompt_id))
+    db.session.commit()
+    return claimed
+
+def renew_leases(job_ids, worker_id, lease_seconds):
+    """Extend the leases a worker still holds, so long running jobs are not claimed again."""
+    if not job_ids:
+        return
+    db.session.execute(
+        db.update(GenerationJob).where(
+            GenerationJob.id.in_(job_ids),
+            GenerationJob.locked_by == worker_id,
+            GenerationJob.status == 'running'
+        ).values(lease_expires_at=datetime.utcnow() + timedelta(seconds=lease_seconds))
+    )
+    db.session.commit()
+
+def finish_job(job_id, worker_id, error=None):
+    """Record the outcome of a job, scheduling a retry with backoff if attempts remain."""
+    job = db.session.get(GenerationJob, job_id)
+    if not job or job.locked_by != worker_id or job.status != 'running':
+        # The lease expired and another worker has taken over
+        return
+
+    now = datetime.utcnow()
+    job.locked_by = None
+    job.lease_expires_at = None
+    if error is None:
+        job.status = 'done'
+        job.finished_at = now
+    elif job.attempts < job.max_attempts:
+        job.status = 'pending'
+        job.available_at = now + timedelta(seconds=30 * 2 ** (job.attempts - 1))
+        job.last_error = error
+    else:
+        job.status = 'failed'
+        job.finished_at = now
+        job.last_error = error
+    db.session.commit()
+
+def run_job(app, job_id, job_type, prompt_id, worker_id):
+    logging.info(f"Worker {worker_id} running {job_type} job {job_id} for prompt {prompt_id}")
+    error = None
+    try:
+        JOB_HANDLERS[job_type](prompt_id, app)
+    except Exception as e:
+        logging.exception(f"Job {job_id} failed: {str(e)}")
+        error = str(e) or e.__class__.__name__
+    with app.app_context():
+        finish_job(job_id, worker_id, error)
+
+def run_worker(app, concurrency, poll_interval, lease_seconds):
+    """Claim and run generation jobs forever, with at most `concurrency` running at once."""
+    worker_id = f"{socket.gethostname()}:{os.getpid()}"
+    logging.info(f"Generation worker {worker_id} started with concurrency {concurrency}")
+
+    # Job id of each running future; their leases are renewed once a third of the lease has passed
+    running = {}
+    renewed_at = time.monotonic()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        while True:
+            running = {future: job_id for future, job_id in running.items() if not future.done()}
+            if running and time.monotonic() - renewed_at >= lease_seconds / 3:
+                with app.app_context():
+                    renew_leases(list(running.values()), worker_id, lease_seconds)
+                renewed_at = time.monotonic()
+
+            free_slots = concurrency - len(running)
+            jobs = []
+            if free_slots:
+                with app.app_context():
+                    jobs = claim_jobs(worker_id, free_slots, lease_seconds)
+                for job_id, job_type, prompt_id in jobs:
+                    running[executor.submit(run_job, app, job_id, job_type, prompt_id, worker_id)] = job_id
+
+            if not jobs or len(running) >= concurrency:
+                # Poll again after a while, or as soon as a slot frees up
+                if running:
+                    wait(running, timeout=poll_interval, return_when=FIRST_COMPLETED)
+                else:
+                    time.sleep(poll_interval)
@@ -1,9 +1,11 @@
-from flask import render_template, redirect, url_for, flash, request
+from flask import render_template, redirect, url_for, flash, request, abort, Response, stream_with_context
 from flask_login import current_user, login_required
 from app import db
 from app.main import bp
-from app.models import User, Prompt, Evaluation
+from app.models import User, Prompt, UserScore
 from app.main.forms import EditProfileForm
+from app.utils.export import iter_conversation_trees, iter_jsonl
+from app.utils.agreement import get_agreement_stats
 from datetime import datetime, timedelta
 from sqlalchemy import func, desc
 
@@ -12,29 +14,16 @@ from sqlalchemy import func, desc
 def index():
     if current_user.is_authenticated:
         # Get the user's statistics
-        prompts_ranked = db.session.query(func.count(Prompt.id)).filter(
-            Prompt.revision_author_id == current_user.id,
-            Prompt.is_revision == True
-        ).scalar()
-
-        evaluations_performed = db.session.query(func.count(Evaluation.id)).filter(
-            Evaluation.user_id == current_user.id
-        ).scalar()
+        score = UserScore.query.get(current_user.id)
+        prompts_ranked = score.prompts_ranked if score else 0
+        evaluations_performed = score.evaluations_performed if score else 0
 
         conversations_count = db.session.query(func.count(Prompt.id)).filter(
             Prompt.revision_author_id == current_user.id,
             Prompt.parent_id != None
         ).scalar()
 
-        # Calculate user rank (this is a simple implementation and might need optimization for large user bases)
-        user_scores = db.session.query(
-            User.id,
-            (func.count(Prompt.id) + func.count(Evaluation.id)).label('score')
-        ).outerjoin(Prompt, (User.id == Prompt.revision_author_id) & (Prompt.is_revision == True)
-        ).outerjoin(Evaluation, User.id == Evaluation.user_id
-        ).group_by(User.id).order_by(desc('score')).all()
-
-        user_rank = next((i for i, (user_id, _) in enumerate(user_scores, 1) if user_id == current_user.id), None)
+        user_rank = UserScore.rank_of(current_user.id)
 
         return render_template('main/index_authenticated.html', 
                                title='Dashboard',
@@ -50,9 +39,11 @@ def index():
 def profile():
     form = EditProfileForm(current_user.username)
     if form.validate_on_submit():
-        current_user.username = form.username.data
-        current_user.preferred_language = form.preferred_language.data
-        current_user.interface_language = form.interface_language.data
+        # current_user is a read-only snapshot; saving the row also drops the cached copies
+        user = db.session.get(User, current_user.id)
+        user.username = form.username.data
+        user.preferred_language = form.preferred_language.data
+        user.interface_language = form.interface_language.data
         db.session.commit()
         flash('Your changes have been saved.', 'success')
         return redirect(url_for('main.profile'))
@@ -62,29 +53,53 @@ def profile():
         form.interface_language.data = current_user.interface_language
     return render_template('main/profile.html', title='Profile', form=form)
 
+LEADERBOARD_SIZE = 100
+
 @bp.route('/leaderboard')
 def leaderboard():
-    # Get user statistics from the database
-    user_stats = db.session.query(
-        User,
-        func.count(Prompt.id).label('prompts_evaluated'),
-        func.count(Evaluation.id).label('evaluations_performed'),
-        (func.count(Prompt.id) + func.count(Evaluation.id)).label('total_score')
-    ).outerjoin(
-        Prompt, (User.id == Prompt.revision_author_id) & (Prompt.is_revision == True)
-    ).outerjoin(
-        Evaluation, User.id == Evaluation.user_id
-    ).group_by(User.id).order_by(desc('total_score')).all()
+    # Get the top users from the maintained score table
+    user_stats = db.session.query(User, UserScore).join(
+        UserScore, User.id == UserScore.user_id
+    ).order_by(desc(UserScore.total_score)).limit(LEADERBOARD_SIZE).all()
 
     # Format the data for the template
     leaderboard_data = [{
         'username': user.username,
         'joined_date': user.created_at.strftime('%Y-%m-%d'),
-        'prompts_evaluated': prompts_evaluated,
-        'responses_assessed': evaluations_performed,
-        'total_score': total_score
-    } for user, prompts_evaluated, evaluations_performed, total_score in user_stats]
+        'prompts_evaluated': score.prompts_ranked,
+        'responses_assessed': score.evaluations_performed,
+        'total_score': score.total_score
+    } for user, score in user_stats]
 
     return render_template('main/leaderboard.html', 
                          title='Leaderboard', 
                          leaderboard=leaderboard_data)
+
+@bp.route('/export/conversations.jsonl')
+@login_required
+def export_conversations():
+    if current_user.role != 'admin':
+        abort(403)
+
+    lines = iter_jsonl(iter_conversation_trees(request.args.get('language')))
+    return Response(stream_with_context(lines), mimetype='application/x-ndjson',
+                    headers={'Content-Disposition': 'attachment; filename=conversations.jsonl'})
+
+@bp.route('/agreement')
+@login_required
+def agreement():
+    if current_user.role != 'admin':
+        abort(403)
+
+    # Served from the per-process statistics, which only read evaluations added since the last visit
+    stats = get_agreement_stats()
+    usernames = dict(db.session.query(User.id, User.username).filter(
+        User.id.in_({row['user_id'] for row in stats.annotators})
+    )) if stats.annotators else {}
+    annotators = sorted(stats.annotators, key=lambda row: row['agreement'])
+
+    return render_template('main/agreement.html',
+                           title='Annotator Agreement',
+                           summaries=stats.summaries,
+                           annotators=annotators,
+                           usernames=usernames)
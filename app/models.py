@@ -1,9 +1,15 @@
+import logging
+import time
+from flask import current_app, has_request_context, session
 from app import db, login_manager
+from app.utils.markdown_cache import render_markdown
+from app.utils.user_cache import SNAPSHOT_FIELDS, UserSnapshot, get_user_cache
 from werkzeug.security import generate_password_hash, check_password_hash
 from flask_login import UserMixin
 from datetime import datetime
-from sqlalchemy.ext.mutable import MutableList
-from sqlalchemy import PickleType
+from sqlalchemy import event
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm.attributes import set_committed_value
 
 class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -17,7 +23,7 @@ class User(UserMixin, db.Model):
     last_login = db.Column(db.DateTime)
     
     rank_revise_tasks = db.relationship('RankReviseTask', backref='user_rank_revise', lazy='dynamic')
-    ranking_tasks = db.relationship('RankingTask', backref='user_ranking', lazy='dynamic')
+    ranking_tasks = db.relationship('RankingTask', backref='user_ranking', lazy='dynamic', foreign_keys='RankingTask.user_id')
     evaluations = db.relationship('Evaluation', back_populates='user', overlaps="evaluation_tasks")
     evaluation_tasks = db.relationship('EvaluationTask', secondary='evaluation', back_populates='users', overlaps="evaluations")
 
@@ -27,9 +33,89 @@ class User(UserMixin, db.Model):
     def check_password(self, password):
         return check_password_hash(self.password_hash, password)
 
+class UserScore(db.Model):
+    """Per-user leaderboard counters, updated whenever a revision or evaluation is written."""
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    prompts_ranked = db.Column(db.Integer, nullable=False, default=0)
+    evaluations_performed = db.Column(db.Integer, nullable=False, default=0)
+    total_score = db.Column(db.Integer, nullable=False, default=0, index=True)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    user = db.relationship('User', backref=db.backref('score', uselist=False))
+
+    @classmethod
+    def record(cls, user_id, prompts_ranked=0, evaluations_performed=0):
+        """Add to a user's counters in the current transaction, creating the row on first contribution."""
+        increment = db.update(cls).where(cls.user_id == user_id).values(
+            prompts_ranked=cls.prompts_ranked + prompts_ranked,
+            evaluations_performed=cls.evaluations_performed + evaluations_performed,
+            total_score=cls.total_score + prompts_ranked + evaluations_performed,
+            updated_at=datetime.utcnow()
+        ).execution_options(synchronize_session=False)
+        if db.session.execute(increment).rowcount:
+            return
+        try:
+            with db.session.begin_nested():
+                db.session.add(cls(
+                    user_id=user_id,
+                    prompts_ranked=prompts_ranked,
+                    evaluations_performed=evaluations_performed,
+                    total_score=prompts_ranked + evaluations_performed
+                ))
+        except IntegrityError:
+            # A concurrent first contribution created the row after our UPDATE; add to it instead
+            db.session.execute(increment)
+
+    @classmethod
+    def rank_of(cls, user_id):
+        """1-based leaderboard position of a user; users without a score share the last place."""
+        score = db.func.coalesce(
+            db.select(cls.total_score).where(cls.user_id == user_id).scalar_subquery(), 0
+        )
+        return db.session.query(db.func.count()).select_from(cls).filter(cls.total_score > score).scalar() + 1
+
+# Key of the user snapshot kept in the signed session cookie (USER_SESSION_SNAPSHOT)
+SESSION_SNAPSHOT_KEY = '_user_snapshot'
+
 @login_manager.user_loader
 def load_user(id):
-    return User.query.get(int(id))
+    """
+    Give Flask-Login a read-only UserSnapshot, from the session or the per-process cache when they are
+    fresh enough, so most requests do not query the user table.
+    """
+    user_id = int(id)
+    cache = get_user_cache()
+    use_session = current_app.config['USER_SESSION_SNAPSHOT']
+    if use_session:
+        # The session cookie is signed, so the snapshot cannot be edited by the client
+        stored = session.get(SESSION_SNAPSHOT_KEY)
+        if stored and stored.get('id') == user_id:
+            loaded_at = stored.get('loaded_at', 0)
+            if (time.time() - loaded_at <= current_app.config['USER_CACHE_TTL_SECONDS']
+                    and not cache.changed_since(user_id, loaded_at)):
+                return UserSnapshot(**{field: stored.get(field) for field in SNAPSHOT_FIELDS})
+
+    snapshot = cache.get(user_id)
+    if snapshot is None:
+        user = db.session.get(User, user_id)
+        if user is None:
+            return None
+        snapshot = UserSnapshot.from_user(user)
+        cache.set(snapshot)
+    if use_session:
+        session[SESSION_SNAPSHOT_KEY] = dict(snapshot.to_dict(), loaded_at=time.time())
+    return snapshot
+
+def forget_user(user_id):
+    """Drop cached copies of a user so the next request sees their current row."""
+    get_user_cache().invalidate(user_id)
+    if has_request_context() and (session.get(SESSION_SNAPSHOT_KEY) or {}).get('id') == user_id:
+        session.pop(SESSION_SNAPSHOT_KEY)
+
+@event.listens_for(User, 'after_update')
+def forget_updated_user(mapper, connection, target):
+    """Catches profile edits and role changes made through the ORM in this process."""
+    forget_user(target.id)
 
 # Association table for prompts and references
 prompt_references = db.Table('prompt_references',
@@ -42,6 +128,7 @@ class Prompt(db.Model):
     parent_id = db.Column(db.Integer, db.ForeignKey('prompt.id'))
     language = db.Column(db.String(50))
     prompt_text = db.Column(db.Text)
+    prompt_html = db.Column(db.Text)  # prompt_text rendered as Markdown, kept in step by render_prompt_html
     is_synthetic = db.Column(db.Boolean, default=False)
     source_id = db.Column(db.String(64), index=True)
     model_used = db.Column(db.String(64))
@@ -54,8 +141,23 @@ class Prompt(db.Model):
     reference_prompt_prefix = db.Column(db.Text)
     flagged_for_conversation = db.Column(db.Boolean, default=False)
     postfix = db.Column(db.Text)
+    # Position in the conversation tree, maintained on insert (see set_prompt_tree_position)
+    root_id = db.Column(db.Integer, db.ForeignKey('prompt.id'), index=True)
+    path = db.Column(db.Text)  # e.g. "0000000001/0000000004/", 11 characters per level
+    # Waiting for evaluation tasks that are only created when first evaluated (VIRTUAL_EVALUATION_TASKS)
+    evaluation_pending = db.Column(db.Boolean, nullable=False, default=False, server_default=db.false())
     evaluation_tasks = db.relationship('EvaluationTask', back_populates='prompt')
 
+    __table_args__ = (
+        db.Index('ix_prompt_evaluation_pending_language_id', 'evaluation_pending', 'language', 'id'),
+        db.Index('ix_prompt_language_is_synthetic_id', 'language', 'is_synthetic', 'id'),
+        db.Index('ix_prompt_language_parent_id_id', 'language', 'parent_id', 'id'),
+        db.Index('ix_prompt_parent_id_is_synthetic', 'parent_id', 'is_synthetic'),
+        # text_pattern_ops lets PostgreSQL use the index for subtree_query's prefix LIKE under any collation
+        db.Index('ix_prompt_path', 'path', postgresql_ops={'path': 'text_pattern_ops'}),
+        db.Index('ix_prompt_revision_author_id_parent_id', 'revision_author_id', 'parent_id'),
+    )
+
     parent = db.relationship('Prompt', 
                            remote_side=[id],
                            backref=db.backref('children', lazy='dynamic'),
@@ -64,6 +166,10 @@ class Prompt(db.Model):
                                    remote_side=[id],
                                    backref=db.backref('revisions', lazy='dynamic'),
                                    foreign_keys=[revised_prompt_id])
+    root = db.relationship('Prompt',
+                         remote_side=[id],
+                         foreign_keys=[root_id],
+                         viewonly=True)
     references = db.relationship('Reference', secondary=prompt_references, 
                                backref=db.backref('prompts', lazy='dynamic'))
 
@@ -72,28 +178,135 @@ class Prompt(db.Model):
                                     foreign_keys=[revision_author_id],
                                     backref=db.backref('authored_prompts', lazy='dynamic'))
 
+    @property
+    def html(self):
+        """The prompt text as HTML, rendered when it was saved or, for rows not backfilled yet, now."""
+        return self.prompt_html if self.prompt_html is not None else render_markdown(self.prompt_text)
+
+    def subtree_query(self):
+        """Query for every prompt below this one in the conversation tree, at any depth."""
+        return Prompt.query.filter(
+            Prompt.root_id == self.root_id,
+            Prompt.path.startswith(self.path),
+            Prompt.id != self.id
+        )
+
+@event.listens_for(Prompt.prompt_text, 'set')
+def render_prompt_html(target, value, oldvalue, initiator):
+    """Render the Markdown once when the text is written instead of on every page view."""
+    target.prompt_html = render_markdown(value) if value is not None else None
+
+def tree_path_segment(prompt_id):
+    return f"{prompt_id:010d}/"
+
+@event.listens_for(Prompt, 'after_insert')
+def set_prompt_tree_position(mapper, connection, target):
+    """Fill in root_id and path for a newly inserted prompt from its parent."""
+    root_id, path = target.id, tree_path_segment(target.id)
+    if target.parent_id is not None:
+        parent = connection.execute(
+            db.select(Prompt.root_id, Prompt.path).where(Prompt.id == target.parent_id)
+        ).first()
+        if parent and parent.path:
+            root_id, path = parent.root_id, parent.path + path
+        else:
+            # Only happens in a corrupt tree; the prompt will be missing from its parent's subtree_query
+            logging.warning(f"Parent {target.parent_id} of prompt {target.id} has no tree path; "
+                            f"storing the prompt as the root of its own tree")
+
+    connection.execute(
+        Prompt.__table__.update().where(Prompt.id == target.id).values(root_id=root_id, path=path)
+    )
+    set_committed_value(target, 'root_id', root_id)
+    set_committed_value(target, 'path', path)
+
 class Reference(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     reference_link = db.Column(db.String(256))
     reference_text = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+# Evaluation task types by the kind of answer they take (see tasks/evaluate.html)
+BINARY_TASK_TYPES = ['pii', 'spam', 'appropriate', 'hate_speech', 'sexual_content', 'child_friendly', 'bias', 'sarcasm']
+SCALE_TASK_TYPES = ['quality_score', 'seriousness', 'creativity', 'politeness', 'safety', 'friendliness', 'difficulty']
+TAG_TASK_TYPES = ['topic_tags']
+EVALUATION_TASK_TYPES = BINARY_TASK_TYPES + SCALE_TASK_TYPES + TAG_TASK_TYPES
+
+def parse_tags(value):
+    """Split a comma-separated topic_tags answer into normalized tags."""
+    return sorted({tag.strip().lower()[:64] for tag in (value or '').split(',') if tag.strip()})
+
 class Evaluation(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     task_id = db.Column(db.Integer, db.ForeignKey('evaluation_task.id'), nullable=False)
-    value = db.Column(db.String(255))
+    value = db.Column(db.String(255))  # The answer as submitted
+    # Typed copies of the answer, filled in by set_value according to the task type
+    score = db.Column(db.SmallInteger)  # 1-5, for SCALE_TASK_TYPES
+    flag = db.Column(db.Boolean)  # For BINARY_TASK_TYPES
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        db.Index('ix_evaluation_task_id_user_id', 'task_id', 'user_id'),
+        db.Index('ix_evaluation_user_id_task_id', 'user_id', 'task_id'),
+    )
+
     user = db.relationship('User', back_populates='evaluations', overlaps="evaluation_tasks")
     task = db.relationship('EvaluationTask', back_populates='evaluations', overlaps="users,evaluation_tasks")
+    tags = db.relationship('EvaluationTag', backref='evaluation', cascade='all, delete-orphan')
+
+    def set_value(self, task_type, value):
+        """Store an answer along with its typed form; raises ValueError if it does not fit the task type."""
+        value = (value or '').strip()
+        if task_type in BINARY_TASK_TYPES:
+            if value not in ('0', '1'):
+                raise ValueError(f"Expected 0 or 1 for {task_type}, got {value!r}")
+            self.flag = value == '1'
+        elif task_type in SCALE_TASK_TYPES:
+            if value not in ('1', '2', '3', '4', '5'):
+                raise ValueError(f"Expected a score from 1 to 5 for {task_type}, got {value!r}")
+            self.score = int(value)
+        elif task_type in TAG_TASK_TYPES:
+            tags = parse_tags(value)
+            if not tags:
+                raise ValueError("Expected at least one tag")
+            self.tags = [EvaluationTag(tag=tag) for tag in tags]
+        self.value = value
+
+    @classmethod
+    def average_scores(cls, task_type):
+        """Mean score of a 1-5 task type per language."""
+        rows = db.session.query(EvaluationTask.language, db.func.avg(cls.score)).join(
+            cls, cls.task_id == EvaluationTask.id
+        ).filter(EvaluationTask.task_type == task_type, cls.score.isnot(None)).group_by(EvaluationTask.language)
+        return {language: float(average) for language, average in rows}
+
+class EvaluationTag(db.Model):
+    """One tag of a topic_tags evaluation."""
+    evaluation_id = db.Column(db.Integer, db.ForeignKey('evaluation.id'), primary_key=True)
+    tag = db.Column(db.String(64), primary_key=True, index=True)
+
+    @classmethod
+    def tagged_prompts(cls, tag):
+        """Query for the prompts that at least one annotator gave this tag."""
+        prompt_ids = db.select(EvaluationTask.prompt_id).join(
+            Evaluation, Evaluation.task_id == EvaluationTask.id
+        ).join(cls, cls.evaluation_id == Evaluation.id).where(cls.tag == tag.strip().lower())
+        return Prompt.query.filter(Prompt.id.in_(prompt_ids))
 
 class EvaluationTask(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    prompt_id = db.Column(db.Integer, db.ForeignKey('prompt.id'), nullable=False)
+    prompt_id = db.Column(db.Integer, db.ForeignKey('prompt.id'), nullable=False, index=True)
     task_type = db.Column(db.String(50), nullable=False)  # e.g., 'pii', 'quality_score', etc.
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     language = db.Column(db.String(10), nullable=False)
+    # Number of Evaluation rows for this task, kept in step by submit_evaluation
+    evaluation_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+
+    __table_args__ = (
+        db.Index('ix_evaluation_task_language_task_type_evaluation_count', 'language', 'task_type', 'evaluation_count'),
+        db.Index('ix_evaluation_task_prompt_id_task_type', 'prompt_id', 'task_type', unique=True),
+    )
 
     prompt = db.relationship('Prompt', back_populates='evaluation_tasks')
     evaluations = db.relationship('Evaluation', back_populates='task', overlaps="users")
@@ -148,24 +361,58 @@ class RankReviseTask(db.Model):
 class RankingTask(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
-    parent_prompt_id = db.Column(db.Integer, db.ForeignKey('prompt.id'), nullable=False)
-    prompt_ids = db.Column(MutableList.as_mutable(PickleType), default=[])
-    ranking = db.Column(MutableList.as_mutable(PickleType), default=[])
+    parent_prompt_id = db.Column(db.Integer, db.ForeignKey('prompt.id'), nullable=False, index=True)
     revised_prompt_id = db.Column(db.Integer, db.ForeignKey('prompt.id'))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     completed_at = db.Column(db.DateTime)
+    # Annotator currently working on the task; the task goes back to the pool when the lease expires
+    assigned_to = db.Column(db.Integer, db.ForeignKey('user.id'))
+    lease_expires_at = db.Column(db.DateTime)
+
+    __table_args__ = (
+        db.Index('ix_ranking_task_completed_at_id', 'completed_at', 'id'),
+        db.Index('ix_ranking_task_completed_at_lease_expires_at', 'completed_at', 'lease_expires_at'),
+        db.Index('ix_ranking_task_user_id_parent_prompt_id', 'user_id', 'parent_prompt_id'),
+    )
 
     # Remove this line or change it to match the backref in User model
     # user = db.relationship('User', backref='ranking_tasks')
     
     parent_prompt = db.relationship('Prompt', foreign_keys=[parent_prompt_id])
     revised_prompt = db.relationship('Prompt', foreign_keys=[revised_prompt_id])
+    items = db.relationship('RankingTaskItem', back_populates='task', order_by='RankingTaskItem.position',
+                            cascade='all, delete-orphan')
 
     def __init__(self, parent_prompt_id, prompt_ids, *args, **kwargs):
         super(RankingTask, self).__init__(*args, **kwargs)
         self.parent_prompt_id = parent_prompt_id
         self.prompt_ids = prompt_ids or []
 
+    @property
+    def prompt_ids(self):
+        """Ids of the candidate prompts, in the order they are shown."""
+        return [item.prompt_id for item in self.items]
+
+    @prompt_ids.setter
+    def prompt_ids(self, prompt_ids):
+        self.items = [RankingTaskItem(prompt_id=prompt_id, position=position)
+                      for position, prompt_id in enumerate(prompt_ids)]
+
+    @property
+    def ranking(self):
+        """Ids of the candidate prompts from best to worst, or an empty list before the task is ranked."""
+        ranked = [item for item in self.items if item.rank is not None]
+        return [item.prompt_id for item in sorted(ranked, key=lambda item: item.rank)]
+
+    @ranking.setter
+    def ranking(self, ranking):
+        ranking = [int(prompt_id) for prompt_id in ranking]
+        if sorted(ranking) != sorted(self.prompt_ids):
+            raise ValueError("A ranking must order every prompt of the task exactly once")
+        ranks = {prompt_id: rank for rank, prompt_id in enumerate(ranking, start=1)}
+        for item in self.items:
+            item.rank = ranks[item.prompt_id]
+
     def set_ranking(self, ranking):
         self.ranking = ranking
 
@@ -175,3 +422,66 @@ class RankingTask(db.Model):
     def complete(self, user_id):
         self.user_id = user_id
         self.completed_at = datetime.utcnow()
+
+    def is_leased_to_other(self, user_id, now=None):
+        """Whether another annotator holds an unexpired lease on this task."""
+        now = now or datetime.utcnow()
+        return (self.assigned_to not in (None, user_id)
+                and self.lease_expires_at is not None and self.lease_expires_at > now)
+
+class RankingTaskItem(db.Model):
+    """A candidate prompt in a RankingTask and the place it was given, 1 being the best."""
+    task_id = db.Column(db.Integer, db.ForeignKey('ranking_task.id'), primary_key=True)
+    prompt_id = db.Column(db.Integer, db.ForeignKey('prompt.id'), primary_key=True)
+    position = db.Column(db.Integer, nullable=False)  # Order the candidates are shown in
+    rank = db.Column(db.Integer)  # None until the task is ranked
+
+    __table_args__ = (
+        db.Index('ix_ranking_task_item_prompt_id_rank', 'prompt_id', 'rank'),
+    )
+
+    task = db.relationship('RankingTask', back_populates='items')
+    prompt = db.relationship('Prompt')
+
+    @classmethod
+    def win_rates(cls, prompt_ids):
+        """Share of the completed rankings each prompt appears in where it was ranked first."""
+        rows = db.session.query(
+            cls.prompt_id, db.func.avg(db.case((cls.rank == 1, 1.0), else_=0.0))
+        ).filter(cls.prompt_id.in_(prompt_ids), cls.rank.isnot(None)).group_by(cls.prompt_id)
+        return {prompt_id: float(win_rate) for prompt_id, win_rate in rows}
+
+class GenerationJob(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    job_type = db.Column(db.String(50), nullable=False)  # a key of app.jobs.JOB_HANDLERS
+    prompt_id = db.Column(db.Integer, db.ForeignKey('prompt.id'), nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='pending')  # 'pending', 'running', 'done' or 'failed'
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=3)
+    available_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)  # Not claimed before this time
+    locked_by = db.Column(db.String(128))  # Worker holding the lease
+    lease_expires_at = db.Column(db.DateTime)
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+
+    __table_args__ = (
+        db.Index('ix_generation_job_status_available_at', 'status', 'available_at'),
+        # At most one queued or running job per prompt and type (see app.jobs.enqueue_job)
+        db.Index('ix_generation_job_active_job_type_prompt_id', 'job_type', 'prompt_id', unique=True,
+                 postgresql_where=db.text("status IN ('pending', 'running')"),
+                 sqlite_where=db.text("status IN ('pending', 'running')")),
+    )
+
+    prompt = db.relationship('Prompt', backref=db.backref('generation_jobs', lazy='dynamic'))
+
+class ExportWatermark(db.Model):
+    """How far an incremental export consumer has read each table (see app.utils.export.export_increment)."""
+    consumer = db.Column(db.String(64), primary_key=True)
+    last_prompt_id = db.Column(db.Integer, nullable=False, default=0)
+    last_evaluation_id = db.Column(db.Integer, nullable=False, default=0)
+    # Ranking tasks are exported once completed, in (completed_at, id) order
+    last_ranking_completed_at = db.Column(db.DateTime)
+    last_ranking_task_id = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -1,18 +1,24 @@
-from flask import render_template, redirect, url_for, flash, request, jsonify, current_app, session
+from flask import render_template, redirect, url_for, flash, request, jsonify, current_app, session, abort, Response, stream_with_context
 from flask_login import current_user, login_required
 from app import db
 from app.tasks import bp
-from app.models import Prompt, Evaluation, RankingTask, EvaluationTask, User
-from app.utils.llm_utils import generate_llm_response
+from app.models import Prompt, Evaluation, RankingTask, EvaluationTask, User, UserScore, EVALUATION_TASK_TYPES
+from app.utils.llm_utils import generate_llm_response, generate_llm_responses, stream_llm_response
+from app.utils.conversation_utils import get_conversation_history, render_conversation_history
+from app.utils.markdown_cache import remember_markdown
+from app.utils.sampling import sample_prompt
+from app.jobs import enqueue_job, job_handler
 import random
+import json
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.sql.expression import func, select
 from datetime import datetime, timedelta
 from markdown import markdown
 from flask_wtf import FlaskForm
 from wtforms import TextAreaField, HiddenField
 from wtforms.validators import DataRequired
-from threading import Thread
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from sqlalchemy.orm import selectinload
+from collections import defaultdict
 import logging
 
 class ConversationForm(FlaskForm):
@@ -37,6 +43,9 @@ PROMPT_POSTFIXES = [
     "Respond in the same language as the input above, but write it as a news article headline and brief summary.",
 ]
 
+# Evaluation tasks stop being handed out once they have this many evaluations
+MAX_EVALUATIONS_PER_TASK = 5
+
 class ExtendConversationForm(FlaskForm):
     user_prompt = TextAreaField('Your Response', validators=[DataRequired()])
 
@@ -54,7 +63,7 @@ def response_evaluation():
 @login_required
 def get_prompt():
     # Fetch a random prompt for evaluation
-    prompt = Prompt.query.order_by(db.func.random()).first()
+    prompt = sample_prompt()
     if not prompt:
         return jsonify({'error': 'No prompts available'}), 404
 
@@ -92,6 +101,7 @@ def submit_prompt_improvement():
     )
 
     db.session.add(new_prompt)
+    UserScore.record(current_user.id, prompts_ranked=1)
     db.session.commit()
 
     return jsonify({'status': 'success', 'new_prompt_id': new_prompt.id})
@@ -140,6 +150,10 @@ def extended_conversation(prompt_id):
     prompt = Prompt.query.get_or_404(prompt_id)
     if request.method == 'POST':
         user_prompt = request.form.get('user_prompt')
+        if not user_prompt:
+            flash('Please enter a prompt.', 'error')
+            return redirect(url_for('tasks.extended_conversation', prompt_id=prompt_id))
+
         new_prompt = Prompt(
             parent_id=prompt_id,
             prompt_text=user_prompt,
@@ -151,26 +165,77 @@ def extended_conversation(prompt_id):
         db.session.add(new_prompt)
         db.session.commit()
         
-        # Generate synthetic prompt using the entire conversation
-        conversation = get_conversation_history(new_prompt.id)
-        references = get_relevant_references(prompt_id)
-        synthetic_prompt = generate_llm_response(conversation, references)
-        
-        new_synthetic_prompt = Prompt(
-            parent_id=new_prompt.id,
-            prompt_text=synthetic_prompt,
-            language=current_user.preferred_language,
-            is_synthetic=True,
-            revision_author_type='model'
-        )
-        db.session.add(new_synthetic_prompt)
-        db.session.commit()
-        
-        flash('Your prompt and a synthetic prompt have been added to the conversation.')
-        return redirect(url_for('tasks.extended_conversation', prompt_id=new_synthetic_prompt.id))
+        # The page for the new prompt streams the synthetic reply as it is generated
+        return redirect(url_for('tasks.extended_conversation', prompt_id=new_prompt.id))
     
     conversation = get_conversation_history(prompt_id)
-    return render_template('tasks/extended_conversation.html', conversation=conversation, parent_id=prompt_id)
+    awaiting_reply = (
+        not prompt.is_synthetic and
+        prompt.revision_author_id == current_user.id and
+        not prompt.children.filter_by(is_synthetic=True).first()
+    )
+    return render_template('tasks/extended_conversation.html',
+                           title='Extended Conversation',
+                           conversation_history=conversation,
+                           parent_id=prompt_id,
+                           awaiting_reply=awaiting_reply)
+
+@bp.route('/extended_conversation/<int:prompt_id>/stream')
+@login_required
+def stream_extended_conversation(prompt_id):
+    """Server-Sent Events stream of the synthetic reply to a user prompt, saved once complete."""
+    prompt = Prompt.query.get_or_404(prompt_id)
+    if prompt.is_synthetic or prompt.revision_author_id != current_user.id:
+        abort(403)
+
+    existing_reply = prompt.children.filter_by(is_synthetic=True).first()
+    conversation = get_conversation_history(prompt.id)
+    references = get_relevant_references(prompt.parent_id) if prompt.parent_id else []
+    language = current_user.preferred_language
+
+    def events():
+        if existing_reply:
+            yield sse_event({'token': existing_reply.prompt_text})
+            yield sse_event({'prompt_id': existing_reply.id}, event='done')
+            return
+
+        chunks = []
+        try:
+            for chunk in stream_llm_response(conversation, references):
+                chunks.append(chunk)
+                yield sse_event({'token': chunk})
+        except Exception as e:
+            logging.exception(f"Error streaming reply for prompt {prompt_id}: {str(e)}")
+            yield sse_event({'message': 'Generating a reply failed. Please reload to try again.'}, event='error')
+            return
+
+        reply_text = ''.join(chunks).strip()
+        if not reply_text:
+            yield sse_event({'message': 'The model returned an empty reply. Please reload to try again.'}, event='error')
+            return
+
+        # Another tab may have streamed and saved a reply meanwhile; the parent row lock makes
+        # concurrent streams take turns on PostgreSQL, and the first saved reply wins
+        db.session.execute(select(Prompt.id).where(Prompt.id == prompt_id).with_for_update())
+        saved_reply = Prompt.query.filter_by(parent_id=prompt_id, is_synthetic=True).first()
+        if saved_reply is None:
+            saved_reply = Prompt(
+                parent_id=prompt_id,
+                prompt_text=reply_text,
+                language=language,
+                is_synthetic=True,
+                revision_author_type='model'
+            )
+            db.session.add(saved_reply)
+        db.session.commit()
+        yield sse_event({'prompt_id': saved_reply.id}, event='done')
+
+    return Response(stream_with_context(events()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+def sse_event(data, event=None):
+    message = f"event: {event}\n" if event else ""
+    return message + f"data: {json.dumps(data)}\n\n"
 
 @bp.route('/flag_for_conversation/<int:prompt_id>', methods=['POST'])
 @login_required
@@ -185,10 +250,13 @@ def flag_for_conversation(prompt_id):
 @login_required
 def rank_and_revise(task_id):
     task = RankingTask.query.get_or_404(task_id)
+    if task.completed_at or task.is_leased_to_other(current_user.id):
+        flash('This ranking task has been taken by someone else.', 'info')
+        return redirect(url_for('tasks.get_next_rank_and_revise_task'))
     prompts = Prompt.query.filter(Prompt.id.in_(task.prompt_ids)).all()
     
     # Get the conversation history
-    conversation_history = get_conversation_history(task.parent_prompt_id)
+    conversation_history = render_conversation_history(task.parent_prompt_id)
     
     return render_template('tasks/rank_and_revise.html', task=task, prompts=prompts, conversation_history=conversation_history)
 
@@ -201,8 +269,16 @@ def submit_ranking(task_id):
 
     if not ranking:
         return jsonify({'status': 'error', 'message': 'Missing data'}), 400
+    if task.completed_at or task.is_leased_to_other(current_user.id):
+        return jsonify({'status': 'error', 'message': 'Task is assigned to someone else'}), 409
 
-    task.ranking = ranking
+    try:
+        task.ranking = ranking
+    except (TypeError, ValueError):
+        return jsonify({'status': 'error', 'message': 'Invalid ranking'}), 400
+    # Renew the lease for the revision step
+    task.assigned_to = current_user.id
+    task.lease_expires_at = datetime.utcnow() + timedelta(seconds=current_app.config['RANKING_TASK_LEASE_SECONDS'])
     db.session.commit()
 
     return jsonify({'status': 'success'})
@@ -211,7 +287,7 @@ def submit_ranking(task_id):
 @login_required
 def revise(task_id):
     task = RankingTask.query.get_or_404(task_id)
-    conversation_history = get_conversation_history(task.parent_prompt_id)
+    conversation_history = render_conversation_history(task.parent_prompt_id)
     highest_ranked_prompt = Prompt.query.get(task.ranking[0])
     
     return render_template('tasks/revise.html', 
@@ -228,6 +304,22 @@ def submit_revision(task_id):
 
     if not revised_prompt:
         return jsonify({'status': 'error', 'message': 'Missing data'}), 400
+    if not task.ranking:
+        return jsonify({'status': 'error', 'message': 'Task has not been ranked'}), 400
+
+    # Complete the task only if nobody else has, and only while no one else holds the lease
+    now = datetime.utcnow()
+    completed = db.session.execute(
+        db.update(RankingTask).where(
+            RankingTask.id == task.id,
+            RankingTask.completed_at.is_(None),
+            db.or_(RankingTask.assigned_to.is_(None), RankingTask.assigned_to == current_user.id,
+                   RankingTask.lease_expires_at.is_(None), RankingTask.lease_expires_at <= now)
+        ).values(completed_at=now, user_id=current_user.id, assigned_to=current_user.id, lease_expires_at=None)
+    )
+    if not completed.rowcount:
+        db.session.rollback()
+        return jsonify({'status': 'error', 'message': 'Task is assigned to someone else'}), 409
 
     new_prompt = Prompt(
         parent_id=task.parent_prompt_id,
@@ -241,9 +333,7 @@ def submit_revision(task_id):
         flagged_for_conversation=True  # Flag the prompt for conversation extension
     )
     db.session.add(new_prompt)
-    
-    task.completed_at = datetime.utcnow()
-    task.user_id = current_user.id
+    UserScore.record(current_user.id, prompts_ranked=1)
     
     db.session.commit()
 
@@ -255,9 +345,9 @@ def submit_revision(task_id):
 @bp.route('/rank_and_revise')
 @login_required
 def get_next_rank_and_revise_task():
-    task = RankingTask.query.filter_by(user_id=None, completed_at=None).first()
-    if task:
-        return redirect(url_for('tasks.rank_and_revise', task_id=task.id))
+    task_id = claim_ranking_task(current_user.id, current_app.config['RANKING_TASK_LEASE_SECONDS'])
+    if task_id:
+        return redirect(url_for('tasks.rank_and_revise', task_id=task_id))
     else:
         flash('No more ranking tasks available at the moment.', 'info')
         return redirect(url_for('main.index'))
@@ -265,57 +355,92 @@ def get_next_rank_and_revise_task():
 @bp.route('/evaluate/<task_type>')
 @login_required
 def evaluate(task_type):
-    subquery = db.session.query(
-        EvaluationTask.id,
-        func.count(Evaluation.id).label('eval_count')
-    ).outerjoin(Evaluation).group_by(EvaluationTask.id).subquery()
-
-    task = EvaluationTask.query.join(
-        subquery, EvaluationTask.id == subquery.c.id
-    ).filter(
-        EvaluationTask.task_type == task_type,
-        EvaluationTask.language == current_user.preferred_language,
-        ~EvaluationTask.evaluations.any(Evaluation.user_id == current_user.id),
-        subquery.c.eval_count < 5
-    ).first()
+    task = get_next_evaluation_task(task_type, current_user.preferred_language, current_user.id)
 
     if not task:
         flash('No more tasks available for this category.', 'info')
         return redirect(url_for('tasks.evaluation_tasks'))
 
-    conversation_history = get_conversation_history(task.prompt_id)
+    conversation_history = render_conversation_history(task.prompt_id)
     return render_template('tasks/evaluate.html', task=task, conversation_history=conversation_history)
 
 @bp.route('/submit_evaluation/<int:task_id>', methods=['POST'])
 @login_required
 def submit_evaluation(task_id):
     task = EvaluationTask.query.get_or_404(task_id)
+    return record_evaluation(task)
+
+@bp.route('/submit_evaluation/<int:prompt_id>/<task_type>', methods=['POST'])
+@login_required
+def submit_virtual_evaluation(prompt_id, task_type):
+    """Evaluate a task that has not been created yet, creating it with this first evaluation."""
+    if task_type not in EVALUATION_TASK_TYPES:
+        abort(404)
+    prompt = Prompt.query.get_or_404(prompt_id)
+    # Checked before anything is written, so an invalid submission leaves no task behind
+    evaluation = build_evaluation(task_type)
+    if evaluation is None:
+        return redirect(url_for('tasks.evaluate', task_type=task_type))
+    task = EvaluationTask.query.filter_by(prompt_id=prompt.id, task_type=task_type).first()
+    if task is None:
+        task = EvaluationTask(prompt_id=prompt.id, task_type=task_type, language=prompt.language, evaluation_count=0)
+        db.session.add(task)
+        try:
+            # Flushed in the same transaction as the evaluation, so neither is saved without the other
+            db.session.flush()
+        except IntegrityError:
+            # Another annotator created the task first; add this evaluation to theirs
+            db.session.rollback()
+            task = EvaluationTask.query.filter_by(prompt_id=prompt.id, task_type=task_type).one()
+            return save_evaluation(task, evaluation)
+        # Stop offering the prompt once every task type exists as a row
+        created = db.session.query(func.count(EvaluationTask.task_type.distinct())).filter(EvaluationTask.prompt_id == prompt.id).scalar()
+        if created >= len(EVALUATION_TASK_TYPES):
+            prompt.evaluation_pending = False
+    return save_evaluation(task, evaluation)
+
+def build_evaluation(task_type):
+    """
+    Build the evaluation described by the submitted form, without saving it.
+
+    Args:
+    task_type (str): The type of the task being evaluated.
+
+    Returns:
+    Evaluation: The unsaved evaluation, or None after flashing why the form is invalid.
+    """
     value = request.form.get('value')
 
     if not value:
         flash('Please provide an evaluation.', 'error')
+        return None
+
+    evaluation = Evaluation(user_id=current_user.id)
+    try:
+        evaluation.set_value(task_type, value)
+    except ValueError:
+        flash('Please provide a valid evaluation.', 'error')
+        return None
+    return evaluation
+
+def record_evaluation(task):
+    evaluation = build_evaluation(task.task_type)
+    if evaluation is None:
         return redirect(url_for('tasks.evaluate', task_type=task.task_type))
+    return save_evaluation(task, evaluation)
 
-    evaluation = Evaluation(user_id=current_user.id, task_id=task.id, value=value)
+def save_evaluation(task, evaluation):
+    evaluation.task_id = task.id
     db.session.add(evaluation)
+    # Increment in SQL so concurrent submissions do not lose counts
+    task.evaluation_count = EvaluationTask.evaluation_count + 1
+    UserScore.record(current_user.id, evaluations_performed=1)
     db.session.commit()
 
     flash('Evaluation submitted successfully.', 'success')
     
     # Find the next available task
-    subquery = db.session.query(
-        EvaluationTask.id,
-        func.count(Evaluation.id).label('eval_count')
-    ).outerjoin(Evaluation).group_by(EvaluationTask.id).subquery()
-
-    next_task = EvaluationTask.query.join(
-        subquery, EvaluationTask.id == subquery.c.id
-    ).filter(
-        EvaluationTask.task_type == task.task_type,
-        EvaluationTask.language == current_user.preferred_language,
-        ~EvaluationTask.evaluations.any(Evaluation.user_id == current_user.id),
-        subquery.c.eval_count < 5
-    ).first()
+    next_task = get_next_evaluation_task(task.task_type, current_user.preferred_language, current_user.id)
 
     if next_task:
         return redirect(url_for('tasks.evaluate', task_type=task.task_type))
@@ -324,16 +449,84 @@ def submit_evaluation(task_id):
         return redirect(url_for('tasks.evaluation_tasks'))
 
 # Helper functions
-def get_conversation_history(prompt_id):
-    history = []
-    current_prompt = Prompt.query.get(prompt_id)
-    while current_prompt:
-        history.insert(0, {
-            'role': 'user' if not current_prompt.is_synthetic else 'assistant',
-            'content': current_prompt.prompt_text,
-        })
-        current_prompt = current_prompt.parent
-    return history
+def get_next_evaluation_task(task_type, language, user_id):
+    """Pick an evaluation task that still needs evaluations and that the user has not evaluated yet."""
+    if current_app.config['VIRTUAL_EVALUATION_TASKS']:
+        # Tasks nobody has evaluated yet exist only as pending prompts; the newest one is returned
+        # unsaved, and submit_virtual_evaluation creates it
+        has_task = db.session.query(EvaluationTask.id).filter(
+            EvaluationTask.prompt_id == Prompt.id,
+            EvaluationTask.task_type == task_type
+        ).exists()
+        prompt = Prompt.query.filter(
+            Prompt.evaluation_pending.is_(True),
+            Prompt.language == language,
+            ~has_task
+        ).order_by(Prompt.id.desc()).first()
+        if prompt:
+            return EvaluationTask(prompt_id=prompt.id, task_type=task_type, language=prompt.language, evaluation_count=0)
+
+    already_evaluated = db.session.query(Evaluation.id).filter(
+        Evaluation.task_id == EvaluationTask.id,
+        Evaluation.user_id == user_id
+    ).exists()
+
+    return EvaluationTask.query.filter(
+        EvaluationTask.language == language,
+        EvaluationTask.task_type == task_type,
+        EvaluationTask.evaluation_count < MAX_EVALUATIONS_PER_TASK,
+        ~already_evaluated
+    ).order_by(EvaluationTask.evaluation_count).first()
+
+def _claimable_ranking_task(now):
+    return RankingTask.completed_at.is_(None) & db.or_(
+        RankingTask.lease_expires_at.is_(None),
+        RankingTask.lease_expires_at <= now
+    )
+
+def claim_ranking_task(user_id, lease_seconds, candidates=5):
+    """
+    Lease a ranking task to a user so concurrent annotators are not given the same task.
+
+    A user who still holds a lease gets that task back. Otherwise the oldest unleased task, or one
+    whose lease has expired, is claimed the same way as generation jobs (see app.jobs.claim_jobs):
+    FOR UPDATE SKIP LOCKED on PostgreSQL, and a conditional UPDATE that only one claimant can win
+    on SQLite.
+
+    Returns:
+    Optional[int]: Id of the leased task, or None if there is none to give out.
+    """
+    now = datetime.utcnow()
+    held = db.session.execute(
+        db.select(RankingTask.id).where(
+            RankingTask.assigned_to == user_id,
+            RankingTask.completed_at.is_(None),
+            RankingTask.lease_expires_at > now
+        ).limit(1)
+    ).scalar()
+    if held:
+        return held
+
+    task_ids = db.session.execute(
+        db.select(RankingTask.id)
+        .where(_claimable_ranking_task(now))
+        .order_by(RankingTask.id)
+        .limit(candidates)
+        .with_for_update(skip_locked=True)
+    ).scalars().all()
+
+    for task_id in task_ids:
+        result = db.session.execute(
+            db.update(RankingTask).where(RankingTask.id == task_id, _claimable_ranking_task(now)).values(
+                assigned_to=user_id,
+                lease_expires_at=now + timedelta(seconds=lease_seconds)
+            )
+        )
+        if result.rowcount:
+            db.session.commit()
+            return task_id
+    db.session.commit()
+    return None
 
 def get_relevant_references(prompt_id):
     # Retrieve relevant references for the given prompt
@@ -341,13 +534,16 @@ def get_relevant_references(prompt_id):
     return [ref.reference_text for ref in prompt.references]
 
 def generate_synthetic_prompts(original_prompt):
-    # Generate synthetic prompts using the LLM
-    synthetic_prompts = []
-    for _ in range(4):  # Generate 4 synthetic prompts
-        chat_history = [{'role': 'user', 'content': f"Generate a variation of this prompt: {original_prompt}"}]
-        synthetic_prompt = generate_llm_response(chat_history, [])
-        synthetic_prompts.append({"text": synthetic_prompt})
-    return synthetic_prompts
+    # Generate 4 synthetic prompts concurrently using the LLM
+    chat_history = [{'role': 'user', 'content': f"Generate a variation of this prompt: {original_prompt}"}]
+    # distinct seeds the cache key so the four variations differ, and variations
+    # not finished by the deadline are dropped rather than holding up the request
+    variations = generate_llm_responses(
+        [(chat_history, [])] * 4,
+        distinct=True,
+        timeout=current_app.config['SYNTHETIC_PROMPT_DEADLINE_SECONDS']
+    )
+    return [{"text": variation} for variation in variations if variation]
 
 @bp.route('/conversation_task', methods=['GET', 'POST'])
 @login_required
@@ -375,84 +571,90 @@ def start_new_conversation(form):
     db.session.add(new_prompt)
     db.session.commit()
 
-    # Start response generation in a separate thread
-    Thread(target=generate_responses_async, args=(new_prompt.id, current_app._get_current_object())).start()
+    # Queue response generation for the generation worker
+    enqueue_job('generate_responses', new_prompt.id)
 
     flash('New conversation started successfully. Responses are being generated.', 'success')
     return redirect(url_for('tasks.user_conversations'))
 
+CONVERSATIONS_PER_PAGE = 20
+
 @bp.route('/user_conversations')
 @login_required
 def user_conversations():
     # Get filter preference from query parameter, default to "mine"
     filter_type = request.args.get('filter', 'mine')
+    # Keyset pagination: only show prompts older than the last one on the previous page
+    before = request.args.get('before', type=int)
     
-    # Base query for prompts that are conversation starters (no parent) or are extensions
-    base_query = Prompt.query.filter(
-        db.or_(
-            # Original conversations (no parent)
-            (Prompt.parent_id == None) & (Prompt.is_synthetic == False),
-            # Extended conversations
-            (Prompt.is_synthetic == False) & (Prompt.parent_id != None)
-        )
-    )
+    # Conversation starters and extensions, i.e. every prompt written by a person
+    base_query = Prompt.query.filter(Prompt.is_synthetic == False)
     
     # Always filter by user's preferred language
     if filter_type == 'all':
         base_query = base_query.filter(Prompt.language == current_user.preferred_language)
     elif filter_type == 'mine':
-        # Create explicit select statements for subqueries
-        ranking_tasks_select = select(RankingTask.parent_prompt_id).filter(
-            RankingTask.user_id == current_user.id
-        ).scalar_subquery()
-
-        evaluation_tasks_select = select(EvaluationTask.prompt_id).join(
-            Evaluation
-        ).filter(
-            Evaluation.user_id == current_user.id
-        ).scalar_subquery()
-
-        # Show conversations where user is author or has participated
-        base_query = base_query.filter(
-            db.or_(
-                Prompt.revision_author_id == current_user.id,  # User created the conversation
-                Prompt.children.any(Prompt.revision_author_id == current_user.id),  # User participated
-                Prompt.id.in_(ranking_tasks_select),  # User participated in ranking tasks
-                Prompt.id.in_(evaluation_tasks_select)  # User participated in evaluations
-            )
+        # Prompts the user wrote, replied to, ranked or evaluated; each part is an index lookup
+        participated = db.union(
+            select(Prompt.id).where(Prompt.revision_author_id == current_user.id),
+            select(Prompt.parent_id).where(Prompt.revision_author_id == current_user.id, Prompt.parent_id != None),
+            select(RankingTask.parent_prompt_id).where(RankingTask.user_id == current_user.id),
+            select(EvaluationTask.prompt_id).join(Evaluation).where(Evaluation.user_id == current_user.id)
         )
+        base_query = base_query.filter(Prompt.id.in_(participated))
+
+    if before:
+        base_query = base_query.filter(Prompt.id < before)
     
-    # Order by most recent first
-    prompts = base_query.order_by(Prompt.created_at.desc()).all()
+    # Order by most recent first, fetching one extra row to know if there is a next page
+    prompts = base_query.order_by(Prompt.id.desc()).limit(CONVERSATIONS_PER_PAGE + 1).all()
+    next_before = None
+    if len(prompts) > CONVERSATIONS_PER_PAGE:
+        prompts = prompts[:CONVERSATIONS_PER_PAGE]
+        next_before = prompts[-1].id
+
+    # Load every prompt in the conversation trees on this page in one query,
+    # and everything else below is grouped by prompt id in memory
+    root_ids = {prompt.root_id or prompt.id for prompt in prompts}
+    tree_prompts = Prompt.query.filter(
+        db.or_(Prompt.root_id.in_(root_ids), Prompt.id.in_(root_ids))
+    ).options(selectinload(Prompt.revision_author)).order_by(Prompt.created_at).all() if prompts else []
+    prompts_by_id = {p.id: p for p in tree_prompts}
+    children_by_parent = defaultdict(list)
+    for tree_prompt in tree_prompts:
+        if tree_prompt.parent_id is not None:
+            children_by_parent[tree_prompt.parent_id].append(tree_prompt)
+    extensions_by_root = defaultdict(list)
+    for tree_prompt in tree_prompts:
+        if not tree_prompt.is_synthetic and tree_prompt.parent_id is not None:
+            extensions_by_root[tree_prompt.root_id].append(tree_prompt)
+
+    ranking_tasks_by_prompt = defaultdict(list)
+    if prompts:
+        for task in RankingTask.query.filter(RankingTask.parent_prompt_id.in_([p.id for p in prompts])):
+            ranking_tasks_by_prompt[task.parent_prompt_id].append(task)
     
     conversations = []
     for prompt in prompts:
         # Get the root prompt if this is an extension
-        root_prompt = prompt
-        while root_prompt.parent_id is not None:
-            root_prompt = root_prompt.parent
+        root_prompt = prompts_by_id.get(prompt.root_id, prompt)
 
-        responses = Prompt.query.filter_by(parent_id=prompt.id, is_synthetic=True).all()
-        ranking_tasks = RankingTask.query.filter_by(parent_prompt_id=prompt.id).all()
+        responses = [c for c in children_by_parent[prompt.id] if c.is_synthetic]
+        ranking_tasks = ranking_tasks_by_prompt[prompt.id]
         
         # Get conversation history
-        history = get_conversation_history(prompt.id)
+        history = build_conversation_history(prompt, prompts_by_id)
         
         # Get all human contributors (excluding synthetic responses)
-        contributors = db.session.query(User).join(
-            Prompt, 
-            (User.id == Prompt.revision_author_id) & 
-            (Prompt.revision_author_type == 'user')
-        ).filter(
-            db.or_(
-                User.id == root_prompt.revision_author_id,  # Original author
-                Prompt.parent_id == root_prompt.id,  # Direct responses to root
-                Prompt.parent_id == prompt.id  # Direct responses to current prompt if it's an extension
-            )
-        ).distinct().all()
+        contributors = {}
+        candidates = [root_prompt] + children_by_parent[root_prompt.id] + children_by_parent[prompt.id]
+        for candidate in candidates:
+            if candidate.revision_author_type == 'user' and candidate.revision_author:
+                contributors.setdefault(candidate.revision_author_id, candidate.revision_author)
+        contributors = list(contributors.values())
         
         # Get the last message in the conversation
-        last_message = get_last_message(prompt.id)
+        last_message = get_last_message(prompt, children_by_parent)
 
         # Check if this is a revision
         is_revision = getattr(prompt, 'is_revision', False)
@@ -472,17 +674,7 @@ def user_conversations():
         # Get all extensions of this conversation
         extensions = []
         if prompt.id == root_prompt.id:  # Only get extensions for root prompts
-            extensions = Prompt.query.filter(
-                (Prompt.is_synthetic == False) &
-                (Prompt.parent_id != None)
-            ).filter(
-                db.or_(
-                    Prompt.parent_id == prompt.id,
-                    Prompt.parent_id.in_(
-                        select(Prompt.id).filter(Prompt.parent_id == prompt.id)
-                    )
-                )
-            ).all()
+            extensions = extensions_by_root[prompt.id]
 
         conversations.append({
             'prompt': prompt,
@@ -517,32 +709,41 @@ def user_conversations():
     
     return render_template('tasks/user_conversations.html', 
                          conversations=conversations,
-                         current_filter=filter_type)
+                         current_filter=filter_type,
+                         next_before=next_before)
+
+def build_conversation_history(prompt, prompts_by_id):
+    """Build the conversation history for a prompt from already loaded prompts."""
+    history = []
+    current_prompt = prompt
+    while current_prompt:
+        if current_prompt.prompt_html is not None:
+            remember_markdown(current_prompt.prompt_text, current_prompt.prompt_html)
+        history.insert(0, {
+            'role': 'user' if not current_prompt.is_synthetic else 'assistant',
+            'content': current_prompt.prompt_text,
+        })
+        current_prompt = prompts_by_id.get(current_prompt.parent_id)
+    return history
 
-def get_last_message(prompt_id):
-    """Get the last message in a conversation chain."""
-    current_prompt = Prompt.query.get(prompt_id)
+def get_last_message(prompt, children_by_parent):
+    """Get the last message in a conversation chain from already loaded children."""
+    current_prompt = prompt
     
     while True:
-        # Get all non-synthetic children
-        next_message = Prompt.query.filter(
-            Prompt.parent_id == current_prompt.id,
-            Prompt.is_synthetic == False
-        ).order_by(Prompt.created_at.desc()).first()
+        children = children_by_parent.get(current_prompt.id, [])
+        # Get the newest non-synthetic child
+        human_children = [c for c in children if not c.is_synthetic]
         
-        if not next_message:
+        if not human_children:
             # If there are no more human messages, check if there are synthetic responses
-            synthetic_response = Prompt.query.filter(
-                Prompt.parent_id == current_prompt.id,
-                Prompt.is_synthetic == True
-            ).order_by(Prompt.created_at.desc()).first()
-            
-            if synthetic_response:
+            if any(c.is_synthetic for c in children):
                 return None  # Return None if the last message is synthetic
             return current_prompt  # Return the last human message
             
-        current_prompt = next_message
+        current_prompt = human_children[-1]
 
+@job_handler('generate_responses')
 def generate_responses_async(prompt_id, app):
     with app.app_context():
         try:
@@ -562,78 +763,60 @@ def generate_responses_async(prompt_id, app):
                 create_ranking_tasks(prompt.id, all_prompt_ids)
                 logging.info(f"Created ranking tasks for prompt {prompt_id}")
             else:
-                logging.warning(f"No responses generated for prompt {prompt_id}")
+                # Raise so the job is retried
+                raise RuntimeError(f"No responses generated for prompt {prompt_id}")
             
             db.session.commit()
             logging.info(f"Completed response generation and task creation for prompt {prompt_id}")
         except Exception as e:
             logging.exception(f"Error in generate_responses_async for prompt {prompt_id}: {str(e)}")
             db.session.rollback()
+            raise
 
 def generate_responses(prompt, app):
-    responses = []
     postfixes = PROMPT_POSTFIXES.copy()
     
     # Ensure at least one response has no postfix
-    with app.app_context():
-        first_response = generate_single_response(prompt, "")
-        if first_response:
-            responses.append(first_response)
     postfixes.remove("")
-    
-    # Generate 7 more responses in parallel
-    with ThreadPoolExecutor(max_workers=7) as executor:
-        future_to_postfix = {}
-        for _ in range(7):
-            if postfixes:
-                postfix = random.choice(postfixes)
-                postfixes.remove(postfix)
-            else:
-                postfix = random.choice(PROMPT_POSTFIXES)
-            future = executor.submit(generate_single_response_with_context, prompt, postfix, app)
-            future_to_postfix[future] = postfix
-
-        for future in as_completed(future_to_postfix):
-            try:
-                response = future.result()
-                if response and response.id not in [r.id for r in responses]:
-                    responses.append(response)
-            except Exception as exc:
-                logging.exception(f'Response generation produced an exception: {exc}')
+    selected_postfixes = [""] + random.sample(postfixes, 7)
+
+    # Generate all 8 responses concurrently on one event loop
+    responses = generate_synthetic_responses(prompt, selected_postfixes, app)
     
     logging.info(f"Generated {len(responses)} valid responses for prompt {prompt.id}")
     return responses
 
-def generate_single_response_with_context(prompt, postfix, app):
+def generate_synthetic_responses(prompt, postfixes, app):
+    """Generate one model response to the prompt per postfix and save the non-empty ones."""
     with app.app_context():
-        return generate_single_response(prompt, postfix)
-
-def generate_single_response(prompt, postfix):
-    try:
+        # Load the history once and share it between all responses
         conversation_history = get_conversation_history(prompt.id)
-        if postfix:
-            conversation_history.append({"role": "system", "content": postfix})
-        
-        response_text = generate_llm_response(conversation_history, [])
-        if not response_text:
-            logging.warning(f"Empty response generated for prompt {prompt.id}")
-            return None
-
-        response = Prompt(
-            prompt_text=response_text,
-            language=prompt.language,
-            is_synthetic=True,
-            revision_author_type='model',
-            parent_id=prompt.id,
-            postfix=postfix  # Save the postfix
-        )
-        db.session.add(response)
+        requests = []
+        for postfix in postfixes:
+            messages = list(conversation_history)
+            if postfix:
+                messages.append({"role": "system", "content": postfix})
+            requests.append((messages, []))
+
+        responses = []
+        for postfix, response_text in zip(postfixes, generate_llm_responses(requests)):
+            if not response_text:
+                logging.warning(f"Empty response generated for prompt {prompt.id}")
+                continue
+
+            response = Prompt(
+                prompt_text=response_text,
+                language=prompt.language,
+                is_synthetic=True,
+                revision_author_type='model',
+                parent_id=prompt.id,
+                postfix=postfix  # Save the postfix
+            )
+            db.session.add(response)
+            responses.append(response)
         db.session.commit()
-        logging.info(f"Generated response for prompt {prompt.id}: {response.id}")
-        return response
-    except Exception as e:
-        logging.exception(f"Error in generate_single_response: {str(e)}")
-        return None
+        logging.info(f"Generated responses for prompt {prompt.id}: {[r.id for r in responses]}")
+        return responses
 
 def create_ranking_tasks(parent_prompt_id, all_prompt_ids):
     try:
@@ -660,13 +843,12 @@ def create_ranking_tasks(parent_prompt_id, all_prompt_ids):
         db.session.rollback()  # Rollback in case of error
 
 def get_random_conversation(language):
-    return Prompt.query.filter_by(language=language, parent_id=None).order_by(func.random()).first()
+    return sample_prompt(language=language, roots_only=True)
 
 def generate_conversation_extensions(conversation):
     extensions = []
-    for _ in range(4):
-        conversation_history = get_conversation_history(conversation.id)
-        extension_text = generate_llm_response(conversation_history, [])
+    conversation_history = get_conversation_history(conversation.id)
+    for extension_text in generate_llm_responses([(conversation_history, [])] * 4, distinct=True):
         extension = Prompt(
             parent_id=conversation.id,
             prompt_text=extension_text,
@@ -683,7 +865,6 @@ def generate_conversation_extensions(conversation):
 @login_required
 def extend_conversation(prompt_id):
     prompt = Prompt.query.get_or_404(prompt_id)
-    conversation_history = get_conversation_history(prompt.id)
     form = ExtendConversationForm()
     
     if form.validate_on_submit():
@@ -699,14 +880,16 @@ def extend_conversation(prompt_id):
         db.session.add(new_prompt)
         db.session.commit()
 
-        # Start response generation in a separate thread
-        Thread(target=generate_continuations_and_create_tasks, args=(new_prompt.id, current_app._get_current_object())).start()
+        # Queue continuation generation for the generation worker
+        enqueue_job('generate_continuations', new_prompt.id)
 
         flash('Your response has been added to the conversation. New continuations are being generated.', 'success')
         return redirect(url_for('tasks.user_conversations'))
 
+    conversation_history = render_conversation_history(prompt.id)
     return render_template('tasks/extend_conversation.html', prompt=prompt, conversation_history=conversation_history, form=form)
 
+@job_handler('generate_continuations')
 def generate_continuations_and_create_tasks(prompt_id, app):
     with app.app_context():
         try:
@@ -726,72 +909,23 @@ def generate_continuations_and_create_tasks(prompt_id, app):
                 create_ranking_tasks(prompt.id, all_prompt_ids)
                 logging.info(f"Created ranking tasks for prompt {prompt_id}")
             else:
-                logging.warning(f"No continuations generated for prompt {prompt_id}")
+                # Raise so the job is retried
+                raise RuntimeError(f"No continuations generated for prompt {prompt_id}")
             
             db.session.commit()
             logging.info(f"Completed continuation generation and task creation for prompt {prompt_id}")
         except Exception as e:
             logging.exception(f"Error in generate_continuations_and_create_tasks for prompt {prompt_id}: {str(e)}")
             db.session.rollback()
+            raise
 
 def generate_continuations(prompt, app):
-    continuations = []
-    postfixes = PROMPT_POSTFIXES.copy()
-    
-    # Generate 8 continuations in parallel
-    with ThreadPoolExecutor(max_workers=8) as executor:
-        future_to_postfix = {}
-        for _ in range(8):
-            if postfixes:
-                postfix = random.choice(postfixes)
-                postfixes.remove(postfix)
-            else:
-                postfix = random.choice(PROMPT_POSTFIXES)
-            future = executor.submit(generate_single_continuation_with_context, prompt, postfix, app)
-            future_to_postfix[future] = postfix
-
-        for future in as_completed(future_to_postfix):
-            try:
-                continuation = future.result()
-                if continuation and continuation.id not in [c.id for c in continuations]:
-                    continuations.append(continuation)
-            except Exception as exc:
-                logging.exception(f'Continuation generation produced an exception: {exc}')
+    # Generate 8 continuations concurrently on one event loop
+    continuations = generate_synthetic_responses(prompt, random.sample(PROMPT_POSTFIXES, 8), app)
     
     logging.info(f"Generated {len(continuations)} valid continuations for prompt {prompt.id}")
     return continuations
 
-def generate_single_continuation_with_context(prompt, postfix, app):
-    with app.app_context():
-        return generate_single_continuation(prompt, postfix)
-
-def generate_single_continuation(prompt, postfix):
-    try:
-        conversation_history = get_conversation_history(prompt.id)
-        if postfix:
-            conversation_history.append({"role": "system", "content": postfix})
-        
-        continuation_text = generate_llm_response(conversation_history, [])
-        if not continuation_text:
-            logging.warning(f"Empty continuation generated for prompt {prompt.id}")
-            return None
-
-        continuation = Prompt(
-            prompt_text=continuation_text,
-            language=prompt.language,
-            is_synthetic=True,
-            revision_author_type='model',
-            parent_id=prompt.id,
-            postfix=postfix
-        )
-        db.session.add(continuation)
-        db.session.commit()
-        logging.info(f"Generated continuation for prompt {prompt.id}: {continuation.id}")
-        return continuation
-    except Exception as e:
-        logging.exception(f"Error in generate_single_continuation: {str(e)}")
-        return None
-
 @bp.route('/retry_response_generation/<int:prompt_id>', methods=['POST'])
 @login_required
 def retry_response_generation(prompt_id):
@@ -808,8 +942,8 @@ def retry_response_generation(prompt_id):
         flash('Please wait 5 minutes before retrying again.', 'warning')
         return redirect(url_for('tasks.user_conversations'))
 
-    # Start response generation in a separate thread
-    Thread(target=generate_responses_async, args=(prompt.id, current_app._get_current_object())).start()
+    # Queue response generation for the generation worker
+    enqueue_job('generate_responses', prompt.id)
 
     # Update the last retry timestamp
     session[f'last_retry_{prompt_id}'] = datetime.utcnow().isoformat()
@@ -821,12 +955,21 @@ def retry_response_generation(prompt_id):
 @login_required
 def create_evaluation_tasks(prompt_id):
     prompt = Prompt.query.get_or_404(prompt_id)
-    task_types = ['pii', 'quality_score', 'seriousness', 'creativity', 'politeness', 'safety', 'friendliness', 'difficulty', 'spam', 'appropriate', 'hate_speech', 'sexual_content', 'child_friendly', 'bias', 'sarcasm', 'topic_tags']
-    
-    for task_type in task_types:
-        new_task = EvaluationTask(prompt_id=prompt.id, task_type=task_type, language=prompt.language)
-        db.session.add(new_task)
-    
+
+    if current_app.config['VIRTUAL_EVALUATION_TASKS']:
+        # The tasks are created one at a time as they get their first evaluation
+        prompt.evaluation_pending = True
+    else:
+        # The route can be requested again for the same prompt; only the missing task types are added
+        existing = set(db.session.scalars(select(EvaluationTask.task_type).where(EvaluationTask.prompt_id == prompt.id)))
+        missing = [task_type for task_type in EVALUATION_TASK_TYPES if task_type not in existing]
+        if missing:
+            db.session.execute(db.insert(EvaluationTask), [
+                {'prompt_id': prompt.id, 'task_type': task_type, 'language': prompt.language,
+                 'created_at': datetime.utcnow(), 'evaluation_count': 0}
+                for task_type in missing
+            ])
+
     db.session.commit()
     flash('Evaluation tasks created successfully.', 'success')
     return redirect(url_for('tasks.user_conversations'))
@@ -842,5 +985,22 @@ def evaluation_tasks():
     ).filter(EvaluationTask.language == current_user.preferred_language
     ).group_by(EvaluationTask.task_type).all()
 
+    if current_app.config['VIRTUAL_EVALUATION_TASKS']:
+        # Count the tasks pending prompts will get, less those already created
+        pending = Prompt.query.filter(
+            Prompt.evaluation_pending.is_(True), Prompt.language == current_user.preferred_language
+        ).count()
+        created = dict(db.session.query(
+            EvaluationTask.task_type, func.count(EvaluationTask.prompt_id.distinct())
+        ).join(Prompt, Prompt.id == EvaluationTask.prompt_id).filter(
+            Prompt.evaluation_pending.is_(True), Prompt.language == current_user.preferred_language
+        ).group_by(EvaluationTask.task_type).all())
+        counts = {task_type: (total, completed) for task_type, total, completed in task_counts}
+        task_counts = [
+            (task_type, counts.get(task_type, (0, 0))[0] + pending - created.get(task_type, 0),
+             counts.get(task_type, (0, 0))[1])
+            for task_type in EVALUATION_TASK_TYPES if task_type in counts or pending
+        ]
+
     return render_template('tasks/evaluation_tasks.html', task_counts=task_counts)
 
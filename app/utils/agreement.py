@@ -0,0 +1,227 @@
+import threading
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+from sqlalchemy import select
+from app import db
+from app.models import Evaluation, EvaluationTask, SCALE_TASK_TYPES, TAG_TASK_TYPES, parse_tags
+
+# Evaluations read per query when refreshing
+REFRESH_BATCH_SIZE = 50000
+
+# Distance between answer categories: disagreeing on a yes/no (or on whether a tag applies)
+# counts fully, and 1-5 scores are compared as intervals
+NOMINAL_DISTANCE = 1.0 - np.eye(2)
+INTERVAL_DISTANCE = np.subtract.outer(np.arange(5.0), np.arange(5.0)) ** 2
+
+
+def krippendorff_alpha(counts: np.ndarray, distance: np.ndarray) -> Optional[float]:
+    """
+    Krippendorff's alpha from a units x categories matrix of how many annotators chose each category.
+
+    Args:
+    counts (np.ndarray): Row per unit (e.g. evaluation task), column per answer category.
+    distance (np.ndarray): Squared distance between categories (nominal, interval, ...).
+
+    Returns:
+    Optional[float]: 1 for perfect agreement, 0 for chance level; None when there is nothing to compare.
+    """
+    raters = counts.sum(axis=1)
+    pairable = raters >= 2
+    counts, raters = counts[pairable], raters[pairable]
+    if not len(counts):
+        return None
+    weighted = counts / (raters - 1)[:, None]
+    coincidences = weighted.T @ counts - np.diag(weighted.sum(axis=0))
+    totals = coincidences.sum(axis=0)
+    n = totals.sum()
+    expected = (np.outer(totals, totals) * distance).sum() / (n * (n - 1))
+    if expected == 0:
+        return None
+    return float(1 - (coincidences * distance).sum() / n / expected)
+
+
+def fleiss_kappa(counts: np.ndarray) -> Optional[float]:
+    """Fleiss' kappa over the units with at least two annotators, allowing their number to vary."""
+    raters = counts.sum(axis=1)
+    pairable = raters >= 2
+    counts, raters = counts[pairable], raters[pairable]
+    if not len(counts):
+        return None
+    observed = (((counts ** 2).sum(axis=1) - raters) / (raters * (raters - 1))).mean()
+    shares = counts.sum(axis=0) / counts.sum()
+    expected = (shares ** 2).sum()
+    if expected == 1:
+        return None
+    return float((observed - expected) / (1 - expected))
+
+
+class AgreementGroup:
+    """Answer counts per unit and every individual rating for one task type and language."""
+
+    def __init__(self, task_type: str, language: str):
+        self.task_type = task_type
+        self.language = language
+        if task_type in SCALE_TASK_TYPES:
+            self.family, self.distance = 'scale', INTERVAL_DISTANCE
+        elif task_type in TAG_TASK_TYPES:
+            self.family, self.distance = 'tags', NOMINAL_DISTANCE
+        else:
+            self.family, self.distance = 'binary', NOMINAL_DISTANCE
+        self.counts = np.zeros((64, len(self.distance)))
+        self.num_units = 0
+        self.units: Dict[Any, int] = {}
+        # Parallel arrays of (unit row, annotator, category), one entry per rating
+        self.rating_units: List[int] = []
+        self.rating_annotators: List[int] = []
+        self.rating_categories: List[int] = []
+        self.evaluations = 0
+        # For tag tasks: who annotated each task, and which tag units belong to it
+        self.task_annotators = defaultdict(dict)
+        self.task_tags = defaultdict(dict)
+
+    def _unit(self, key):
+        row = self.units.get(key)
+        if row is None:
+            if self.num_units == len(self.counts):
+                self.counts = np.vstack([self.counts, np.zeros_like(self.counts)])
+            row = self.units[key] = self.num_units
+            self.num_units += 1
+        return row
+
+    def _rate(self, row, annotator, category):
+        self.counts[row, category] += 1
+        self.rating_units.append(row)
+        self.rating_annotators.append(annotator)
+        self.rating_categories.append(category)
+
+    def add(self, task_id: int, user_id: int, value: str) -> None:
+        if self.family == 'tags':
+            self._add_tags(task_id, user_id, set(parse_tags(value)))
+            return
+        category = value.strip() if value else ''
+        if self.family == 'binary' and category in ('0', '1'):
+            self._rate(self._unit(task_id), user_id, int(category))
+        elif self.family == 'scale' and category in ('1', '2', '3', '4', '5'):
+            self._rate(self._unit(task_id), user_id, int(category) - 1)
+        else:
+            return
+        self.evaluations += 1
+
+    def _add_tags(self, task_id, user_id, tags):
+        # Every tag anyone used on a task is a yes/no unit that all of the task's annotators answered
+        annotators, tag_units = self.task_annotators[task_id], self.task_tags[task_id]
+        for tag, row in tag_units.items():
+            self._rate(row, user_id, int(tag in tags))
+        for tag in tags - tag_units.keys():
+            row = tag_units[tag] = self._unit((task_id, tag))
+            for annotator in annotators:
+                self._rate(row, annotator, 0)
+            self._rate(row, user_id, 1)
+        annotators[user_id] = True
+        self.evaluations += 1
+
+    def summary(self) -> Dict[str, Any]:
+        counts = self.counts[:self.num_units]
+        return {
+            'task_type': self.task_type,
+            'language': self.language,
+            'family': self.family,
+            'evaluations': self.evaluations,
+            'units': int((counts.sum(axis=1) >= 2).sum()),
+            'alpha': krippendorff_alpha(counts, self.distance),
+            'kappa': fleiss_kappa(counts) if self.family != 'scale' else None,
+        }
+
+    def annotator_agreement(self) -> List[Dict[str, Any]]:
+        """Per annotator, 1 minus their mean disagreement with co-annotators relative to chance."""
+        counts = self.counts[:self.num_units]
+        units = np.asarray(self.rating_units, dtype=np.int64)
+        annotators = np.asarray(self.rating_annotators, dtype=np.int64)
+        categories = np.asarray(self.rating_categories, dtype=np.int64)
+        raters = counts.sum(axis=1)[units] if len(units) else np.empty(0)
+        pairable = raters >= 2
+        units, annotators, categories, raters = units[pairable], annotators[pairable], categories[pairable], raters[pairable]
+        if not len(units):
+            return []
+
+        totals = counts[counts.sum(axis=1) >= 2].sum(axis=0)
+        n = totals.sum()
+        expected = (np.outer(totals, totals) * self.distance).sum() / (n * (n - 1))
+        if expected == 0:
+            return []
+        # Mean distance from each rating to the other ratings of its unit (distance to itself is 0)
+        disagreement = (counts[units] * self.distance[categories]).sum(axis=1) / (raters - 1)
+
+        annotator_ids, annotator_index = np.unique(annotators, return_inverse=True)
+        ratings = np.bincount(annotator_index)
+        mean_disagreement = np.bincount(annotator_index, weights=disagreement) / ratings
+        return [{
+            'task_type': self.task_type,
+            'language': self.language,
+            'user_id': int(user_id),
+            'ratings': int(count),
+            'agreement': float(1 - mean / expected),
+        } for user_id, count, mean in zip(annotator_ids, ratings, mean_disagreement)]
+
+
+class AgreementStats:
+    """Agreement for every task type and language, updated with only the evaluations added since last time."""
+
+    def __init__(self):
+        self.groups: Dict[Tuple[str, str], AgreementGroup] = {}
+        self.last_evaluation_id = 0
+        self.summaries: List[Dict[str, Any]] = []
+        self.annotators: List[Dict[str, Any]] = []
+        self.lock = threading.Lock()
+
+    def refresh(self) -> int:
+        """Read new evaluations and recompute the groups they belong to; returns how many were read."""
+        with self.lock:
+            new_evaluations, changed = 0, set()
+            while True:
+                rows = db.session.execute(
+                    select(Evaluation.id, Evaluation.task_id, Evaluation.user_id, Evaluation.value,
+                           EvaluationTask.task_type, EvaluationTask.language)
+                    .join(EvaluationTask, EvaluationTask.id == Evaluation.task_id)
+                    .where(Evaluation.id > self.last_evaluation_id)
+                    .order_by(Evaluation.id).limit(REFRESH_BATCH_SIZE)
+                ).all()
+                for evaluation_id, task_id, user_id, value, task_type, language in rows:
+                    key = (task_type, language)
+                    if key not in self.groups:
+                        self.groups[key] = AgreementGroup(task_type, language)
+                    self.groups[key].add(task_id, user_id, value)
+                    changed.add(key)
+                if rows:
+                    self.last_evaluation_id = rows[-1].id
+                new_evaluations += len(rows)
+                if len(rows) < REFRESH_BATCH_SIZE:
+                    break
+
+            if changed:
+                # Only the groups with new evaluations are recomputed
+                summaries = {(s['task_type'], s['language']): s for s in self.summaries}
+                annotators = defaultdict(list)
+                for row in self.annotators:
+                    annotators[(row['task_type'], row['language'])].append(row)
+                for key in changed:
+                    summaries[key] = self.groups[key].summary()
+                    annotators[key] = self.groups[key].annotator_agreement()
+                self.summaries = [summaries[key] for key in sorted(summaries)]
+                self.annotators = [row for key in sorted(annotators) for row in annotators[key]]
+            return new_evaluations
+
+
+_stats: Optional[AgreementStats] = None
+_stats_lock = threading.Lock()
+
+
+def get_agreement_stats() -> AgreementStats:
+    """Get this process's agreement statistics, brought up to date with any new evaluations."""
+    global _stats
+    with _stats_lock:
+        if _stats is None:
+            _stats = AgreementStats()
+    _stats.refresh()
+    return _stats
@@ -0,0 +1,100 @@
+import hashlib
+from typing import Dict, Iterable, List
+from flask import current_app, render_template
+from markupsafe import Markup
+from sqlalchemy import select, literal
+from sqlalchemy.orm import aliased
+from app import db
+from app.models import Prompt
+from app.utils.fragment_cache import get_fragment_cache
+from app.utils.markdown_cache import remember_markdown
+
+
+def get_conversation_histories(prompt_ids: Iterable[int]) -> Dict[int, List[Dict[str, str]]]:
+    """
+    Load the conversation history for many prompts with a single recursive CTE query.
+
+    Args:
+    prompt_ids (Iterable[int]): Ids of the last prompt in each conversation.
+
+    Returns:
+    Dict[int, List[Dict[str, str]]]: Messages from the root to the prompt, keyed by prompt id.
+    Prompts that do not exist are left out.
+    """
+    prompt_ids = list(set(prompt_ids))
+    if not prompt_ids:
+        return {}
+
+    # Walk from each requested prompt up to its root, remembering where we started
+    chain = select(
+        Prompt.id.label('leaf_id'),
+        Prompt.id.label('prompt_id'),
+        Prompt.parent_id.label('parent_id'),
+        literal(0).label('depth')
+    ).where(Prompt.id.in_(prompt_ids)).cte('conversation_chain', recursive=True)
+
+    parent = aliased(Prompt)
+    chain = chain.union_all(
+        select(
+            chain.c.leaf_id,
+            parent.id,
+            parent.parent_id,
+            chain.c.depth + 1
+        ).join(parent, parent.id == chain.c.parent_id)
+    )
+
+    rows = db.session.execute(
+        select(chain.c.leaf_id, Prompt.is_synthetic, Prompt.prompt_text, Prompt.prompt_html)
+        .join(Prompt, Prompt.id == chain.c.prompt_id)
+        .order_by(chain.c.leaf_id, chain.c.depth.desc())
+    )
+
+    histories = {}
+    for leaf_id, is_synthetic, prompt_text, prompt_html in rows:
+        if prompt_html is not None:
+            # So the markdown filter finds the stored HTML instead of rendering the text again
+            remember_markdown(prompt_text, prompt_html)
+        histories.setdefault(leaf_id, []).append({
+            'role': 'user' if not is_synthetic else 'assistant',
+            'content': prompt_text,
+        })
+    return histories
+
+
+def get_conversation_history(prompt_id: int) -> List[Dict[str, str]]:
+    """Get the conversation leading up to and including the given prompt, oldest message first."""
+    return get_conversation_histories([prompt_id]).get(prompt_id, [])
+
+
+CONVERSATION_HISTORY_TEMPLATE = 'components/conversation_history.html'
+_template_versions = {}
+
+
+def _template_version(name):
+    # Part of the cache key, so a deploy that changes the template does not serve old fragments.
+    # With TEMPLATES_AUTO_RELOAD the template file is also checked for edits on every call
+    jinja_env = current_app.jinja_env
+    version = _template_versions.get(name)
+    if version is None or (jinja_env.auto_reload and not version[1]()):
+        source, _, uptodate = jinja_env.loader.get_source(jinja_env, name)
+        version = (hashlib.sha256(source.encode('utf-8')).hexdigest()[:16], uptodate or (lambda: True))
+        _template_versions[name] = version
+    return version[0]
+
+
+def render_conversation_history(prompt_id: int) -> Markup:
+    """
+    Render the conversation history component for the conversation ending at a prompt.
+
+    Prompts are only ever appended, so the conversation leading up to a prompt never changes
+    and the rendered HTML is cached by the prompt id (see app.utils.fragment_cache).
+    """
+    cache = get_fragment_cache()
+    key = f"conversation_history:{_template_version(CONVERSATION_HISTORY_TEMPLATE)}:{prompt_id}"
+    html = cache.get(key) if cache else None
+    if html is None:
+        history = get_conversation_history(prompt_id)
+        html = render_template(CONVERSATION_HISTORY_TEMPLATE, conversation_history=history)
+        if cache and history:
+            cache.set(key, html)
+    return Markup(html)
@@ -0,0 +1,261 @@
+import csv
+import io
+import json
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from itertools import islice
+from typing import Any, Callable, Dict, Iterable, Iterator, Optional, TextIO
+from sqlalchemy import text
+from app import db
+from app.models import Prompt, Reference, prompt_references, tree_path_segment
+
+# Accepted names for each field, so OpenAssistant style exports load without conversion
+FIELD_ALIASES = {
+    'source_id': ('source_id', 'message_id'),
+    'parent_source_id': ('parent_source_id', 'parent_id'),
+    'prompt_text': ('prompt_text', 'text'),
+    'language': ('language', 'lang'),
+}
+
+PROMPT_COLUMNS = [
+    'id', 'parent_id', 'root_id', 'path', 'language', 'prompt_text', 'is_synthetic', 'source_id',
+    'model_used', 'source_dataset', 'is_revision', 'flagged_for_conversation', 'revision_author_type', 'created_at'
+]
+REFERENCE_COLUMNS = ['id', 'reference_link', 'reference_text', 'created_at']
+PROMPT_REFERENCE_COLUMNS = ['prompt_id', 'reference_id']
+
+# Records per transaction; larger batches mean fewer commits and lookups of existing source ids
+IMPORT_BATCH_SIZE = 20000
+
+
+def read_records(stream: TextIO, file_format: str) -> Iterator[Dict[str, Any]]:
+    """Yield records one at a time from a JSONL or CSV stream."""
+    if file_format == 'jsonl':
+        for line in stream:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+    elif file_format == 'csv':
+        yield from csv.DictReader(stream)
+    else:
+        raise ValueError(f"Unsupported format: {file_format}")
+
+
+def _field(record, name):
+    for alias in FIELD_ALIASES[name]:
+        value = record.get(alias)
+        if value not in (None, ''):
+            return str(value)
+    return None
+
+
+def _is_synthetic(record):
+    value = record.get('is_synthetic')
+    if value not in (None, ''):
+        return str(value).lower() in ('1', 'true', 't', 'yes')
+    return record.get('role') == 'assistant'
+
+
+def _references(record):
+    references = record.get('references') or []
+    if record.get('reference_text') or record.get('reference_link'):
+        references = [{'text': record.get('reference_text'), 'link': record.get('reference_link')}]
+    for reference in references:
+        if isinstance(reference, str):
+            yield {'reference_link': None, 'reference_text': reference}
+        else:
+            yield {'reference_link': reference.get('link'), 'reference_text': reference.get('text')}
+
+
+def _allocate_ids(connection, table, count):
+    """Reserve `count` primary keys so parent ids and paths can be computed before inserting."""
+    if count == 0:
+        return []
+    if connection.dialect.name == 'postgresql':
+        return list(connection.execute(
+            text("SELECT nextval(pg_get_serial_sequence(:table, 'id')) FROM generate_series(1, :count)"),
+            {'table': table.name, 'count': count}
+        ).scalars())
+    # The batch holds SQLite's write lock (see _begin_batch), so nobody else can take these ids before it commits
+    start = (connection.execute(db.select(db.func.max(table.c.id))).scalar() or 0) + 1
+    return list(range(start, start + count))
+
+
+def _begin_batch(connection):
+    """
+    Start a batch's transaction, on SQLite by taking the write lock straight away.
+
+    pysqlite only begins a transaction at the first INSERT, so the reads of a batch, including
+    the max(id) in _allocate_ids, would otherwise run before the lock is held and another
+    writer could take the same ids in between.
+    """
+    if connection.dialect.name == 'sqlite':
+        connection.exec_driver_sql('BEGIN IMMEDIATE')
+
+
+@contextmanager
+def _fast_sqlite_writes(connection):
+    """
+    Skip the fsync after each commit on SQLite while importing.
+
+    An import that is cut short by a crash can simply be run again, so durability is not
+    needed. WAL mode is persistent, so it stays on after the import.
+    """
+    if connection.dialect.name != 'sqlite':
+        yield
+        return
+    synchronous = connection.exec_driver_sql('PRAGMA synchronous').scalar()
+    connection.exec_driver_sql('PRAGMA journal_mode=WAL')
+    connection.exec_driver_sql('PRAGMA synchronous=OFF')
+    connection.commit()
+    try:
+        yield
+    finally:
+        connection.rollback()
+        connection.exec_driver_sql(f'PRAGMA synchronous={int(synchronous)}')
+        connection.commit()
+
+
+def _copy_rows(connection, table, columns, rows):
+    """Load rows (tuples in the order of columns) with COPY on PostgreSQL and executemany elsewhere."""
+    if not rows:
+        return
+    if connection.dialect.name != 'postgresql':
+        # Straight to the driver; SQLAlchemy's per-row parameter processing costs more than the insert
+        marker = '?' if connection.dialect.paramstyle == 'qmark' else '%s'
+        connection.exec_driver_sql(
+            f"INSERT INTO {table.name} ({', '.join(columns)}) VALUES ({', '.join([marker] * len(columns))})", rows
+        )
+        return
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow(['' if value is None else value for value in row])
+    buffer.seek(0)
+    cursor = connection.connection.dbapi_connection.cursor()
+    try:
+        cursor.copy_expert(
+            f"COPY {table.name} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", buffer
+        )
+    finally:
+        cursor.close()
+
+
+def _import_batch(connection, records, source_dataset, now):
+    prompt_table = Prompt.__table__
+    # Bind the timestamp once as the driver expects it, e.g. a string on SQLite
+    created_at = prompt_table.c.created_at.type.dialect_impl(connection.dialect).bind_processor(connection.dialect)
+    now = created_at(now) if created_at else now
+
+    # Drop records without an id, duplicates within the batch and those already imported
+    batch = {}
+    for record in records:
+        source_id = _field(record, 'source_id')
+        if source_id and source_id not in batch:
+            batch[source_id] = record
+    if batch:
+        existing = connection.execute(
+            db.select(prompt_table.c.source_id).where(prompt_table.c.source_id.in_(list(batch)))
+        ).scalars()
+        for source_id in existing:
+            del batch[source_id]
+    skipped = len(records) - len(batch)
+    if not batch:
+        return 0, skipped, 0
+
+    # Parents that were imported in earlier batches or runs
+    positions = {}
+    missing_parents = {_field(r, 'parent_source_id') for r in batch.values()} - set(batch) - {None}
+    if missing_parents:
+        positions = {
+            source_id: (prompt_id, root_id, path)
+            for source_id, prompt_id, root_id, path in connection.execute(
+                db.select(prompt_table.c.source_id, prompt_table.c.id, prompt_table.c.root_id, prompt_table.c.path)
+                .where(prompt_table.c.source_id.in_(missing_parents))
+            )
+        }
+
+    prompt_ids = iter(_allocate_ids(connection, prompt_table, len(batch)))
+    prompt_rows, references = [], []
+    orphaned = 0
+    for source_id, record in batch.items():
+        parent_source_id = _field(record, 'parent_source_id')
+        if parent_source_id is None:
+            parent = None
+        elif parent_source_id in positions:
+            parent = positions[parent_source_id]
+        else:
+            # Importing a reply without its parent as a conversation of its own would corrupt the tree
+            orphaned += 1
+            continue
+        prompt_id = next(prompt_ids)
+        if parent:
+            parent_id, root_id, path = parent[0], parent[1], (parent[2] or '') + tree_path_segment(prompt_id)
+        else:
+            parent_id, root_id, path = None, prompt_id, tree_path_segment(prompt_id)
+        positions[source_id] = (prompt_id, root_id, path)
+
+        is_synthetic = _is_synthetic(record)
+        # In the order of PROMPT_COLUMNS
+        prompt_rows.append((
+            prompt_id, parent_id, root_id, path, _field(record, 'language'), _field(record, 'prompt_text'),
+            is_synthetic, source_id, record.get('model_used'), record.get('source_dataset') or source_dataset,
+            False, False, 'model' if is_synthetic else None, now,
+        ))
+        for reference in _references(record):
+            references.append((prompt_id, reference))
+
+    reference_rows, link_rows = [], []
+    for reference_id, (prompt_id, reference) in zip(
+            _allocate_ids(connection, Reference.__table__, len(references)), references):
+        reference_rows.append((reference_id, reference['reference_link'], reference['reference_text'], now))
+        link_rows.append((prompt_id, reference_id))
+
+    _copy_rows(connection, prompt_table, PROMPT_COLUMNS, prompt_rows)
+    _copy_rows(connection, Reference.__table__, REFERENCE_COLUMNS, reference_rows)
+    _copy_rows(connection, prompt_references, PROMPT_REFERENCE_COLUMNS, link_rows)
+    return len(prompt_rows), skipped, orphaned
+
+
+def import_prompts(records: Iterable[Dict[str, Any]], source_dataset: Optional[str] = None,
+                   batch_size: int = IMPORT_BATCH_SIZE,
+                   progress: Optional[Callable[[int, int, float], None]] = None) -> Dict[str, Any]:
+    """
+    Bulk insert prompts and their references from an iterable of records, one batch at a time.
+
+    Each record needs a source_id (or message_id). Records whose source_id is already in the
+    database are skipped, so an interrupted import can simply be run again. A record's
+    parent_source_id (or parent_id) links it to a parent imported earlier in the stream.
+    Records whose parent is not found are not imported and are counted as orphaned.
+
+    Args:
+    records (Iterable[Dict[str, Any]]): Records as produced by read_records.
+    source_dataset (Optional[str]): Dataset name for records that do not have their own.
+    batch_size (int): Records per transaction.
+    progress (Optional[Callable[[int, int, float], None]]): Called after each batch with
+        (imported, skipped, seconds elapsed).
+
+    Returns:
+    Dict[str, Any]: Counts of imported, skipped and orphaned records and the elapsed time.
+    """
+    imported = skipped = orphaned = 0
+    start = time.perf_counter()
+    records = iter(records)
+    with db.engine.connect() as connection, _fast_sqlite_writes(connection):
+        while True:
+            batch = list(islice(records, batch_size))
+            if not batch:
+                break
+            _begin_batch(connection)
+            batch_imported, batch_skipped, batch_orphaned = _import_batch(
+                connection, batch, source_dataset, datetime.utcnow()
+            )
+            connection.commit()
+            imported += batch_imported
+            skipped += batch_skipped
+            orphaned += batch_orphaned
+            if progress:
+                progress(imported, skipped, time.perf_counter() - start)
+    return {'imported': imported, 'skipped': skipped, 'orphaned': orphaned, 'seconds': time.perf_counter() - start}
@@ -0,0 +1,267 @@
+import json
+import os
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+from sqlalchemy import or_, select
+from app import db
+from app.models import (Evaluation, EvaluationTask, ExportWatermark, Prompt, RankingTask, RankingTaskItem,
+                        Reference, prompt_references)
+
+# Conversation trees assembled per round trip; memory use is bounded by this, not the table size
+EXPORT_BATCH_SIZE = 500
+
+
+def _isoformat(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+PROMPT_EXPORT_COLUMNS = [
+    Prompt.id, Prompt.parent_id, Prompt.root_id, Prompt.language, Prompt.prompt_text,
+    Prompt.is_synthetic, Prompt.model_used, Prompt.source_id, Prompt.source_dataset,
+    Prompt.is_revision, Prompt.revised_prompt_id, Prompt.revision_author_type,
+    Prompt.revision_author_id, Prompt.created_at
+]
+
+
+def _prompt_record(row):
+    return {
+        'id': row.id,
+        'parent_id': row.parent_id,
+        'root_id': row.root_id,
+        'role': 'assistant' if row.is_synthetic else 'user',
+        'text': row.prompt_text,
+        'language': row.language,
+        'model_used': row.model_used,
+        'source_id': row.source_id,
+        'source_dataset': row.source_dataset,
+        'is_revision': bool(row.is_revision),
+        'revised_prompt_id': row.revised_prompt_id,
+        'revision_author_type': row.revision_author_type,
+        'revision_author_id': row.revision_author_id,
+        'created_at': _isoformat(row.created_at),
+    }
+
+
+def _ranking_items(task_ids):
+    """Candidate prompt ids in display order and the ranking, best first, for each task."""
+    items = {}
+    if not task_ids:
+        return items
+    for task_id, prompt_id, rank in db.session.execute(
+        select(RankingTaskItem.task_id, RankingTaskItem.prompt_id, RankingTaskItem.rank)
+        .where(RankingTaskItem.task_id.in_(task_ids))
+        .order_by(RankingTaskItem.task_id, RankingTaskItem.position)
+    ):
+        prompt_ids, ranks = items.setdefault(task_id, ([], {}))
+        prompt_ids.append(prompt_id)
+        if rank is not None:
+            ranks[prompt_id] = rank
+    return {
+        task_id: (prompt_ids, sorted(ranks, key=ranks.get)) for task_id, (prompt_ids, ranks) in items.items()
+    }
+
+
+def _load_trees(root_ids: List[int]) -> List[Dict[str, Any]]:
+    """Assemble the conversation trees for a batch of roots with one query per table."""
+    prompts = db.session.execute(
+        select(*PROMPT_EXPORT_COLUMNS).where(Prompt.root_id.in_(root_ids)).order_by(Prompt.root_id, Prompt.path)
+    )
+
+    references = defaultdict(list)
+    for prompt_id, link, text in db.session.execute(
+        select(prompt_references.c.prompt_id, Reference.reference_link, Reference.reference_text)
+        .join(Reference, Reference.id == prompt_references.c.reference_id)
+        .join(Prompt, Prompt.id == prompt_references.c.prompt_id)
+        .where(Prompt.root_id.in_(root_ids))
+    ):
+        references[prompt_id].append({'link': link, 'text': text})
+
+    evaluations = defaultdict(list)
+    for prompt_id, task_type, value, user_id, created_at in db.session.execute(
+        select(EvaluationTask.prompt_id, EvaluationTask.task_type, Evaluation.value,
+               Evaluation.user_id, Evaluation.created_at)
+        .join(Evaluation, Evaluation.task_id == EvaluationTask.id)
+        .join(Prompt, Prompt.id == EvaluationTask.prompt_id)
+        .where(Prompt.root_id.in_(root_ids))
+    ):
+        evaluations[prompt_id].append({
+            'task_type': task_type, 'value': value, 'user_id': user_id, 'created_at': _isoformat(created_at)
+        })
+
+    tasks = db.session.execute(
+        select(RankingTask.id, RankingTask.parent_prompt_id, RankingTask.user_id, RankingTask.completed_at)
+        .join(Prompt, Prompt.id == RankingTask.parent_prompt_id)
+        .where(Prompt.root_id.in_(root_ids))
+        .order_by(RankingTask.id)
+    ).all()
+    items = _ranking_items([task.id for task in tasks])
+    rankings = defaultdict(list)
+    for task in tasks:
+        prompt_ids, ranking = items.get(task.id, ([], []))
+        if ranking:
+            rankings[task.parent_prompt_id].append({
+                'prompt_ids': prompt_ids, 'ranking': ranking,
+                'user_id': task.user_id, 'completed_at': _isoformat(task.completed_at)
+            })
+
+    # Rows come ordered by path, so every parent is seen before its replies
+    trees, nodes = [], {}
+    for row in prompts:
+        node = _prompt_record(row)
+        node.update({
+            'references': references.get(row.id, []),
+            'evaluations': evaluations.get(row.id, []),
+            'rankings': rankings.get(row.id, []),
+            'replies': [],
+        })
+        nodes[row.id] = node
+        parent = nodes.get(row.parent_id)
+        if parent is not None:
+            parent['replies'].append(node)
+        else:
+            trees.append(node)
+    return trees
+
+
+def iter_conversation_trees(language: Optional[str] = None,
+                            batch_size: int = EXPORT_BATCH_SIZE) -> Iterator[Dict[str, Any]]:
+    """
+    Yield every conversation tree, one root prompt at a time, with its references, evaluations and rankings.
+
+    Root ids are read through a server-side cursor and the trees are loaded in batches of batch_size,
+    so memory use stays flat however many prompts there are.
+
+    Args:
+    language (Optional[str]): Only export conversations whose first prompt is in this language.
+    batch_size (int): Conversation trees loaded per batch.
+
+    Returns:
+    Iterator[Dict[str, Any]]: Nested trees; each message has its replies under 'replies'.
+    """
+    query = select(Prompt.id).where(Prompt.parent_id.is_(None)).order_by(Prompt.id)
+    if language:
+        query = query.where(Prompt.language == language)
+
+    roots = db.session.execute(query.execution_options(yield_per=batch_size))
+    for partition in roots.partitions():
+        yield from _load_trees([root_id for root_id, in partition])
+
+
+def iter_jsonl(trees: Iterable[Dict[str, Any]]) -> Iterator[str]:
+    """Serialize trees as JSON Lines."""
+    for tree in trees:
+        yield json.dumps(tree, ensure_ascii=False) + '\n'
+
+
+def _new_prompts(watermark, cutoff, limit):
+    rows = db.session.execute(
+        select(*PROMPT_EXPORT_COLUMNS)
+        .where(Prompt.id > watermark.last_prompt_id, Prompt.created_at < cutoff)
+        .order_by(Prompt.id).limit(limit)
+    ).all()
+    if rows:
+        watermark.last_prompt_id = rows[-1].id
+    return [_prompt_record(row) for row in rows]
+
+
+def _new_evaluations(watermark, cutoff, limit):
+    rows = db.session.execute(
+        select(Evaluation.id, EvaluationTask.prompt_id, EvaluationTask.task_type, Evaluation.value,
+               Evaluation.user_id, Evaluation.created_at)
+        .join(EvaluationTask, EvaluationTask.id == Evaluation.task_id)
+        .where(Evaluation.id > watermark.last_evaluation_id, Evaluation.created_at < cutoff)
+        .order_by(Evaluation.id).limit(limit)
+    ).all()
+    if rows:
+        watermark.last_evaluation_id = rows[-1].id
+    return [{
+        'id': row.id, 'prompt_id': row.prompt_id, 'task_type': row.task_type, 'value': row.value,
+        'user_id': row.user_id, 'created_at': _isoformat(row.created_at)
+    } for row in rows]
+
+
+def _new_rankings(watermark, cutoff, limit):
+    query = select(
+        RankingTask.id, RankingTask.parent_prompt_id, RankingTask.revised_prompt_id, RankingTask.user_id,
+        RankingTask.created_at, RankingTask.completed_at
+    ).where(RankingTask.completed_at < cutoff)
+    if watermark.last_ranking_completed_at is not None:
+        # The leading >= lets the (completed_at, id) index bound the scan
+        query = query.where(RankingTask.completed_at >= watermark.last_ranking_completed_at, or_(
+            RankingTask.completed_at > watermark.last_ranking_completed_at,
+            RankingTask.id > watermark.last_ranking_task_id
+        ))
+    rows = db.session.execute(query.order_by(RankingTask.completed_at, RankingTask.id).limit(limit)).all()
+    if rows:
+        watermark.last_ranking_completed_at = rows[-1].completed_at
+        watermark.last_ranking_task_id = rows[-1].id
+    items = _ranking_items([row.id for row in rows])
+    return [{
+        'id': row.id, 'parent_prompt_id': row.parent_prompt_id, 'prompt_ids': items.get(row.id, ([], []))[0],
+        'ranking': items.get(row.id, ([], []))[1], 'revised_prompt_id': row.revised_prompt_id,
+        'user_id': row.user_id, 'created_at': _isoformat(row.created_at), 'completed_at': _isoformat(row.completed_at)
+    } for row in rows]
+
+
+INCREMENTAL_STREAMS = {
+    'prompts': _new_prompts,
+    'evaluations': _new_evaluations,
+    'rankings': _new_rankings,
+}
+
+
+def _write_shard(path, records):
+    # Written under a temporary name so readers never see a partial shard
+    with open(path + '.tmp', 'w', encoding='utf-8') as shard:
+        for record in records:
+            shard.write(json.dumps(record, ensure_ascii=False) + '\n')
+        shard.flush()
+        os.fsync(shard.fileno())
+    os.replace(path + '.tmp', path)
+
+
+def export_increment(consumer: str, output_dir: str, shard_size: int = 100000,
+                     settle_seconds: float = 60) -> Dict[str, List[str]]:
+    """
+    Write the prompts, evaluations and completed rankings a consumer has not seen yet as new JSONL shards.
+
+    Each consumer's position is kept in ExportWatermark and only moves forward once a shard has been
+    written, so an interrupted run is picked up where it stopped. A shard may be written again if the
+    process dies between writing it and committing the watermark, so readers should dedupe on id.
+
+    Args:
+    consumer (str): Name of the downstream pipeline reading the shards.
+    output_dir (str): Directory the shards are written to; shard names sort in the order written.
+    shard_size (int): Maximum records per shard.
+    settle_seconds (float): Rows newer than this are left for the next run, so rows from transactions
+        that commit out of id order are not skipped.
+
+    Returns:
+    Dict[str, List[str]]: Paths of the shards written, per stream.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    watermark = db.session.get(ExportWatermark, consumer)
+    if watermark is None:
+        watermark = ExportWatermark(consumer=consumer, last_prompt_id=0, last_evaluation_id=0, last_ranking_task_id=0)
+        db.session.add(watermark)
+
+    started = datetime.utcnow()
+    cutoff = started - timedelta(seconds=settle_seconds)
+    shards = {}
+    for stream, fetch in INCREMENTAL_STREAMS.items():
+        shards[stream] = []
+        while True:
+            records = fetch(watermark, cutoff, shard_size)
+            if not records:
+                break
+            path = os.path.join(
+                output_dir, f"{stream}-{started:%Y%m%dT%H%M%S}-{len(shards[stream]):05d}.jsonl"
+            )
+            _write_shard(path, records)
+            db.session.commit()
+            shards[stream].append(path)
+            if len(records) < shard_size:
+                break
+    db.session.commit()
+    return shards
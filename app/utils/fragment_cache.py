@@ -0,0 +1,137 @@
+import hashlib
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Optional
+from flask import current_app
+
+# The filesystem backend checks its size every this many writes
+EVICTION_CHECK_INTERVAL = 100
+
+
+class FragmentCache:
+    """Base class skipping fragments larger than the whole cache; subclasses implement _get and _set."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+
+    def get(self, key: str) -> Optional[str]:
+        return self._get(key)
+
+    def set(self, key: str, html: str) -> None:
+        size = len(html.encode('utf-8'))
+        if size <= self.max_bytes:
+            self._set(key, html, size)
+
+
+class MemoryFragmentCache(FragmentCache):
+    """Per-process cache."""
+
+    def __init__(self, max_bytes: int):
+        super().__init__(max_bytes)
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def _get(self, key):
+        with self._lock:
+            html = self._entries.get(key)
+            if html is not None:
+                self._entries.move_to_end(key)
+            return html
+
+    def _set(self, key, html, size):
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._size -= len(previous.encode('utf-8'))
+            self._entries[key] = html
+            self._size += size
+            while self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted.encode('utf-8'))
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class FilesystemFragmentCache(FragmentCache):
+    """One file per fragment in a directory shared by every worker on the machine."""
+
+    def __init__(self, directory: str, max_bytes: int):
+        super().__init__(max_bytes)
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._writes = 0
+        self._lock = threading.Lock()
+
+    def _path(self, key):
+        return os.path.join(self.directory, hashlib.sha256(key.encode('utf-8')).hexdigest() + '.html')
+
+    def _get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, encoding='utf-8') as fragment:
+                html = fragment.read()
+            # The modification time doubles as the last use for eviction
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return html
+
+    def _set(self, key, html, size):
+        # Written under a temporary name so other workers never read a partial fragment
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as fragment:
+            fragment.write(html)
+        os.replace(tmp_path, self._path(key))
+        with self._lock:
+            self._writes += 1
+            check = self._writes % EVICTION_CHECK_INTERVAL == 0
+        if check:
+            self._evict()
+
+    def _evict(self):
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.html'):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        size = sum(entry[1] for entry in entries)
+        for _, entry_size, path in sorted(entries):
+            if size <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            size -= entry_size
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_fragment_cache() -> Optional[FragmentCache]:
+    """
+    Get the process-wide fragment cache, or None if fragment caching is off.
+
+    Configured with FRAGMENT_CACHE_BACKEND ('memory', 'filesystem' or 'none'),
+    FRAGMENT_CACHE_DIR and FRAGMENT_CACHE_MAX_BYTES.
+    """
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            backend = current_app.config['FRAGMENT_CACHE_BACKEND']
+            max_bytes = current_app.config['FRAGMENT_CACHE_MAX_BYTES']
+            if backend == 'memory':
+                _cache = MemoryFragmentCache(max_bytes)
+            elif backend == 'filesystem':
+                _cache = FilesystemFragmentCache(current_app.config['FRAGMENT_CACHE_DIR'], max_bytes)
+            elif backend != 'none':
+                raise ValueError(f"Unknown FRAGMENT_CACHE_BACKEND: {backend}")
+        return _cache
@@ -0,0 +1,227 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Optional
+
+# Log the hit rate every this many lookups
+STATS_LOG_INTERVAL = 100
+
+
+def make_cache_key(model: str, messages: Any, params: Dict[str, Any], seed: Any = None) -> str:
+    """
+    Hash everything that determines a completion into a cache key.
+
+    Postfixes are part of the key through the system message they add to `messages`.
+    Pass a different `seed` to get distinct entries for otherwise identical requests.
+    """
+    payload = json.dumps(
+        {'model': model, 'messages': messages, 'params': params, 'seed': seed},
+        sort_keys=True, ensure_ascii=False, default=str
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class LLMCache:
+    """Base class keeping hit/miss counters; subclasses implement _get and _set."""
+
+    # Backends whose lookups wait on IO; aget and aset run them on self._executor
+    blocking = False
+
+    def __init__(self, max_entries: int, ttl_seconds: Optional[float]):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._stats_lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        value = self._get(key)
+        self._count(value is not None)
+        return value
+
+    def set(self, key: str, value: str) -> None:
+        self._set(key, value)
+
+    async def aget(self, key: str) -> Optional[str]:
+        """get for coroutines, which must not hold up the event loop they share."""
+        if self.blocking:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, self.get, key)
+        return self.get(key)
+
+    async def aset(self, key: str, value: str) -> None:
+        """set for coroutines, which must not hold up the event loop they share."""
+        if self.blocking:
+            await asyncio.get_running_loop().run_in_executor(self._executor, self.set, key, value)
+        else:
+            self.set(key, value)
+
+    def _count(self, hit: bool) -> None:
+        with self._stats_lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+            lookups = self.hits + self.misses
+        if lookups % STATS_LOG_INTERVAL == 0:
+            logging.info(f"LLM cache: {self.stats()}")
+
+    def _expired(self, created_at: float) -> bool:
+        return self.ttl_seconds is not None and time.time() - created_at > self.ttl_seconds
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            'backend': self.__class__.__name__,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'entries': len(self),
+        }
+
+
+class MemoryLRUCache(LLMCache):
+    """Per-process cache evicting the least recently used entry once full."""
+
+    def __init__(self, max_entries: int = 10000, ttl_seconds: Optional[float] = None):
+        super().__init__(max_entries, ttl_seconds)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, created_at = entry
+            if self._expired(created_at):
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def _set(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, time.time())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SQLiteCache(LLMCache):
+    """
+    On-disk cache shared by every process on the machine, evicting least recently used entries.
+
+    Hits and misses are also added up in the database, so stats() reports the totals of every
+    process using the file rather than those of the calling process only.
+    """
+
+    blocking = True
+
+    def __init__(self, path: str, max_entries: int = 100000, ttl_seconds: Optional[float] = None):
+        super().__init__(max_entries, ttl_seconds)
+        self.path = path
+        self._local = threading.local()
+        # One thread, so a process's lookups from the event loop do not wait on each other's locks
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='llm-cache')
+        with self._connection() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS ix_llm_cache_accessed_at ON llm_cache (accessed_at)")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache_stats ("
+                "id INTEGER PRIMARY KEY CHECK (id = 1), hits INTEGER NOT NULL, misses INTEGER NOT NULL)"
+            )
+            connection.execute("INSERT OR IGNORE INTO llm_cache_stats (id, hits, misses) VALUES (1, 0, 0)")
+
+    def _connection(self):
+        # sqlite3 connections cannot be shared between threads
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.execute("PRAGMA journal_mode=WAL")
+            self._local.connection = connection
+        return connection
+
+    def _get(self, key):
+        connection = self._connection()
+        row = connection.execute("SELECT value, created_at FROM llm_cache WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        value, created_at = row
+        with connection:
+            if self._expired(created_at):
+                connection.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                return None
+            connection.execute("UPDATE llm_cache SET accessed_at = ? WHERE key = ?", (time.time(), key))
+        return value
+
+    def _set(self, key, value):
+        now = time.time()
+        with self._connection() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, value, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, value, now, now)
+            )
+            connection.execute(
+                "DELETE FROM llm_cache WHERE key IN ("
+                "SELECT key FROM llm_cache ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+
+    def _count(self, hit):
+        column = 'hits' if hit else 'misses'
+        with self._connection() as connection:
+            connection.execute(f"UPDATE llm_cache_stats SET {column} = {column} + 1")
+        super()._count(hit)
+
+    def stats(self):
+        stats = super().stats()
+        hits, misses = self._connection().execute("SELECT hits, misses FROM llm_cache_stats").fetchone()
+        lookups = hits + misses
+        stats.update(hits=hits, misses=misses, hit_rate=hits / lookups if lookups else 0.0)
+        return stats
+
+    def __len__(self):
+        return self._connection().execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_llm_cache() -> Optional[LLMCache]:
+    """
+    Get the process-wide LLM response cache, or None if caching is off.
+
+    Configured from the environment:
+    LLM_CACHE_BACKEND: 'memory' or 'sqlite'; unset disables the cache.
+    LLM_CACHE_PATH: database file for the sqlite backend (default llm_cache.db).
+    LLM_CACHE_MAX_ENTRIES: entries kept before evicting the least recently used.
+    LLM_CACHE_TTL_SECONDS: entries older than this are ignored and removed.
+    """
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            backend = os.getenv('LLM_CACHE_BACKEND')
+            max_entries = int(os.getenv('LLM_CACHE_MAX_ENTRIES', 10000))
+            ttl = os.getenv('LLM_CACHE_TTL_SECONDS')
+            ttl_seconds = float(ttl) if ttl else None
+            if backend == 'memory':
+                _cache = MemoryLRUCache(max_entries, ttl_seconds)
+            elif backend == 'sqlite':
+                _cache = SQLiteCache(os.getenv('LLM_CACHE_PATH', 'llm_cache.db'), max_entries, ttl_seconds)
+            elif backend:
+                raise ValueError(f"Unknown LLM_CACHE_BACKEND: {backend}")
+        return _cache
@@ -1,63 +1,202 @@
-from together import Together
-from typing import List, Dict
+from together import AsyncTogether
+from typing import Any, AsyncIterator, Iterator, List, Dict, Optional, Tuple
+import asyncio
+import queue
 import os
+import threading
+import weakref
 from dotenv import load_dotenv
+from app.utils.llm_cache import get_llm_cache, make_cache_key
 
 # Load environment variables from .env file
 load_dotenv()
 
-def generate_llm_response(chat_history: List[Dict[str, str]], references: List[str]) -> str:
+MODEL = "meta-llama/Meta-Llama-3.1-405B-Instruct-Turbo"
+SAMPLING_PARAMS = {
+    'max_tokens': 512,
+    'temperature': 0.7,
+    'top_p': 0.7,
+    'top_k': 50,
+    'repetition_penalty': 1,
+    'stop': ["<|eot_id|>","<|eom_id|>"],
+}
+
+# One client per event loop, so HTTP connections are kept alive and reused between calls
+_clients = weakref.WeakKeyDictionary()
+
+# Background event loop that serves the synchronous wrappers
+_loop = None
+_loop_lock = threading.Lock()
+
+def get_async_client() -> AsyncTogether:
+    """Get the Together client for the running event loop, creating it on first use."""
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None:
+        # Get the API key from the environment variable
+        api_key = os.getenv('TOGETHER_API_KEY')
+
+        if not api_key:
+            raise ValueError("TOGETHER_API_KEY not found in environment variables")
+
+        # TOGETHER_BASE_URL can point the client at any OpenAI-compatible server
+        client = AsyncTogether(api_key=api_key, base_url=os.getenv('TOGETHER_BASE_URL') or None)
+        _clients[loop] = client
+    return client
+
+def _get_loop() -> asyncio.AbstractEventLoop:
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name='llm-event-loop', daemon=True).start()
+    return _loop
+
+def run_on_llm_loop(coroutine):
+    """Run a coroutine on the shared background event loop and wait for its result."""
+    return asyncio.run_coroutine_threadsafe(coroutine, _get_loop()).result()
+
+def _prepare_messages(chat_history: List[Dict[str, str]], references: List[str]) -> List[Dict[str, str]]:
+    messages = [dict(message) for message in chat_history]
+
+    # Add references to the last user message if available
+    if references and messages[-1]['role'] == 'user':
+        reference_text = "\n\nReferences:\n" + "\n".join(references)
+        messages[-1]['content'] += reference_text
+    return messages
+
+async def agenerate_llm_response(chat_history: List[Dict[str, str]], references: List[str],
+                                 use_cache: bool = True, cache_seed: Any = None) -> str:
     """
     Generate a response using the Together API with the given chat history and references.
 
     Args:
     chat_history (List[Dict[str, str]]): List of previous messages in the chat.
     references (List[str]): List of possible references to include in the prompt.
+    use_cache (bool): Whether to use the response cache, if one is configured.
+    cache_seed (Any): Added to the cache key so identical requests can get distinct responses.
 
     Returns:
     str: The generated response from the LLM.
     """
-    # Get the API key from the environment variable
-    api_key = os.getenv('TOGETHER_API_KEY')
-
-    if not api_key:
-        raise ValueError("TOGETHER_API_KEY not found in environment variables")
-
-    client = Together(api_key=api_key)
+    client = get_async_client()
 
     # Prepare the messages for the API call
-    messages = chat_history.copy()
+    messages = _prepare_messages(chat_history, references)
 
-    # Add references to the last user message if available
-    if references and messages[-1]['role'] == 'user':
-        reference_text = "\n\nReferences:\n" + "\n".join(references)
-        messages[-1]['content'] += reference_text
+    cache = get_llm_cache() if use_cache else None
+    if cache is not None:
+        cache_key = make_cache_key(MODEL, messages, SAMPLING_PARAMS, cache_seed)
+        cached_response = await cache.aget(cache_key)
+        if cached_response is not None:
+            return cached_response
 
     try:
-        response = client.chat.completions.create(
-            model="meta-llama/Meta-Llama-3.1-405B-Instruct-Turbo",
+        response = await client.chat.completions.create(
+            model=MODEL,
             messages=messages,
-            max_tokens=512,
-            temperature=0.7,
-            top_p=0.7,
-            top_k=50,
-            repetition_penalty=1,
-            stop=["<|eot_id|>","<|eom_id|>"],
-            stream=True
+            **SAMPLING_PARAMS
         )
 
-        # Collect the streamed response
-        full_response = ""
-        for chunk in response:
-            if hasattr(chunk, 'choices'):
-                full_response += chunk.choices[0].delta.content or ""
-
-        return full_response.strip()
+        # Not streamed: the SDK drops the connection when a stream ends, which defeats keep-alive
+        full_response = (response.choices[0].message.content or "").strip()
+        if cache is not None and full_response:
+            await cache.aset(cache_key, full_response)
+        return full_response
 
     except Exception as e:
         print(f"Error calling Together API: {str(e)}")
         return ""
 
+async def agenerate_llm_responses(requests: List[Tuple[List[Dict[str, str]], List[str]]],
+                                  use_cache: bool = True, distinct: bool = False,
+                                  timeout: Optional[float] = None) -> List[str]:
+    """
+    Generate several responses concurrently on the current event loop.
+
+    Args:
+    requests (List[Tuple[List[Dict[str, str]], List[str]]]): (chat_history, references) pairs.
+    use_cache (bool): Whether to use the response cache, if one is configured.
+    distinct (bool): Seed the cache key with each request's position, so repeated identical
+        requests are not all answered with the same cached response.
+    timeout (Optional[float]): Seconds to wait; requests still running then are cancelled
+        and get an empty response.
+
+    Returns:
+    List[str]: The generated responses, in the same order as the requests.
+    """
+    tasks = [
+        asyncio.ensure_future(agenerate_llm_response(chat_history, references, use_cache, index if distinct else None))
+        for index, (chat_history, references) in enumerate(requests)
+    ]
+    if not tasks:
+        return []
+
+    done, pending = await asyncio.wait(tasks, timeout=timeout)
+    for task in pending:
+        task.cancel()
+    return [task.result() if task in done else "" for task in tasks]
+
+def generate_llm_response(chat_history: List[Dict[str, str]], references: List[str],
+                          use_cache: bool = True, cache_seed: Any = None) -> str:
+    """Synchronous wrapper around agenerate_llm_response."""
+    return run_on_llm_loop(agenerate_llm_response(chat_history, references, use_cache, cache_seed))
+
+def generate_llm_responses(requests: List[Tuple[List[Dict[str, str]], List[str]]],
+                           use_cache: bool = True, distinct: bool = False,
+                           timeout: Optional[float] = None) -> List[str]:
+    """Synchronous wrapper around agenerate_llm_responses."""
+    return run_on_llm_loop(agenerate_llm_responses(requests, use_cache, distinct, timeout))
+
+async def astream_llm_response(chat_history: List[Dict[str, str]], references: List[str]) -> AsyncIterator[str]:
+    """
+    Stream a response from the Together API chunk by chunk as it is generated.
+
+    Unlike agenerate_llm_response this does not use the cache and lets API errors propagate,
+    so callers can tell the user that generation failed.
+    """
+    client = get_async_client()
+    messages = _prepare_messages(chat_history, references)
+
+    response = await client.chat.completions.create(
+        model=MODEL,
+        messages=messages,
+        stream=True,
+        **SAMPLING_PARAMS
+    )
+    async for chunk in response:
+        if hasattr(chunk, 'choices') and chunk.choices:
+            content = chunk.choices[0].delta.content
+            if content:
+                yield content
+
+def stream_llm_response(chat_history: List[Dict[str, str]], references: List[str]) -> Iterator[str]:
+    """Synchronous iterator over astream_llm_response, driven by the shared background event loop."""
+    chunks = queue.Queue()
+    finished = object()
+
+    async def produce():
+        try:
+            async for content in astream_llm_response(chat_history, references):
+                chunks.put(content)
+        except Exception as e:
+            chunks.put(e)
+        finally:
+            chunks.put(finished)
+
+    future = asyncio.run_coroutine_threadsafe(produce(), _get_loop())
+    try:
+        while True:
+            item = chunks.get()
+            if item is finished:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        # Stop generating if the consumer went away early
+        future.cancel()
+
 # Example usage:
 if __name__ == "__main__":
     chat_history = [
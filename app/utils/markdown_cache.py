@@ -0,0 +1,45 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Optional
+import markdown
+
+# Rendered messages kept per process; a long LLM response renders to a few kilobytes of HTML
+MAX_ENTRIES = 5000
+
+_entries = OrderedDict()
+_lock = threading.Lock()
+
+
+def _key(text):
+    return hashlib.sha256(text.encode('utf-8')).digest()
+
+
+def remember_markdown(text: str, html: str) -> None:
+    """Add already rendered HTML, e.g. Prompt.prompt_html loaded from the database, to the cache."""
+    key = _key(text)
+    with _lock:
+        _entries[key] = html
+        _entries.move_to_end(key)
+        while len(_entries) > MAX_ENTRIES:
+            _entries.popitem(last=False)
+
+
+def render_markdown(text: Optional[str]) -> str:
+    """Render Markdown to HTML, reusing the result for text rendered before by this process."""
+    if not text:
+        return ''
+    key = _key(text)
+    with _lock:
+        html = _entries.get(key)
+        if html is not None:
+            _entries.move_to_end(key)
+            return html
+    html = markdown.markdown(text)
+    remember_markdown(text, html)
+    return html
+
+
+def clear_markdown_cache() -> None:
+    with _lock:
+        _entries.clear()
@@ -0,0 +1,227 @@
+import math
+import threading
+from datetime import datetime, timedelta
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+import numpy as np
+from flask import current_app
+from sqlalchemy import and_, or_, select
+from app import db
+from app.models import Prompt, RankingTask, RankingTaskItem
+
+# Completed ranking tasks loaded per query when refreshing scores
+REFRESH_BATCH_SIZE = 50000
+# Virtual wins and losses every player gets against an average opponent, so unbeaten
+# and winless players still get finite scores
+PRIOR_COMPARISONS = 1.0
+# Bradley-Terry strengths are reported on the Elo scale, with the average player at 1500
+ELO_SCALE = 400 / math.log(10)
+ELO_BASE = 1500
+
+# What the players are when fitting: individual responses, or the postfix they were generated with
+SCORE_KEYS = {
+    'response': RankingTaskItem.prompt_id,
+    'postfix': db.func.coalesce(Prompt.postfix, ''),
+}
+
+
+def expand_pairwise(task_index: np.ndarray, player_index: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Turn rankings into pairwise comparisons: every item beats every item ranked below it in the same task.
+
+    Args:
+    task_index (np.ndarray): Task of each ranked item, sorted by task and then by rank, best first.
+    player_index (np.ndarray): Player of each item, aligned with task_index.
+
+    Returns:
+    Tuple[np.ndarray, np.ndarray]: Winner and loser player of each comparison. Comparisons of a
+    player with itself (two responses with the same postfix) are dropped.
+    """
+    if len(task_index) == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    starts = np.flatnonzero(np.r_[True, task_index[1:] != task_index[:-1]])
+    sizes = np.diff(np.r_[starts, len(task_index)])
+    position = np.arange(len(task_index)) - np.repeat(starts, sizes)
+    beaten = np.repeat(sizes, sizes) - position - 1
+
+    # Item i beats items i + 1 ... i + beaten[i]
+    winner_rows = np.repeat(np.arange(len(task_index)), beaten)
+    offsets = np.arange(len(winner_rows)) - np.repeat(np.cumsum(beaten) - beaten, beaten) + 1
+    winners = player_index[winner_rows]
+    losers = player_index[winner_rows + offsets]
+    distinct = winners != losers
+    return winners[distinct], losers[distinct]
+
+
+def count_pairs(winners: np.ndarray, losers: np.ndarray,
+                counts: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Collapse repeated (winner, loser) comparisons into one entry with a count."""
+    if counts is None:
+        counts = np.ones(len(winners))
+    keys = (winners.astype(np.int64) << 32) | losers.astype(np.int64)
+    unique_keys, inverse = np.unique(keys, return_inverse=True)
+    return unique_keys >> 32, unique_keys & 0xFFFFFFFF, np.bincount(inverse, weights=counts)
+
+
+def fit_bradley_terry(winners: np.ndarray, losers: np.ndarray, counts: np.ndarray, num_players: int,
+                      log_strengths: Optional[np.ndarray] = None, prior: float = PRIOR_COMPARISONS,
+                      max_iterations: int = 200, tolerance: float = 1e-3) -> np.ndarray:
+    """
+    Fit Bradley-Terry log strengths to weighted pairwise comparisons.
+
+    Uses Newman's fixed-point iteration (2023), which needs far fewer passes than the classic
+    MM update. Every pass is a few gathers and bincounts over the comparison arrays.
+
+    Args:
+    winners (np.ndarray): Winning player of each comparison.
+    losers (np.ndarray): Losing player of each comparison.
+    counts (np.ndarray): Number of times each comparison was observed.
+    num_players (int): Number of players; players without comparisons get the average score.
+    log_strengths (Optional[np.ndarray]): Previous fit to start from, so a refit after a few new
+        rankings converges in a handful of passes.
+    prior (float): Virtual wins and losses of every player against an opponent of strength 1.
+    max_iterations (int): Upper bound on passes.
+    tolerance (float): Stop once no log strength moves more than this.
+
+    Returns:
+    np.ndarray: Log strengths with a mean of zero.
+    """
+    strengths = np.ones(num_players)
+    if log_strengths is not None:
+        strengths[:len(log_strengths)] = np.exp(log_strengths)
+    if num_players == 0:
+        return strengths
+
+    low, high = math.exp(-tolerance), math.exp(tolerance)
+    for _ in range(max_iterations):
+        # pi_i = sum_j w_ij pi_j / (pi_i + pi_j) / sum_j w_ji / (pi_i + pi_j), the prior being
+        # one more opponent of strength 1. The prior also fixes the scale, so no renormalizing.
+        loser_strengths = strengths[losers]
+        pair_weights = counts / (strengths[winners] + loser_strengths)
+        virtual = prior / (strengths + 1)
+        updated = np.bincount(winners, weights=pair_weights * loser_strengths, minlength=num_players) + virtual
+        updated /= np.bincount(losers, weights=pair_weights, minlength=num_players) + virtual
+        ratio = updated / strengths
+        strengths = updated
+        if ratio.max() < high and ratio.min() > low:
+            break
+    log_strengths = np.log(strengths)
+    return log_strengths - log_strengths.mean()
+
+
+class RankingScores:
+    """Bradley-Terry scores fitted to completed ranking tasks, refreshed with only the tasks completed since."""
+
+    def __init__(self, key_column, settle_seconds: float = 60):
+        self.key_column = key_column
+        # Tasks completed more recently than this are left for a later refresh, so a task whose
+        # transaction commits after a newer one has been read is not skipped by the watermark
+        self.settle_seconds = settle_seconds
+        self.cutoff = None
+        self.players: List[Hashable] = []
+        self.player_index: Dict[Hashable, int] = {}
+        self.winners = np.empty(0, dtype=np.int64)
+        self.losers = np.empty(0, dtype=np.int64)
+        self.counts = np.empty(0)
+        self.log_strengths = np.empty(0)
+        self.last_completed_at = None
+        self.last_task_id = 0
+        self.tasks = 0
+        self.lock = threading.Lock()
+
+    def _after_watermark(self):
+        settled = RankingTask.completed_at < self.cutoff
+        if self.last_completed_at is None:
+            return settled
+        # The leading >= lets the (completed_at, id) index bound the scan
+        return and_(settled, RankingTask.completed_at >= self.last_completed_at, or_(
+            RankingTask.completed_at > self.last_completed_at, RankingTask.id > self.last_task_id
+        ))
+
+    def _load_batch(self):
+        """Add the next batch of completed tasks; returns the number of ranked tasks and whether more remain."""
+        boundary = db.session.execute(
+            select(RankingTask.completed_at, RankingTask.id).where(self._after_watermark())
+            .order_by(RankingTask.completed_at, RankingTask.id).offset(REFRESH_BATCH_SIZE - 1).limit(1)
+        ).first()
+        query = select(RankingTask.id, RankingTask.completed_at, self.key_column).join(
+            RankingTaskItem, RankingTaskItem.task_id == RankingTask.id
+        ).join(Prompt, Prompt.id == RankingTaskItem.prompt_id).where(
+            self._after_watermark(), RankingTaskItem.rank.isnot(None)
+        )
+        if boundary is not None:
+            query = query.where(or_(
+                RankingTask.completed_at < boundary.completed_at,
+                and_(RankingTask.completed_at == boundary.completed_at, RankingTask.id <= boundary.id)
+            ))
+        rows = db.session.execute(
+            query.order_by(RankingTask.completed_at, RankingTask.id, RankingTaskItem.rank)
+        ).all()
+        if boundary is not None:
+            # Completed tasks without a ranking have no rows, so move past the whole batch regardless
+            self.last_completed_at, self.last_task_id = boundary.completed_at, boundary.id
+        if not rows:
+            return 0, boundary is not None
+
+        task_ids = np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+        for row in rows:
+            if row[2] not in self.player_index:
+                self.player_index[row[2]] = len(self.players)
+                self.players.append(row[2])
+        player_index = np.fromiter((self.player_index[row[2]] for row in rows), dtype=np.int64, count=len(rows))
+
+        winners, losers = expand_pairwise(task_ids, player_index)
+        self.winners, self.losers, self.counts = count_pairs(
+            np.r_[self.winners, winners], np.r_[self.losers, losers], np.r_[self.counts, np.ones(len(winners))]
+        )
+        if boundary is None:
+            self.last_completed_at, self.last_task_id = rows[-1][1], rows[-1][0]
+        new_tasks = int(np.count_nonzero(np.r_[True, task_ids[1:] != task_ids[:-1]]))
+        self.tasks += new_tasks
+        return new_tasks, boundary is not None
+
+    def refresh(self) -> int:
+        """Add the tasks completed since the last refresh and refit if there were any."""
+        with self.lock:
+            self.cutoff = datetime.utcnow() - timedelta(seconds=self.settle_seconds)
+            new_tasks, more = 0, True
+            while more:
+                loaded, more = self._load_batch()
+                new_tasks += loaded
+            if new_tasks:
+                self.log_strengths = fit_bradley_terry(
+                    self.winners, self.losers, self.counts, len(self.players), self.log_strengths
+                )
+            return new_tasks
+
+    def ratings(self) -> List[Dict[str, Any]]:
+        """Players from best to worst with their Elo-scale rating and number of comparisons."""
+        comparisons = (np.bincount(self.winners, weights=self.counts, minlength=len(self.players))
+                       + np.bincount(self.losers, weights=self.counts, minlength=len(self.players)))
+        order = np.argsort(-self.log_strengths, kind='stable')
+        return [{
+            'player': self.players[i],
+            'rating': ELO_BASE + ELO_SCALE * float(self.log_strengths[i]),
+            'comparisons': int(comparisons[i]),
+        } for i in order]
+
+
+_scores: Dict[str, RankingScores] = {}
+_scores_lock = threading.Lock()
+
+
+def get_ranking_scores(by: str = 'response') -> RankingScores:
+    """
+    Get the cached scores for this process, refreshed with any ranking tasks completed since last time.
+
+    Args:
+    by (str): 'response' to score individual responses, 'postfix' to score the PROMPT_POSTFIXES.
+
+    Returns:
+    RankingScores: Scores whose ratings() are up to date with the database.
+    """
+    with _scores_lock:
+        if by not in _scores:
+            _scores[by] = RankingScores(SCORE_KEYS[by], current_app.config['RANKING_SCORES_SETTLE_SECONDS'])
+        scores = _scores[by]
+    scores.refresh()
+    return scores
@@ -0,0 +1,71 @@
+import random
+from typing import Optional
+from sqlalchemy import func, tablesample, text
+from sqlalchemy.orm import aliased
+from app import db
+from app.models import Prompt
+
+# Below this many rows TABLESAMPLE is not worth it on PostgreSQL
+TABLESAMPLE_MIN_ROWS = 100000
+# Rough number of rows TABLESAMPLE should return to pick from
+TABLESAMPLE_TARGET_ROWS = 1000
+
+
+def _criteria(entity, language, roots_only):
+    criteria = []
+    if language is not None:
+        criteria.append(entity.language == language)
+    if roots_only:
+        criteria.append(entity.parent_id == None)
+    return criteria
+
+
+def _sample_by_id_range(language, roots_only):
+    # Jump to a random point in the id range and take the next matching row, wrapping around
+    # Separate subqueries so each is answered from the primary key index
+    min_id, max_id = db.session.query(
+        db.select(func.min(Prompt.id)).scalar_subquery(),
+        db.select(func.max(Prompt.id)).scalar_subquery()
+    ).one()
+    if min_id is None:
+        return None
+
+    criteria = _criteria(Prompt, language, roots_only)
+    start = random.randint(min_id, max_id)
+    prompt = Prompt.query.filter(*criteria, Prompt.id >= start).order_by(Prompt.id).first()
+    if prompt is None:
+        prompt = Prompt.query.filter(*criteria, Prompt.id < start).order_by(Prompt.id).first()
+    return prompt
+
+
+def _sample_with_tablesample(language, roots_only):
+    estimated_rows = db.session.execute(
+        text("SELECT reltuples FROM pg_class WHERE relname = :table"), {'table': Prompt.__tablename__}
+    ).scalar() or 0
+    if estimated_rows < TABLESAMPLE_MIN_ROWS:
+        return None
+
+    percent = min(100.0, 100.0 * TABLESAMPLE_TARGET_ROWS / estimated_rows)
+    sampled = aliased(Prompt, tablesample(Prompt.__table__, func.system(percent)))
+    # Only the few sampled rows are shuffled
+    return db.session.query(sampled).filter(
+        *_criteria(sampled, language, roots_only)
+    ).order_by(func.random()).first()
+
+
+def sample_prompt(language: Optional[str] = None, roots_only: bool = False) -> Optional[Prompt]:
+    """
+    Pick a random prompt without sorting the whole table.
+
+    Args:
+    language (Optional[str]): Only pick prompts in this language.
+    roots_only (bool): Only pick conversation starters (parent_id IS NULL).
+
+    Returns:
+    Optional[Prompt]: A random matching prompt, or None if nothing matches.
+    """
+    if db.engine.dialect.name == 'postgresql':
+        prompt = _sample_with_tablesample(language, roots_only)
+        if prompt is not None:
+            return prompt
+    return _sample_by_id_range(language, roots_only)
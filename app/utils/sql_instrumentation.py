@@ -0,0 +1,131 @@
+import hashlib
+import json
+import logging
+import re
+import time
+from collections import Counter
+from typing import List, Tuple
+from flask import g, has_app_context, request
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r'\b\d+(?:\.\d+)?\b')
+_PLACEHOLDER_LIST = re.compile(r'\(\s*(?:\?|%\(\w+\)s|%s|:\w+)(?:\s*,\s*(?:\?|%\(\w+\)s|%s|:\w+))*\s*\)')
+_PLACEHOLDER = re.compile(r'%\(\w+\)s|%s|:\w+')
+
+
+def fingerprint(statement: str) -> str:
+    """
+    Reduce a statement to its shape, so the same query with different values counts as a repeat.
+
+    Literals and bind parameters become ?, and IN lists of any length become (?...).
+    """
+    statement = ' '.join(statement.split())
+    statement = _STRING_LITERAL.sub('?', statement)
+    statement = _NUMBER_LITERAL.sub('?', statement)
+    statement = _PLACEHOLDER_LIST.sub('(?...)', statement)
+    return _PLACEHOLDER.sub('?', statement)
+
+
+class RequestQueries:
+    """The statements one request sent to the database."""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.fingerprints = Counter()
+
+    def record(self, statement: str, seconds: float) -> None:
+        self.count += 1
+        self.seconds += seconds
+        self.fingerprints[fingerprint(statement)] += 1
+
+    def repeated(self, threshold: int) -> List[Tuple[str, int]]:
+        """(fingerprint, count) of statements sent at least threshold times, most repeated first."""
+        return [(shape, count) for shape, count in self.fingerprints.most_common() if count >= threshold]
+
+
+def _short_hash(shape):
+    return hashlib.sha1(shape.encode('utf-8')).hexdigest()[:8]
+
+
+def _record(statement, start):
+    # Background threads and CLI commands have an app context but no request to report on
+    queries = g.get('sql_queries') if has_app_context() else None
+    if queries is not None:
+        queries.record(statement, time.perf_counter() - start)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # Kept on the statement's own context, so nothing is left behind on the connection when it fails
+    context.sql_query_start = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    _record(statement, context.sql_query_start)
+
+
+def _handle_error(exception_context):
+    # Statements that fail never reach after_cursor_execute, but still cost a round trip
+    context = exception_context.execution_context
+    start = getattr(context, 'sql_query_start', None)
+    if start is not None:
+        _record(exception_context.statement, start)
+
+
+def _report(queries, threshold, status):
+    repeated = queries.repeated(threshold)
+    logger.info(json.dumps({
+        'method': request.method,
+        'path': request.path,
+        'endpoint': request.endpoint,
+        'status': status,
+        'queries': queries.count,
+        'db_ms': round(queries.seconds * 1000, 1),
+        'repeated': {_short_hash(shape): count for shape, count in repeated},
+    }))
+    for shape, count in repeated:
+        logger.warning(f"Likely N+1 query on {request.endpoint}: {count}x [{_short_hash(shape)}] {shape}")
+
+
+def init_sql_instrumentation(app, engine) -> None:
+    """
+    Record the number of queries, time spent in the database and repeated statements of each request.
+
+    The totals are sent back in a Server-Timing header and logged as one JSON line per request.
+    Statements repeated SQL_N_PLUS_ONE_THRESHOLD times or more in a request are logged as likely
+    N+1 queries, i.e. a query run once per row of an earlier result instead of once for all rows.
+    The log line is written when the request is torn down, so requests that fail with an
+    unhandled exception are logged too.
+
+    Args:
+    app (Flask): The application whose requests are instrumented.
+    engine (Engine): The engine whose statements are recorded.
+    """
+    threshold = app.config['SQL_N_PLUS_ONE_THRESHOLD']
+    event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+    event.listen(engine, 'handle_error', _handle_error)
+
+    @app.before_request
+    def start_recording_queries():
+        g.sql_queries = RequestQueries()
+
+    @app.after_request
+    def add_server_timing(response):
+        queries = g.get('sql_queries')
+        if queries is None:
+            return response
+        response.headers.add('Server-Timing', f'db;dur={queries.seconds * 1000:.1f};desc="{queries.count} queries"')
+        for shape, count in queries.repeated(threshold):
+            response.headers.add('Server-Timing', f'db-repeated-{_short_hash(shape)};desc="{count}x"')
+        g.sql_response_status = response.status_code
+        return response
+
+    @app.teardown_request
+    def report_queries(exc):
+        queries = g.pop('sql_queries', None)
+        if queries is not None:
+            _report(queries, threshold, 500 if exc is not None else g.pop('sql_response_status', None))
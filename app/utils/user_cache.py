@@ -0,0 +1,93 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+from flask import current_app
+from flask_login import UserMixin
+
+# User columns copied into a snapshot; everything templates and routes read from current_user
+SNAPSHOT_FIELDS = ('id', 'username', 'email', 'role', 'preferred_language', 'interface_language')
+
+
+class UserSnapshot(UserMixin):
+    """Detached, read-only copy of a User row, served as current_user without touching the database."""
+
+    __slots__ = SNAPSHOT_FIELDS
+
+    def __init__(self, **values):
+        for field in SNAPSHOT_FIELDS:
+            object.__setattr__(self, field, values.get(field))
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"UserSnapshot is read-only; load the User to change {name}")
+
+    @classmethod
+    def from_user(cls, user) -> 'UserSnapshot':
+        return cls(**{field: getattr(user, field) for field in SNAPSHOT_FIELDS})
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {field: getattr(self, field) for field in SNAPSHOT_FIELDS}
+
+    def __repr__(self):
+        return f'<UserSnapshot {self.id}>'
+
+
+class UserCache:
+    """Per-process LRU of user snapshots; entries older than ttl_seconds are loaded again."""
+
+    def __init__(self, max_entries: int = 10000, ttl_seconds: float = 60):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        # When each user was last changed by this process, so older session snapshots are not trusted
+        self._changed_at: Dict[int, float] = {}
+        self._lock = threading.Lock()
+
+    def get(self, user_id: int) -> Optional[UserSnapshot]:
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            snapshot, loaded_at = entry
+            if time.monotonic() - loaded_at > self.ttl_seconds:
+                del self._entries[user_id]
+                return None
+            self._entries.move_to_end(user_id)
+            return snapshot
+
+    def set(self, snapshot: UserSnapshot) -> None:
+        with self._lock:
+            self._entries[snapshot.id] = (snapshot, time.monotonic())
+            self._entries.move_to_end(snapshot.id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id: int) -> None:
+        with self._lock:
+            self._entries.pop(user_id, None)
+            self._changed_at[user_id] = time.time()
+
+    def changed_since(self, user_id: int, loaded_at: float) -> bool:
+        """Whether this process changed the user after a snapshot taken at loaded_at (time.time())."""
+        return self._changed_at.get(user_id, 0) >= loaded_at
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._changed_at.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+_cache: Optional[UserCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_user_cache() -> UserCache:
+    """Get this process's user cache, sized from USER_CACHE_MAX_ENTRIES and USER_CACHE_TTL_SECONDS."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = UserCache(current_app.config['USER_CACHE_MAX_ENTRIES'], current_app.config['USER_CACHE_TTL_SECONDS'])
+        return _cache
@@ -0,0 +1,77 @@
+"""Time computing inter-annotator agreement from scratch and refreshing it as evaluations arrive.
+
+Run from the repository root:
+    python -m benchmarks.bench_agreement
+"""
+import random
+from app import db
+from app.models import EVALUATION_TASK_TYPES, SCALE_TASK_TYPES, TAG_TASK_TYPES, Evaluation, EvaluationTask, Prompt, User
+from app.utils.agreement import get_agreement_stats
+from benchmarks.common import QueryCounter, create_benchmark_app, timed
+
+NUM_TASKS = 50_000
+EVALUATIONS_PER_TASK = 4
+NUM_USERS = 200
+TASK_TYPES = EVALUATION_TASK_TYPES
+TAGS = ['sport', 'food', 'news', 'music', 'science', 'travel']
+
+
+def random_value(task_type, truth):
+    if task_type in SCALE_TASK_TYPES:
+        return str(min(5, max(1, truth + random.choice([-1, 0, 0, 1]))))
+    if task_type in TAG_TASK_TYPES:
+        return ', '.join(random.sample(TAGS[truth:truth + 3], 2))
+    return str(int(truth > 2) if random.random() < 0.9 else random.randint(0, 1))
+
+
+def prompt_id(task_id):
+    return (task_id - 1) // len(TASK_TYPES) + 1
+
+
+def seed(start_task, num_tasks, start_evaluation):
+    tasks, evaluations = [], []
+    for task_id in range(start_task, start_task + num_tasks):
+        task_type = TASK_TYPES[task_id % len(TASK_TYPES)]
+        # One task of each type per prompt, as create_evaluation_tasks makes them
+        tasks.append({'id': task_id, 'prompt_id': prompt_id(task_id), 'task_type': task_type, 'language': 'is'})
+        truth = random.randint(1, 3)
+        for user_id in random.sample(range(1, NUM_USERS + 1), EVALUATIONS_PER_TASK):
+            evaluations.append({'id': start_evaluation + len(evaluations), 'task_id': task_id,
+                                'user_id': user_id, 'value': random_value(task_type, truth)})
+    db.session.execute(db.insert(EvaluationTask), tasks)
+    db.session.execute(db.insert(Evaluation), evaluations)
+    db.session.commit()
+    return len(evaluations)
+
+
+def main():
+    random.seed(0)
+    app = create_benchmark_app()
+    with app.app_context():
+        db.session.execute(db.insert(Prompt), [
+            {'id': i, 'prompt_text': 'Prompt', 'language': 'is'} for i in range(1, prompt_id(NUM_TASKS + 25) + 1)
+        ])
+        db.session.add_all(User(id=i, username=f'user{i}', email=f'user{i}@example.com')
+                           for i in range(1, NUM_USERS + 1))
+        db.session.commit()
+        evaluations = seed(1, NUM_TASKS, 1)
+
+        with timed() as timing:
+            stats = get_agreement_stats()
+        print(f"From scratch, {evaluations} evaluations: {timing['seconds']:.2f} s")
+
+        new_evaluations = seed(NUM_TASKS + 1, 25, evaluations + 1)
+        with timed() as timing:
+            get_agreement_stats()
+        print(f"Refresh after {new_evaluations} new evaluations: {timing['seconds'] * 1000:.1f} ms")
+
+        with QueryCounter(db.engine) as counter, timed() as timing:
+            get_agreement_stats()
+        print(f"Refresh with nothing new: {timing['seconds'] * 1000:.1f} ms, {counter.count} queries\n")
+
+        for row in stats.summaries:
+            print(f"  {row['task_type']:<16} {row['family']:<7} alpha={row['alpha']:.3f}")
+
+
+if __name__ == '__main__':
+    main()
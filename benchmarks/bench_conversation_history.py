@@ -0,0 +1,65 @@
+"""Compare the recursive CTE history loader with walking Prompt.parent one row at a time.
+
+Run from the repository root:
+    python -m benchmarks.bench_conversation_history
+"""
+from app import db
+from app.models import Prompt
+from app.utils.conversation_utils import get_conversation_history, get_conversation_histories
+from benchmarks.common import create_benchmark_app, QueryCounter, timed
+
+DEPTHS = [1, 5, 10, 20, 50, 100]
+REPEATS = 20
+
+
+def legacy_conversation_history(prompt_id):
+    history = []
+    current_prompt = db.session.get(Prompt, prompt_id)
+    while current_prompt:
+        history.insert(0, {
+            'role': 'user' if not current_prompt.is_synthetic else 'assistant',
+            'content': current_prompt.prompt_text,
+        })
+        current_prompt = current_prompt.parent
+    return history
+
+
+def create_conversation(depth):
+    parent_id = None
+    for turn in range(depth):
+        prompt = Prompt(prompt_text=f'Turn {turn}', language='is', is_synthetic=turn % 2 == 1, parent_id=parent_id)
+        db.session.add(prompt)
+        db.session.flush()
+        parent_id = prompt.id
+    db.session.commit()
+    return parent_id
+
+
+def measure(loader, prompt_id):
+    with QueryCounter(db.engine) as counter, timed() as timing:
+        for _ in range(REPEATS):
+            db.session.expire_all()
+            history = loader(prompt_id)
+    return history, counter.count // REPEATS, timing['seconds'] / REPEATS * 1000
+
+
+def main():
+    app = create_benchmark_app()
+    with app.app_context():
+        leaves = {depth: create_conversation(depth) for depth in DEPTHS}
+
+        print(f"{'depth':>6} {'legacy queries':>15} {'legacy ms':>10} {'cte queries':>12} {'cte ms':>8}")
+        for depth, leaf_id in leaves.items():
+            legacy_history, legacy_queries, legacy_ms = measure(legacy_conversation_history, leaf_id)
+            cte_history, cte_queries, cte_ms = measure(get_conversation_history, leaf_id)
+            assert legacy_history == cte_history
+            print(f"{depth:>6} {legacy_queries:>15} {legacy_ms:>10.2f} {cte_queries:>12} {cte_ms:>8.2f}")
+
+        with QueryCounter(db.engine) as counter, timed() as timing:
+            histories = get_conversation_histories(leaves.values())
+        print(f"\nBatch load of {len(histories)} conversations: "
+              f"{counter.count} query, {timing['seconds'] * 1000:.2f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""Check that exporting conversations keeps memory flat as the prompt table grows.
+
+Run from the repository root:
+    python -m benchmarks.bench_export
+"""
+import tracemalloc
+from app import db
+from app.models import Evaluation, EvaluationTask, Prompt, RankingTask, RankingTaskItem, User
+from app.utils.export import iter_conversation_trees, iter_jsonl
+from benchmarks.common import QueryCounter, create_benchmark_app, timed
+
+SIZES = [10_000, 100_000]
+BATCH_SIZE = 50_000
+MESSAGES_PER_CONVERSATION = 4
+
+
+def seed(num_prompts, start):
+    for batch_start in range(start, num_prompts + 1, BATCH_SIZE):
+        rows = []
+        for i in range(batch_start, min(batch_start + BATCH_SIZE, num_prompts + 1)):
+            root_id = i - (i - 1) % MESSAGES_PER_CONVERSATION
+            rows.append({
+                'id': i, 'prompt_text': f'Prompt {i} ' + 'x' * 200, 'language': 'is',
+                'is_synthetic': i % 2 == 0, 'parent_id': None if i == root_id else i - 1,
+                'root_id': root_id,
+                'path': ''.join(f'{j:010d}/' for j in range(root_id, i + 1)),
+            })
+        db.session.execute(db.insert(Prompt), rows)
+        # Every reply gets an evaluation and every conversation a completed ranking of its first reply
+        db.session.execute(db.insert(EvaluationTask), [
+            {'id': row['id'], 'prompt_id': row['id'], 'task_type': 'quality_score', 'language': 'is'}
+            for row in rows if row['is_synthetic']
+        ])
+        db.session.execute(db.insert(Evaluation), [
+            {'user_id': 1, 'task_id': row['id'], 'value': '4'} for row in rows if row['is_synthetic']
+        ])
+        db.session.execute(db.insert(RankingTask), [
+            {'id': row['id'], 'parent_prompt_id': row['id'], 'user_id': 1}
+            for row in rows if row['parent_id'] is None
+        ])
+        db.session.execute(db.insert(RankingTaskItem), [
+            {'task_id': row['id'], 'prompt_id': row['id'] + 1, 'position': 0, 'rank': 1}
+            for row in rows if row['parent_id'] is None
+        ])
+    db.session.commit()
+
+
+def main():
+    app = create_benchmark_app()
+    with app.app_context():
+        db.session.add(User(id=1, username='annotator', email='annotator@example.com'))
+        print(f"{'prompts':>10} {'seconds':>8} {'queries':>8} {'output MiB':>11} {'peak MiB':>9}")
+        seeded = 0
+        for size in SIZES:
+            seed(size, seeded + 1)
+            seeded = size
+            db.session.expunge_all()
+
+            exported = 0
+            tracemalloc.start()
+            with QueryCounter(db.engine) as counter, timed() as timing:
+                # Lines are dropped as they are produced so only the export itself counts towards the peak
+                for line in iter_jsonl(iter_conversation_trees()):
+                    exported += len(line)
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            print(f"{size:>10} {timing['seconds']:>8.2f} {counter.count:>8} {exported / 2**20:>11.1f} {peak / 2**20:>9.1f}")
+
+
+if __name__ == '__main__':
+    main()
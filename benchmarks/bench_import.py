@@ -0,0 +1,60 @@
+"""Measure bulk prompt import throughput from a JSONL file.
+
+Run from the repository root:
+    python -m benchmarks.bench_import
+"""
+import json
+import tempfile
+from app import db
+from app.models import Prompt
+from app.utils.dataset_import import IMPORT_BATCH_SIZE, import_prompts, read_records
+from benchmarks.common import QueryCounter, create_benchmark_app, timed
+
+NUM_RECORDS = 200_000
+TARGET_PER_SECOND = 50_000
+LANGUAGES = ['is', 'da', 'nb', 'nn', 'sv', 'nl', 'de', 'fo']
+
+
+def write_dataset(stream):
+    for i in range(NUM_RECORDS):
+        record = {
+            'message_id': f'msg-{i}',
+            'text': f'Prompt text number {i}',
+            'lang': LANGUAGES[i % len(LANGUAGES)],
+            # Conversations of four messages alternating between user and assistant
+            'parent_id': None if i % 4 == 0 else f'msg-{i - 1}',
+            'role': 'prompter' if i % 2 == 0 else 'assistant',
+        }
+        if i % 10 == 0:
+            record['references'] = [{'link': f'https://example.com/{i}', 'text': f'Reference {i}'}]
+        stream.write(json.dumps(record) + '\n')
+    stream.flush()
+
+
+def run_import(path):
+    with open(path, encoding='utf-8') as stream, QueryCounter(db.engine) as counter, timed() as timing:
+        result = import_prompts(read_records(stream, 'jsonl'), 'benchmark', IMPORT_BATCH_SIZE)
+    rate = NUM_RECORDS / timing['seconds']
+    print(f"imported={result['imported']:>7} skipped={result['skipped']:>7} orphaned={result['orphaned']:>5} "
+          f"{timing['seconds']:>6.2f} s {rate:>10,.0f} records/s {counter.count:>5} queries")
+    return rate
+
+
+def main():
+    app = create_benchmark_app()
+    with tempfile.NamedTemporaryFile('w', suffix='.jsonl', encoding='utf-8') as dataset, app.app_context():
+        write_dataset(dataset)
+        print(f"Wrote {NUM_RECORDS} records\n")
+
+        print('First import:')
+        rate = run_import(dataset.name)
+        print('Re-import (everything skipped):')
+        run_import(dataset.name)
+
+        leaf = db.session.get(Prompt, 4)
+        assert leaf.root_id == 1 and leaf.path == '0000000001/0000000002/0000000003/0000000004/'
+        print(f"\nTarget {TARGET_PER_SECOND:,} prompts/s: {'met' if rate >= TARGET_PER_SECOND else 'not met'}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""Compare the maintained user_score table with aggregating prompts and evaluations per request.
+
+Run from the repository root:
+    python -m benchmarks.bench_leaderboard
+"""
+import random
+from sqlalchemy import func, desc
+from app import db
+from app.models import User, Prompt, Evaluation, EvaluationTask, UserScore
+from app.main.routes import LEADERBOARD_SIZE
+from benchmarks.common import create_benchmark_app, QueryCounter, timed
+
+NUM_USERS = 100_000
+NUM_REVISIONS = 50_000
+NUM_EVALUATIONS = 200_000
+
+
+def seed():
+    db.session.execute(db.insert(User), [
+        {'id': i, 'username': f'user{i}', 'email': f'user{i}@example.com'} for i in range(1, NUM_USERS + 1)
+    ])
+    db.session.execute(db.insert(Prompt), [
+        {'id': i, 'prompt_text': 'revision', 'language': 'is', 'is_revision': True,
+         'revision_author_id': random.randint(1, NUM_USERS)} for i in range(1, NUM_REVISIONS + 1)
+    ])
+    db.session.execute(db.insert(EvaluationTask), [{'id': 1, 'prompt_id': 1, 'task_type': 'pii', 'language': 'is'}])
+    db.session.execute(db.insert(Evaluation), [
+        {'user_id': random.randint(1, NUM_USERS), 'task_id': 1, 'value': '1'} for _ in range(NUM_EVALUATIONS)
+    ])
+    db.session.commit()
+
+
+def legacy_rank(user_id):
+    user_scores = db.session.query(
+        User.id,
+        (func.count(Prompt.id) + func.count(Evaluation.id)).label('score')
+    ).outerjoin(Prompt, (User.id == Prompt.revision_author_id) & (Prompt.is_revision == True)
+    ).outerjoin(Evaluation, User.id == Evaluation.user_id
+    ).group_by(User.id).order_by(desc('score')).all()
+    return next((i for i, (uid, _) in enumerate(user_scores, 1) if uid == user_id), None)
+
+
+def score_table_leaderboard():
+    return db.session.query(User, UserScore).join(
+        UserScore, User.id == UserScore.user_id
+    ).order_by(desc(UserScore.total_score)).limit(LEADERBOARD_SIZE).all()
+
+
+def report(label, func_, *args):
+    with QueryCounter(db.engine) as counter, timed() as timing:
+        func_(*args)
+    print(f"{label:<32} {counter.count:>8} {timing['seconds'] * 1000:>10.1f}")
+
+
+def main():
+    app = create_benchmark_app()
+    with app.app_context():
+        seed()
+        with timed() as timing:
+            app.test_cli_runner().invoke(args=['rebuild-user-scores'])
+        print(f"rebuild-user-scores for {NUM_USERS} users: {timing['seconds']:.2f} s\n")
+
+        user_id = random.randint(1, NUM_USERS)
+        print(f"{'operation':<32} {'queries':>8} {'ms':>10}")
+        report('legacy rank (join + Python)', legacy_rank, user_id)
+        report('user_score rank (COUNT)', UserScore.rank_of, user_id)
+        report('user_score leaderboard', score_table_leaderboard)
+
+
+if __name__ == '__main__':
+    main()
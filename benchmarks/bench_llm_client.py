@@ -0,0 +1,55 @@
+"""Compare a new Together client per call on N threads with the pooled async client.
+
+Uses the stub server in benchmarks/stub_llm_server.py, so no API key or network is needed.
+
+Run from the repository root:
+    python -m benchmarks.bench_llm_client
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+from together import Together
+from benchmarks.common import timed
+from benchmarks.stub_llm_server import start_stub_server
+
+ROUNDS = 10
+FAN_OUT = 8
+CHAT_HISTORY = [{'role': 'user', 'content': 'Hvernig er veðrið á Íslandi?'}]
+
+
+def legacy_generate(base_url):
+    client = Together(api_key='stub', base_url=base_url)
+    response = client.chat.completions.create(
+        model='stub', messages=CHAT_HISTORY, max_tokens=512, stream=True)
+    return ''.join(chunk.choices[0].delta.content or '' for chunk in response if chunk.choices).strip()
+
+
+def run(label, server, generate_round):
+    connections, requests = server.connections, server.requests
+    with timed() as timing:
+        for _ in range(ROUNDS):
+            results = generate_round()
+            assert len(results) == FAN_OUT and all(results)
+    completions = server.requests - requests
+    print(f"{label:<36} {completions / timing['seconds']:>10.1f} {server.connections - connections:>12}")
+
+
+def main():
+    server = start_stub_server(token_delay=0.005, first_token_delay=0.02)
+    os.environ['TOGETHER_API_KEY'] = 'stub'
+    os.environ['TOGETHER_BASE_URL'] = server.base_url
+    from app.utils.llm_utils import generate_llm_responses
+
+    print(f"{ROUNDS} rounds of {FAN_OUT} concurrent completions")
+    print(f"{'client':<36} {'completions/s':>10} {'connections':>12}")
+
+    def legacy_round():
+        with ThreadPoolExecutor(max_workers=FAN_OUT) as executor:
+            return list(executor.map(lambda _: legacy_generate(server.base_url), range(FAN_OUT)))
+
+    run('new client per call, thread pool', server, legacy_round)
+    run('pooled async client, one loop', server,
+        lambda: generate_llm_responses([(CHAT_HISTORY, [])] * FAN_OUT))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+"""Time rendering a 50 message conversation page with and without the stored and cached Markdown HTML.
+
+Run from the repository root:
+    python -m benchmarks.bench_markdown
+"""
+import markdown
+from app import db
+from app.models import Prompt, User
+from app.utils.markdown_cache import clear_markdown_cache
+from benchmarks.common import create_benchmark_app, timed
+
+NUM_MESSAGES = 50
+REPEATS = 50
+
+# A typical long LLM answer: headings, lists, emphasis, code and a table
+RESPONSE = """## Answer {turn}
+
+Here is a **detailed** explanation with a few points to keep in mind:
+
+1. The first step is to *read the question* carefully.
+2. The second step is to break it into smaller parts, such as `inputs` and `outputs`.
+3. Finally, check the result against the [documentation](https://example.com/docs/{turn}).
+
+```python
+def solve(values):
+    return sorted(set(values))[:{turn}]
+```
+
+| option | speed | memory |
+|--------|-------|--------|
+| a      | fast  | high   |
+| b      | slow  | low    |
+
+> Remember that every rule has exceptions.
+""" + "\n".join(f"- Further detail number {i} about the topic, explained in a full sentence." for i in range(30))
+
+
+def create_conversation():
+    user = User(username='bench', email='bench@example.com', preferred_language='is')
+    db.session.add(user)
+    db.session.flush()
+    parent_id = None
+    for turn in range(NUM_MESSAGES):
+        synthetic = turn % 2 == 1
+        prompt = Prompt(prompt_text=RESPONSE.format(turn=turn) if synthetic else f'Question {turn}: how does *this* work?',
+                        language='is', is_synthetic=synthetic, parent_id=parent_id, revision_author_id=user.id)
+        db.session.add(prompt)
+        db.session.flush()
+        parent_id = prompt.id
+    db.session.commit()
+    return user.id, parent_id
+
+
+def measure(client, url):
+    client.get(url)
+    with timed() as timing:
+        for _ in range(REPEATS):
+            assert client.get(url).status_code == 200
+    return timing['seconds'] / REPEATS * 1000
+
+
+def main():
+    app = create_benchmark_app()
+    with app.app_context():
+        user_id, leaf_id = create_conversation()
+
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user_id)
+    url = f'/tasks/extended_conversation/{leaf_id}'
+
+    cached_filter = app.jinja_env.filters['markdown']
+    app.jinja_env.filters['markdown'] = markdown.markdown
+    uncached_ms = measure(client, url)
+    app.jinja_env.filters['markdown'] = cached_filter
+
+    with timed() as timing:
+        clear_markdown_cache()
+        client.get(url)
+    first_ms = timing['seconds'] * 1000
+    cached_ms = measure(client, url)
+
+    print(f"{NUM_MESSAGES} message conversation page, ms per render")
+    print(f"{'markdown on every render':<40} {uncached_ms:>8.2f}")
+    print(f"{'stored HTML, empty process cache':<40} {first_ms:>8.2f}")
+    print(f"{'stored HTML, warm process cache':<40} {cached_ms:>8.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+"""Time fitting Bradley-Terry scores to a million 4-way rankings, and refreshing them from the database.
+
+Run from the repository root:
+    python -m benchmarks.bench_ranking_scores
+"""
+from datetime import datetime, timedelta
+import numpy as np
+from app import db
+from app.models import Prompt, RankingTask, RankingTaskItem
+from app.utils.ranking_scores import count_pairs, expand_pairwise, fit_bradley_terry, get_ranking_scores
+from benchmarks.common import create_benchmark_app, timed
+
+NUM_RANKINGS = 1_000_000
+RESPONSES_PER_PROMPT = 8
+CANDIDATES_PER_TASK = 4
+DB_TASKS = 20_000
+POSTFIXES = ['', 'short', 'funny', 'long', 'clear', 'five year old', 'formal', 'poem']
+
+
+def simulate_rankings(num_tasks, rng):
+    """Rankings of 4 of the 8 responses to a prompt, drawn from known strengths (Plackett-Luce)."""
+    num_players = num_tasks // 2 * RESPONSES_PER_PROMPT
+    true_log_strengths = rng.normal(0, 1, num_players)
+    prompt = rng.integers(0, num_players // RESPONSES_PER_PROMPT, num_tasks)
+    candidates = np.argsort(rng.random((num_tasks, RESPONSES_PER_PROMPT)), axis=1)[:, :CANDIDATES_PER_TASK]
+    players = prompt[:, None] * RESPONSES_PER_PROMPT + candidates
+    # Sorting by strength plus Gumbel noise samples a Plackett-Luce ranking
+    utility = true_log_strengths[players] + rng.gumbel(size=players.shape)
+    ranked = np.take_along_axis(players, np.argsort(-utility, axis=1), axis=1)
+    task_index = np.repeat(np.arange(num_tasks), CANDIDATES_PER_TASK)
+    return task_index, ranked.ravel(), num_players, true_log_strengths
+
+
+def bench_fit():
+    rng = np.random.default_rng(0)
+    task_index, player_index, num_players, true_log_strengths = simulate_rankings(NUM_RANKINGS, rng)
+
+    with timed() as expand_timing:
+        winners, losers = expand_pairwise(task_index, player_index)
+        winners, losers, counts = count_pairs(winners, losers)
+    with timed() as fit_timing:
+        log_strengths = fit_bradley_terry(winners, losers, counts, num_players)
+    seen = np.bincount(player_index, minlength=num_players) > 0
+    correlation = np.corrcoef(log_strengths[seen], true_log_strengths[seen])[0, 1]
+    print(f"{NUM_RANKINGS} rankings, {num_players} responses, {int(counts.sum())} comparisons")
+    print(f"  expand to pairs: {expand_timing['seconds']:.2f} s")
+    print(f"  fit:             {fit_timing['seconds']:.2f} s (correlation with true strengths {correlation:.3f})")
+
+    # A refit after 1% more rankings, starting from the previous fit
+    new_task_index, new_player_index, _, _ = simulate_rankings(NUM_RANKINGS // 100, rng)
+    new_winners, new_losers = expand_pairwise(new_task_index, new_player_index % num_players)
+    with timed() as refit_timing:
+        all_winners, all_losers, all_counts = count_pairs(
+            np.r_[winners, new_winners], np.r_[losers, new_losers], np.r_[counts, np.ones(len(new_winners))]
+        )
+        fit_bradley_terry(all_winners, all_losers, all_counts, num_players, log_strengths)
+    print(f"  refit with 1% more rankings: {refit_timing['seconds']:.2f} s")
+
+
+def seed_tasks(rng, start, num_tasks, completed_at):
+    prompts, tasks, items = [], [], []
+    for task_id in range(start, start + num_tasks):
+        parent_id = task_id * (RESPONSES_PER_PROMPT + 1)
+        prompts.append({'id': parent_id, 'prompt_text': 'Prompt', 'language': 'is'})
+        prompts.extend({'id': parent_id + 1 + i, 'parent_id': parent_id, 'prompt_text': 'Response',
+                        'language': 'is', 'is_synthetic': True, 'postfix': POSTFIXES[i]}
+                       for i in range(RESPONSES_PER_PROMPT))
+        tasks.append({'id': task_id, 'parent_prompt_id': parent_id, 'completed_at': completed_at})
+        # Responses with a later postfix in the list tend to be ranked higher
+        candidates = rng.choice(RESPONSES_PER_PROMPT, CANDIDATES_PER_TASK, replace=False)
+        order = np.argsort(-(candidates * 0.3 + rng.gumbel(size=CANDIDATES_PER_TASK)))
+        items.extend({'task_id': task_id, 'prompt_id': parent_id + 1 + int(candidates[i]),
+                      'position': position, 'rank': int(np.where(order == position)[0][0]) + 1}
+                     for position, i in enumerate(range(CANDIDATES_PER_TASK)))
+    db.session.execute(db.insert(Prompt), prompts)
+    db.session.execute(db.insert(RankingTask), tasks)
+    db.session.execute(db.insert(RankingTaskItem), items)
+    db.session.commit()
+
+
+def bench_refresh():
+    app = create_benchmark_app()
+    rng = np.random.default_rng(1)
+    with app.app_context():
+        now = datetime.utcnow()
+        seed_tasks(rng, 1, DB_TASKS, now - timedelta(hours=1))
+        with timed() as timing:
+            scores = get_ranking_scores('postfix')
+        print(f"\n{scores.tasks} tasks from the database, postfix scores: {timing['seconds']:.2f} s")
+
+        # Older than the settle window, so the next refresh picks them up
+        seed_tasks(rng, DB_TASKS + 1, DB_TASKS // 100, now - timedelta(minutes=5))
+        with timed() as timing:
+            scores = get_ranking_scores('postfix')
+        print(f"Refresh after {DB_TASKS // 100} more tasks: {timing['seconds']:.3f} s")
+        with timed() as timing:
+            get_ranking_scores('postfix')
+        print(f"Refresh with nothing new: {timing['seconds'] * 1000:.1f} ms\n")
+        for row in scores.ratings():
+            print(f"  {row['rating']:>6.0f} {row['comparisons']:>7} {row['player'] or '(none)'}")
+
+
+if __name__ == '__main__':
+    bench_fit()
+    bench_refresh()
@@ -0,0 +1,65 @@
+"""Compare ORDER BY random() with sample_prompt on a large prompt table.
+
+Run from the repository root:
+    python -m benchmarks.bench_sampling
+"""
+from collections import Counter
+from sqlalchemy import func
+from app import db
+from app.models import Prompt
+from app.utils.sampling import sample_prompt
+from benchmarks.common import create_benchmark_app, timed
+
+NUM_PROMPTS = 1_000_000
+BATCH_SIZE = 50_000
+REPEATS = 20
+LANGUAGES = ['is', 'da', 'nb', 'nn', 'sv', 'nl', 'de', 'fo']
+
+
+def seed():
+    for start in range(1, NUM_PROMPTS + 1, BATCH_SIZE):
+        db.session.execute(db.insert(Prompt), [
+            {'id': i, 'prompt_text': f'Prompt {i}', 'language': LANGUAGES[i % len(LANGUAGES)],
+             # Every fourth prompt starts a conversation
+             'parent_id': None if i % 4 == 1 else i - 1}
+            for i in range(start, min(start + BATCH_SIZE, NUM_PROMPTS + 1))
+        ])
+    db.session.commit()
+
+
+def legacy_get_prompt():
+    return Prompt.query.order_by(db.func.random()).first()
+
+
+def legacy_get_random_conversation(language):
+    return Prompt.query.filter_by(language=language, parent_id=None).order_by(func.random()).first()
+
+
+def report(label, sampler, *args):
+    with timed() as timing:
+        for _ in range(REPEATS):
+            db.session.expunge_all()
+            assert sampler(*args) is not None
+    print(f"{label:<44} {timing['seconds'] / REPEATS * 1000:>10.2f}")
+
+
+def main():
+    app = create_benchmark_app()
+    with app.app_context():
+        with timed() as timing:
+            seed()
+        print(f"Seeded {NUM_PROMPTS} prompts in {timing['seconds']:.1f} s\n")
+
+        print(f"{'sampler':<44} {'ms/sample':>10}")
+        report('get_prompt: ORDER BY random()', legacy_get_prompt)
+        report('get_prompt: sample_prompt()', sample_prompt)
+        report('random conversation: ORDER BY random()', legacy_get_random_conversation, 'da')
+        report('random conversation: sample_prompt(...)', sample_prompt, 'da', True)
+
+        # Rough check that the id-range sampler spreads over the whole table
+        deciles = Counter(sample_prompt().id * 10 // (NUM_PROMPTS + 1) for _ in range(2000))
+        print(f"\nSamples per id decile (2000 draws): {[deciles[d] for d in range(10)]}")
+
+
+if __name__ == '__main__':
+    main()
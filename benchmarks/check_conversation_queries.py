@@ -0,0 +1,95 @@
+"""Fail if the user_conversations page sends more queries than MAX_QUERIES.
+
+The page used to load each conversation's responses, contributors and ranking tasks one query
+at a time, so its query count grew with the number of conversations shown. It now loads a
+whole page in a fixed number of queries. This check requests the first and a later page of
+both filters against conversations with responses, revisions, extensions and ranking tasks,
+and fails if any of them needs more than MAX_QUERIES queries.
+
+Run from the repository root:
+    python -m benchmarks.check_conversation_queries
+"""
+import sys
+from app import db
+from app.models import Prompt, RankingTask, User
+from app.tasks.routes import CONVERSATIONS_PER_PAGE
+from benchmarks.common import QueryCounter, create_benchmark_app
+
+# More than two pages, so the check covers a page reached through ?before=
+NUM_CONVERSATIONS = CONVERSATIONS_PER_PAGE * 2 + 5
+RESPONSES_PER_PROMPT = 4
+MAX_QUERIES = 5
+
+
+def add_prompt(author, parent=None, is_synthetic=False, **kwargs):
+    prompt = Prompt(prompt_text='answer' if is_synthetic else 'question', language='is',
+                    is_synthetic=is_synthetic, parent_id=parent.id if parent else None,
+                    revision_author_id=None if is_synthetic else author.id,
+                    revision_author_type='model' if is_synthetic else 'user', **kwargs)
+    db.session.add(prompt)
+    db.session.flush()
+    return prompt
+
+
+def seed():
+    """Conversations started by the first user, each revised, ranked and extended by the others."""
+    users = [User(username=f'user{i}', email=f'user{i}@example.com', preferred_language='is') for i in range(3)]
+    db.session.add_all(users)
+    db.session.flush()
+    owner, reviser, extender = users
+
+    for _ in range(NUM_CONVERSATIONS):
+        root = add_prompt(owner)
+        responses = [add_prompt(None, root, is_synthetic=True) for _ in range(RESPONSES_PER_PROMPT)]
+        add_prompt(reviser, root, is_revision=True, revised_prompt_id=responses[0].id)
+        task = RankingTask(root.id, [response.id for response in responses])
+        task.ranking = [response.id for response in responses]
+        task.complete(reviser.id)
+        db.session.add(task)
+
+        extension = add_prompt(extender, responses[0])
+        for _ in range(RESPONSES_PER_PROMPT):
+            add_prompt(None, extension, is_synthetic=True)
+    db.session.commit()
+    return owner.id
+
+
+def main():
+    app = create_benchmark_app()
+    with app.app_context():
+        user_id = seed()
+        engine = db.engine
+
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user_id)
+    # Load the user once so the counts below are those of the page itself
+    client.get('/index')
+
+    failures = 0
+    for filter_type in ('all', 'mine'):
+        url = f'/tasks/user_conversations?filter={filter_type}'
+        for page in range(2):
+            with QueryCounter(engine) as counter:
+                response = client.get(url)
+            ok = response.status_code == 200 and counter.count <= MAX_QUERIES
+            print(f"{'ok' if ok else 'FAIL':<5} {url:<55} {response.status_code} {counter.count:>3} queries")
+            failures += not ok
+
+            # The link to the next page carries the keyset
+            marker = f'filter={filter_type}&amp;before='
+            html = response.get_data(as_text=True)
+            if marker not in html:
+                print(f"FAIL  no next page link on {url}")
+                failures += 1
+                break
+            before = html.split(marker, 1)[1].split('"', 1)[0]
+            url = f'/tasks/user_conversations?filter={filter_type}&before={before}'
+
+    if failures:
+        print(f"\n{failures} requests failed or sent more than {MAX_QUERIES} queries")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,190 @@
+"""Fail if any query behind the main pages reads a whole table instead of using an index.
+
+Every page below is requested, and every helper in calls() run, against a seeded database
+while the SELECT statements they send are recorded. Each statement is then run again under EXPLAIN QUERY PLAN, and the check fails if a
+plan scans one of TABLES from start to end. Scans of an index in its order, e.g. for
+ORDER BY id DESC LIMIT 20, are allowed.
+
+Run from the repository root:
+    python -m benchmarks.check_query_plans
+"""
+import random
+import re
+import sys
+from datetime import datetime, timedelta
+from sqlalchemy import event
+from app import db
+from app.models import (Evaluation, EvaluationTask, Prompt, RankingTask, RankingTaskItem, User, UserScore,
+                        EVALUATION_TASK_TYPES)
+from app.utils.sampling import sample_prompt
+from benchmarks.common import create_benchmark_app
+
+NUM_USERS = 200
+NUM_CONVERSATIONS = 2_000
+RESPONSES_PER_CONVERSATION = 4
+EVALUATIONS_PER_TASK = 2
+
+# Tables that grow with use; a full scan of any of them fails the check
+TABLES = ['prompt', 'evaluation', 'evaluation_task', 'evaluation_tag', 'ranking_task', 'ranking_task_item',
+          'user', 'user_score', 'prompt_references', 'reference']
+FULL_SCAN = re.compile(r'^SCAN (\w+)(?: AS \w+)?$')
+
+
+def seed():
+    """A few thousand conversations with responses, revisions, evaluations and ranking tasks."""
+    now = datetime.utcnow()
+    db.session.execute(db.insert(User), [
+        {'id': i, 'username': f'user{i}', 'email': f'user{i}@example.com', 'preferred_language': 'is',
+         'role': 'admin' if i == 1 else 'regular'} for i in range(1, NUM_USERS + 1)
+    ])
+    db.session.execute(db.insert(UserScore), [
+        {'user_id': i, 'prompts_ranked': i % 7, 'evaluations_performed': i % 11, 'total_score': i % 7 + i % 11}
+        for i in range(1, NUM_USERS + 1)
+    ])
+
+    prompts, ranking_tasks, items, evaluation_tasks, evaluations = [], [], [], [], []
+    prompt_id = task_id = 0
+    for conversation in range(1, NUM_CONVERSATIONS + 1):
+        prompt_id += 1
+        root_id = prompt_id
+        prompts.append({'id': root_id, 'root_id': root_id, 'path': f'{root_id:010d}/', 'language': 'is',
+                        'prompt_text': 'question', 'is_synthetic': False, 'created_at': now,
+                        # The user the pages are requested as starts the first conversation
+                        'revision_author_id': 1 if conversation == 1 else random.randint(1, NUM_USERS),
+                        'revision_author_type': 'user'})
+        responses = []
+        for _ in range(RESPONSES_PER_CONVERSATION):
+            prompt_id += 1
+            responses.append(prompt_id)
+            prompts.append({'id': prompt_id, 'parent_id': root_id, 'root_id': root_id,
+                            'path': f'{root_id:010d}/{prompt_id:010d}/', 'language': 'is', 'prompt_text': 'answer',
+                            'is_synthetic': True, 'created_at': now, 'revision_author_type': 'model'})
+        prompt_id += 1
+        revision_id = prompt_id
+        prompts.append({'id': revision_id, 'parent_id': root_id, 'root_id': root_id,
+                        'path': f'{root_id:010d}/{revision_id:010d}/', 'language': 'is', 'prompt_text': 'revision',
+                        'is_synthetic': False, 'is_revision': True, 'revised_prompt_id': responses[0],
+                        'created_at': now, 'revision_author_id': random.randint(1, NUM_USERS),
+                        'revision_author_type': 'user'})
+
+        # The first task is left open for /tasks/rank_and_revise to hand out
+        completed = conversation > 1 and random.random() < 0.5
+        ranking_tasks.append({'id': conversation, 'parent_prompt_id': root_id, 'created_at': now,
+                              'user_id': random.randint(1, NUM_USERS) if completed else None,
+                              'completed_at': now - timedelta(minutes=random.randint(1, 10000)) if completed else None})
+        items.extend({'task_id': conversation, 'prompt_id': response, 'position': position,
+                      'rank': position + 1 if completed else None} for position, response in enumerate(responses))
+
+        for task_type in EVALUATION_TASK_TYPES:
+            task_id += 1
+            evaluation_tasks.append({'id': task_id, 'prompt_id': revision_id, 'task_type': task_type,
+                                     'language': 'is', 'evaluation_count': EVALUATIONS_PER_TASK, 'created_at': now})
+            evaluations.extend({'task_id': task_id, 'user_id': user_id, 'value': '1', 'flag': True, 'created_at': now}
+                               for user_id in random.sample(range(1, NUM_USERS + 1), EVALUATIONS_PER_TASK))
+
+    db.session.execute(db.insert(Prompt), prompts)
+    db.session.execute(db.insert(RankingTask), ranking_tasks)
+    db.session.execute(db.insert(RankingTaskItem), items)
+    db.session.execute(db.insert(EvaluationTask), evaluation_tasks)
+    db.session.execute(db.insert(Evaluation), evaluations)
+    db.session.commit()
+
+
+def pages():
+    """(method, url, body) of the pages whose queries are checked."""
+    return [
+        ('GET', '/index', None),
+        ('GET', '/leaderboard', None),
+        ('GET', '/profile', None),
+        ('GET', '/agreement', None),
+        ('GET', '/tasks/user_conversations?filter=mine', None),
+        ('GET', '/tasks/user_conversations?filter=all', None),
+        ('GET', '/tasks/user_conversations?filter=all&before=5000', None),
+        ('GET', '/tasks/evaluation_tasks', None),
+        ('GET', '/tasks/evaluate/pii', None),
+        ('POST', '/tasks/submit_evaluation/1', {'value': '0'}),
+        ('GET', '/tasks/rank_and_revise', None),
+        ('GET', '/tasks/rank_and_revise/1', None),
+        ('GET', '/tasks/extended_conversation/1', None),
+    ]
+
+
+def calls():
+    """(label, function) of helpers without a page of their own whose queries are checked."""
+    return [
+        ('sample_prompt()', lambda: sample_prompt()),
+        ("sample_prompt('is', roots_only=True)", lambda: sample_prompt('is', roots_only=True)),
+        ('RankingTaskItem.win_rates', lambda: RankingTaskItem.win_rates(range(1, 200))),
+    ]
+
+
+class StatementRecorder:
+    """Collect the SELECT statements sent to the database while active."""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.statements = []
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if not executemany and statement.lstrip().upper().startswith(('SELECT', 'WITH')):
+            self.statements.append((statement, parameters))
+
+    def __enter__(self):
+        event.listen(self.engine, 'before_cursor_execute', self._before_cursor_execute)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, 'before_cursor_execute', self._before_cursor_execute)
+
+
+def full_scans(connection, statement, parameters):
+    """Tables the plan of a statement reads in full."""
+    plan = connection.exec_driver_sql(f'EXPLAIN QUERY PLAN {statement}', parameters).all()
+    scans = []
+    for row in plan:
+        match = FULL_SCAN.match(row[-1])
+        if match and match.group(1) in TABLES:
+            scans.append(row[-1])
+    return scans
+
+
+def main():
+    random.seed(0)
+    app = create_benchmark_app()
+    with app.app_context():
+        seed()
+        engine = db.engine
+
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = '1'
+
+    def check(label, recorder):
+        with app.app_context(), engine.connect() as connection:
+            problems = []
+            for statement, parameters in recorder.statements:
+                scans = full_scans(connection, statement, parameters)
+                if scans:
+                    problems.append((statement, scans))
+        print(f"{'FAIL' if problems else 'ok':<5} {label:<60} {len(recorder.statements):>3} queries")
+        for statement, scans in problems:
+            print(f"      {', '.join(scans)}\n      {' '.join(statement.split())}\n")
+        return len(problems)
+
+    failures = 0
+    for method, url, body in pages():
+        with StatementRecorder(engine) as recorder:
+            response = client.open(url, method=method, data=body)
+        failures += check(f"{method:<5} {url} {response.status_code}", recorder)
+    for label, function in calls():
+        with app.app_context(), StatementRecorder(engine) as recorder:
+            function()
+        failures += check(label, recorder)
+
+    if failures:
+        print(f"\n{failures} queries read a whole table")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
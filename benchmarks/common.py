@@ -0,0 +1,45 @@
+import time
+from contextlib import contextmanager
+from sqlalchemy import event
+from app import create_app, db
+from config import Config
+
+
+class BenchmarkConfig(Config):
+    SQLALCHEMY_DATABASE_URI = 'sqlite://'
+    WTF_CSRF_ENABLED = False
+
+
+def create_benchmark_app(config_class=BenchmarkConfig):
+    """Create an app bound to a fresh database with all tables created."""
+    app = create_app(config_class)
+    with app.app_context():
+        db.create_all()
+    return app
+
+
+class QueryCounter:
+    """Count the statements sent to the database while active."""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.count = 0
+
+    def _before_cursor_execute(self, *args, **kwargs):
+        self.count += 1
+
+    def __enter__(self):
+        event.listen(self.engine, 'before_cursor_execute', self._before_cursor_execute)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, 'before_cursor_execute', self._before_cursor_execute)
+
+
+@contextmanager
+def timed():
+    """Yield a dict whose 'seconds' entry is filled in when the block exits."""
+    result = {}
+    start = time.perf_counter()
+    yield result
+    result['seconds'] = time.perf_counter() - start
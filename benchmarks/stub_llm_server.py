@@ -0,0 +1,125 @@
+"""Minimal OpenAI-compatible chat completions server for exercising the LLM client offline.
+
+Streams a fixed answer token by token with a configurable delay. Point the app at it with
+    TOGETHER_BASE_URL=http://127.0.0.1:<port>/v1 TOGETHER_API_KEY=stub
+
+Run standalone from the repository root:
+    python -m benchmarks.stub_llm_server --port 8765
+"""
+import argparse
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ANSWER_TOKENS = ["Þetta ", "er ", "svar ", "frá ", "prófunarþjóni."]
+
+
+class StubLLMServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, token_delay=0.0, first_token_delay=0.0):
+        super().__init__(address, StubLLMHandler)
+        self.token_delay = token_delay
+        self.first_token_delay = first_token_delay
+        self.connections = 0
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    def process_request(self, request, client_address):
+        with self._lock:
+            self.connections += 1
+        super().process_request(request, client_address)
+
+    def handle_error(self, request, client_address):
+        # Clients hanging up mid-answer (cancelled requests) are expected
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+
+class StubLLMHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # Keep connections alive between requests
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        with self.server._lock:
+            self.server.requests += 1
+
+        if not self.path.endswith('/chat/completions'):
+            self.send_error(404)
+            return
+
+        if not body.get('stream'):
+            # Take as long as the streamed answer would
+            time.sleep(self.server.first_token_delay + self.server.token_delay * (len(ANSWER_TOKENS) - 1))
+            self._send_json(self._completion(body))
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        time.sleep(self.server.first_token_delay)
+        for index, token in enumerate(ANSWER_TOKENS):
+            if index:
+                time.sleep(self.server.token_delay)
+            self._send_event(self._chunk(body, {'content': token}))
+        self._send_event(self._chunk(body, {}, finish_reason='stop'))
+        self._write_chunk(b'data: [DONE]\n\n')
+        self._write_chunk(b'')
+
+    def _completion(self, body):
+        choices = [{
+            'index': index,
+            'message': {'role': 'assistant', 'content': ''.join(ANSWER_TOKENS)},
+            'finish_reason': 'stop'
+        } for index in range(body.get('n') or 1)]
+        return {'id': 'stub', 'object': 'chat.completion', 'created': int(time.time()),
+                'model': body.get('model'), 'choices': choices}
+
+    def _chunk(self, body, delta, finish_reason=None):
+        return {'id': 'stub', 'object': 'chat.completion.chunk', 'created': int(time.time()),
+                'model': body.get('model'),
+                'choices': [{'index': 0, 'delta': delta, 'finish_reason': finish_reason}]}
+
+    def _send_json(self, payload):
+        data = json.dumps(payload).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_event(self, payload):
+        self._write_chunk(f"data: {json.dumps(payload)}\n\n".encode())
+
+    def _write_chunk(self, data):
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+
+def start_stub_server(token_delay=0.0, first_token_delay=0.0, port=0):
+    """Start the stub server on a background thread and return it."""
+    server = StubLLMServer(('127.0.0.1', port), token_delay, first_token_delay)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--token-delay', type=float, default=0.05)
+    parser.add_argument('--first-token-delay', type=float, default=0.5)
+    args = parser.parse_args()
+    server = StubLLMServer(('127.0.0.1', args.port), args.token_delay, args.first_token_delay)
+    print(f"Serving on {server.base_url}")
+    server.serve_forever()
@@ -12,3 +12,42 @@ class Config:
     SQLALCHEMY_DATABASE_URI = database_url or 'sqlite:///app.db'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     WTF_CSRF_ENABLED = True
+
+    # Background generation worker (flask generation-worker)
+    GENERATION_WORKER_CONCURRENCY = int(os.environ.get('GENERATION_WORKER_CONCURRENCY', 4))
+    GENERATION_WORKER_POLL_INTERVAL = float(os.environ.get('GENERATION_WORKER_POLL_INTERVAL', 2))
+    GENERATION_JOB_LEASE_SECONDS = int(os.environ.get('GENERATION_JOB_LEASE_SECONDS', 600))
+
+    # Logged in users are served from a per-process cache of read-only snapshots; changes made in
+    # other processes show up after USER_CACHE_TTL_SECONDS. With USER_SESSION_SNAPSHOT the snapshot
+    # is also kept in the signed session cookie, so most requests do not touch the user table at all
+    USER_CACHE_MAX_ENTRIES = int(os.environ.get('USER_CACHE_MAX_ENTRIES', 10000))
+    USER_CACHE_TTL_SECONDS = float(os.environ.get('USER_CACHE_TTL_SECONDS', 60))
+    USER_SESSION_SNAPSHOT = os.environ.get('USER_SESSION_SNAPSHOT', '').lower() in ('1', 'true', 'yes')
+
+    # Rendered conversation histories: 'memory' (per process), 'filesystem' (shared by the workers
+    # on a machine through FRAGMENT_CACHE_DIR) or 'none'
+    FRAGMENT_CACHE_BACKEND = os.environ.get('FRAGMENT_CACHE_BACKEND', 'memory')
+    FRAGMENT_CACHE_DIR = os.environ.get('FRAGMENT_CACHE_DIR', 'fragment_cache')
+    FRAGMENT_CACHE_MAX_BYTES = int(os.environ.get('FRAGMENT_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+
+    # Seconds an annotator has to rank and revise a task before it is handed to someone else
+    RANKING_TASK_LEASE_SECONDS = int(os.environ.get('RANKING_TASK_LEASE_SECONDS', 900))
+
+    # Report each request's query count and database time in a Server-Timing header and a JSON log
+    # line, and warn about statements repeated at least SQL_N_PLUS_ONE_THRESHOLD times in a request
+    SQL_INSTRUMENTATION = os.environ.get('SQL_INSTRUMENTATION', '').lower() in ('1', 'true', 'yes')
+    SQL_N_PLUS_ONE_THRESHOLD = int(os.environ.get('SQL_N_PLUS_ONE_THRESHOLD', 10))
+
+    # Seconds /tasks/get_prompt waits for synthetic variations before returning those that are done
+    SYNTHETIC_PROMPT_DEADLINE_SECONDS = float(os.environ.get('SYNTHETIC_PROMPT_DEADLINE_SECONDS', 30))
+
+    # Create a revised prompt's evaluation tasks one at a time as they get their first evaluation,
+    # instead of all of them up front
+    VIRTUAL_EVALUATION_TASKS = os.environ.get('VIRTUAL_EVALUATION_TASKS', '').lower() in ('1', 'true', 'yes')
+
+    # Incremental exports (flask export-increment) leave rows younger than this for the next run
+    EXPORT_SETTLE_SECONDS = float(os.environ.get('EXPORT_SETTLE_SECONDS', 60))
+
+    # Ranking scores (flask ranking-scores) leave tasks completed more recently than this for the next refresh
+    RANKING_SCORES_SETTLE_SECONDS = float(os.environ.get('RANKING_SCORES_SETTLE_SECONDS', 60))
@@ -0,0 +1,37 @@
+"""Export watermarks for incremental exports
+
+Revision ID: 0b7d4e2a91c5
+Revises: f3a6c19d8e20
+Create Date: 2026-10-18 12:31:06.518204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0b7d4e2a91c5'
+down_revision = 'f3a6c19d8e20'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('export_watermark',
+    sa.Column('consumer', sa.String(length=64), nullable=False),
+    sa.Column('last_prompt_id', sa.Integer(), nullable=False),
+    sa.Column('last_evaluation_id', sa.Integer(), nullable=False),
+    sa.Column('last_ranking_completed_at', sa.DateTime(), nullable=True),
+    sa.Column('last_ranking_task_id', sa.Integer(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('consumer', name=op.f('pk_export_watermark'))
+    )
+    with op.batch_alter_table('ranking_task', schema=None) as batch_op:
+        batch_op.create_index('ix_ranking_task_completed_at_id', ['completed_at', 'id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('ranking_task', schema=None) as batch_op:
+        batch_op.drop_index('ix_ranking_task_completed_at_id')
+
+    op.drop_table('export_watermark')
@@ -0,0 +1,112 @@
+"""Store ranking task candidates and rankings as rows
+
+Revision ID: 1c5e8a7f3d26
+Revises: 0b7d4e2a91c5
+Create Date: 2026-10-18 12:52:37.640918
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '1c5e8a7f3d26'
+down_revision = '0b7d4e2a91c5'
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 1000
+
+ranking_task = sa.table('ranking_task',
+    sa.column('id', sa.Integer),
+    sa.column('prompt_ids', sa.PickleType),
+    sa.column('ranking', sa.PickleType)
+)
+
+ranking_task_item = sa.table('ranking_task_item',
+    sa.column('task_id', sa.Integer),
+    sa.column('prompt_id', sa.Integer),
+    sa.column('position', sa.Integer),
+    sa.column('rank', sa.Integer)
+)
+
+
+def task_items(task_id, prompt_ids, ranking):
+    prompt_ids = list(dict.fromkeys(int(prompt_id) for prompt_id in prompt_ids or []))
+    ranks = {}
+    for prompt_id in ranking or []:
+        ranks.setdefault(int(prompt_id), len(ranks) + 1)
+    return [
+        {'task_id': task_id, 'prompt_id': prompt_id, 'position': position, 'rank': ranks.get(prompt_id)}
+        for position, prompt_id in enumerate(prompt_ids)
+    ]
+
+
+def upgrade():
+    op.create_table('ranking_task_item',
+    sa.Column('task_id', sa.Integer(), nullable=False),
+    sa.Column('prompt_id', sa.Integer(), nullable=False),
+    sa.Column('position', sa.Integer(), nullable=False),
+    sa.Column('rank', sa.Integer(), nullable=True),
+    sa.ForeignKeyConstraint(['prompt_id'], ['prompt.id'], name=op.f('fk_ranking_task_item_prompt_id_prompt')),
+    sa.ForeignKeyConstraint(['task_id'], ['ranking_task.id'], name=op.f('fk_ranking_task_item_task_id_ranking_task')),
+    sa.PrimaryKeyConstraint('task_id', 'prompt_id', name=op.f('pk_ranking_task_item'))
+    )
+    with op.batch_alter_table('ranking_task_item', schema=None) as batch_op:
+        batch_op.create_index('ix_ranking_task_item_prompt_id_rank', ['prompt_id', 'rank'], unique=False)
+
+    # Unpickle the existing tasks a batch at a time
+    connection = op.get_bind()
+    last_id = 0
+    while True:
+        rows = connection.execute(
+            sa.select(ranking_task.c.id, ranking_task.c.prompt_ids, ranking_task.c.ranking)
+            .where(ranking_task.c.id > last_id).order_by(ranking_task.c.id).limit(BATCH_SIZE)
+        ).all()
+        if not rows:
+            break
+        items = [item for row in rows for item in task_items(*row)]
+        if items:
+            connection.execute(ranking_task_item.insert(), items)
+        last_id = rows[-1].id
+
+    with op.batch_alter_table('ranking_task', schema=None) as batch_op:
+        batch_op.drop_column('ranking')
+        batch_op.drop_column('prompt_ids')
+
+
+def downgrade():
+    with op.batch_alter_table('ranking_task', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('prompt_ids', sa.PickleType(), nullable=True))
+        batch_op.add_column(sa.Column('ranking', sa.PickleType(), nullable=True))
+
+    connection = op.get_bind()
+    last_id = 0
+    while True:
+        task_ids = connection.execute(
+            sa.select(ranking_task.c.id).where(ranking_task.c.id > last_id).order_by(ranking_task.c.id).limit(BATCH_SIZE)
+        ).scalars().all()
+        if not task_ids:
+            break
+        items = {task_id: [] for task_id in task_ids}
+        for task_id, prompt_id, rank in connection.execute(
+            sa.select(ranking_task_item.c.task_id, ranking_task_item.c.prompt_id, ranking_task_item.c.rank)
+            .where(ranking_task_item.c.task_id.in_(task_ids)).order_by(ranking_task_item.c.position)
+        ):
+            items[task_id].append((prompt_id, rank))
+        connection.execute(
+            ranking_task.update().where(ranking_task.c.id == sa.bindparam('b_id')).values(
+                prompt_ids=sa.bindparam('b_prompt_ids'), ranking=sa.bindparam('b_ranking')),
+            [{
+                'b_id': task_id,
+                'b_prompt_ids': [prompt_id for prompt_id, _ in task_items],
+                'b_ranking': [prompt_id for prompt_id, rank in sorted(task_items, key=lambda item: item[1] or 0)
+                              if rank is not None],
+            } for task_id, task_items in items.items()]
+        )
+        last_id = task_ids[-1]
+
+    with op.batch_alter_table('ranking_task_item', schema=None) as batch_op:
+        batch_op.drop_index('ix_ranking_task_item_prompt_id_rank')
+
+    op.drop_table('ranking_task_item')
@@ -0,0 +1,102 @@
+"""Typed evaluation values and evaluation_tag
+
+Revision ID: 2d91f4b6a7e3
+Revises: 1c5e8a7f3d26
+Create Date: 2026-10-18 13:36:18.029474
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '2d91f4b6a7e3'
+down_revision = '1c5e8a7f3d26'
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 1000
+
+BINARY_TASK_TYPES = ['pii', 'spam', 'appropriate', 'hate_speech', 'sexual_content', 'child_friendly', 'bias', 'sarcasm']
+SCALE_TASK_TYPES = ['quality_score', 'seriousness', 'creativity', 'politeness', 'safety', 'friendliness', 'difficulty']
+TAG_TASK_TYPES = ['topic_tags']
+
+evaluation = sa.table('evaluation',
+    sa.column('id', sa.Integer),
+    sa.column('task_id', sa.Integer),
+    sa.column('value', sa.String),
+    sa.column('score', sa.SmallInteger),
+    sa.column('flag', sa.Boolean)
+)
+
+evaluation_task = sa.table('evaluation_task',
+    sa.column('id', sa.Integer),
+    sa.column('task_type', sa.String)
+)
+
+evaluation_tag = sa.table('evaluation_tag',
+    sa.column('evaluation_id', sa.Integer),
+    sa.column('tag', sa.String)
+)
+
+
+def parse_tags(value):
+    return sorted({tag.strip().lower()[:64] for tag in (value or '').split(',') if tag.strip()})
+
+
+def backfill_typed_values(connection):
+    update = evaluation.update().where(evaluation.c.id == sa.bindparam('b_id')).values(
+        score=sa.bindparam('b_score'), flag=sa.bindparam('b_flag'))
+
+    last_id = 0
+    while True:
+        rows = connection.execute(
+            sa.select(evaluation.c.id, evaluation.c.value, evaluation_task.c.task_type)
+            .join(evaluation_task, evaluation_task.c.id == evaluation.c.task_id)
+            .where(evaluation.c.id > last_id).order_by(evaluation.c.id).limit(BATCH_SIZE)
+        ).all()
+        if not rows:
+            break
+
+        updates, tags = [], []
+        for evaluation_id, value, task_type in rows:
+            value = (value or '').strip()
+            if task_type in BINARY_TASK_TYPES and value in ('0', '1'):
+                updates.append({'b_id': evaluation_id, 'b_score': None, 'b_flag': value == '1'})
+            elif task_type in SCALE_TASK_TYPES and value in ('1', '2', '3', '4', '5'):
+                updates.append({'b_id': evaluation_id, 'b_score': int(value), 'b_flag': None})
+            elif task_type in TAG_TASK_TYPES:
+                tags.extend({'evaluation_id': evaluation_id, 'tag': tag} for tag in parse_tags(value))
+        if updates:
+            connection.execute(update, updates)
+        if tags:
+            connection.execute(evaluation_tag.insert(), tags)
+        last_id = rows[-1].id
+
+
+def upgrade():
+    op.create_table('evaluation_tag',
+    sa.Column('evaluation_id', sa.Integer(), nullable=False),
+    sa.Column('tag', sa.String(length=64), nullable=False),
+    sa.ForeignKeyConstraint(['evaluation_id'], ['evaluation.id'], name=op.f('fk_evaluation_tag_evaluation_id_evaluation')),
+    sa.PrimaryKeyConstraint('evaluation_id', 'tag', name=op.f('pk_evaluation_tag'))
+    )
+    with op.batch_alter_table('evaluation_tag', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_evaluation_tag_tag'), ['tag'], unique=False)
+
+    with op.batch_alter_table('evaluation', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('score', sa.SmallInteger(), nullable=True))
+        batch_op.add_column(sa.Column('flag', sa.Boolean(), nullable=True))
+
+    backfill_typed_values(op.get_bind())
+
+
+def downgrade():
+    with op.batch_alter_table('evaluation', schema=None) as batch_op:
+        batch_op.drop_column('flag')
+        batch_op.drop_column('score')
+
+    with op.batch_alter_table('evaluation_tag', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_evaluation_tag_tag'))
+
+    op.drop_table('evaluation_tag')
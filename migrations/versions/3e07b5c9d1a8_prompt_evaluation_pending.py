@@ -0,0 +1,56 @@
+"""Prompt evaluation_pending for virtual evaluation tasks, one task per prompt and task type
+
+Revision ID: 3e07b5c9d1a8
+Revises: 2d91f4b6a7e3
+Create Date: 2026-10-18 14:02:51.377920
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3e07b5c9d1a8'
+down_revision = '2d91f4b6a7e3'
+branch_labels = None
+depends_on = None
+
+
+def merge_duplicate_tasks(connection):
+    """Move evaluations of repeated (prompt_id, task_type) tasks to the oldest one and delete the rest."""
+    duplicates = connection.execute(sa.text(
+        "SELECT t.id, k.keep_id FROM evaluation_task t "
+        "JOIN (SELECT prompt_id, task_type, MIN(id) AS keep_id FROM evaluation_task "
+        "      GROUP BY prompt_id, task_type HAVING COUNT(*) > 1) k "
+        "ON k.prompt_id = t.prompt_id AND k.task_type = t.task_type "
+        "WHERE t.id <> k.keep_id"
+    )).all()
+    if not duplicates:
+        return
+    params = [{'task_id': task_id, 'keep_id': keep_id} for task_id, keep_id in duplicates]
+    connection.execute(sa.text("UPDATE evaluation SET task_id = :keep_id WHERE task_id = :task_id"), params)
+    connection.execute(sa.text("DELETE FROM evaluation_task WHERE id = :task_id"), params)
+    connection.execute(sa.text(
+        "UPDATE evaluation_task SET evaluation_count = "
+        "(SELECT COUNT(*) FROM evaluation WHERE evaluation.task_id = evaluation_task.id) WHERE id = :keep_id"
+    ), [{'keep_id': keep_id} for keep_id in {keep_id for _, keep_id in duplicates}])
+
+
+def upgrade():
+    with op.batch_alter_table('prompt', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('evaluation_pending', sa.Boolean(), server_default=sa.false(), nullable=False))
+        batch_op.create_index('ix_prompt_evaluation_pending_language_id', ['evaluation_pending', 'language', 'id'], unique=False)
+
+    # One task per prompt and task type, so concurrent first evaluations cannot create two
+    merge_duplicate_tasks(op.get_bind())
+    with op.batch_alter_table('evaluation_task', schema=None) as batch_op:
+        batch_op.create_index('ix_evaluation_task_prompt_id_task_type', ['prompt_id', 'task_type'], unique=True)
+
+
+def downgrade():
+    with op.batch_alter_table('evaluation_task', schema=None) as batch_op:
+        batch_op.drop_index('ix_evaluation_task_prompt_id_task_type')
+
+    with op.batch_alter_table('prompt', schema=None) as batch_op:
+        batch_op.drop_index('ix_prompt_evaluation_pending_language_id')
+        batch_op.drop_column('evaluation_pending')
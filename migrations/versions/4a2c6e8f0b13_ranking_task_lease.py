@@ -0,0 +1,32 @@
+"""Ranking task leases
+
+Revision ID: 4a2c6e8f0b13
+Revises: 3e07b5c9d1a8
+Create Date: 2026-10-18 14:41:09.664213
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4a2c6e8f0b13'
+down_revision = '3e07b5c9d1a8'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('ranking_task', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('assigned_to', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('lease_expires_at', sa.DateTime(), nullable=True))
+        batch_op.create_foreign_key(batch_op.f('fk_ranking_task_assigned_to_user'), 'user', ['assigned_to'], ['id'])
+        batch_op.create_index('ix_ranking_task_completed_at_lease_expires_at', ['completed_at', 'lease_expires_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('ranking_task', schema=None) as batch_op:
+        batch_op.drop_index('ix_ranking_task_completed_at_lease_expires_at')
+        batch_op.drop_constraint(batch_op.f('fk_ranking_task_assigned_to_user'), type_='foreignkey')
+        batch_op.drop_column('lease_expires_at')
+        batch_op.drop_column('assigned_to')
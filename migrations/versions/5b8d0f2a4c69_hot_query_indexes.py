@@ -0,0 +1,38 @@
+"""Composite indexes for the hot page queries
+
+Revision ID: 5b8d0f2a4c69
+Revises: 4a2c6e8f0b13
+Create Date: 2026-10-18 15:20:44.183305
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5b8d0f2a4c69'
+down_revision = '4a2c6e8f0b13'
+branch_labels = None
+depends_on = None
+
+# (index, table, columns); see benchmarks/check_query_plans.py for the queries they serve
+INDEXES = [
+    ('ix_prompt_language_is_synthetic_id', 'prompt', ['language', 'is_synthetic', 'id']),
+    ('ix_prompt_parent_id_is_synthetic', 'prompt', ['parent_id', 'is_synthetic']),
+    ('ix_prompt_revision_author_id_parent_id', 'prompt', ['revision_author_id', 'parent_id']),
+    ('ix_evaluation_user_id_task_id', 'evaluation', ['user_id', 'task_id']),
+    ('ix_ranking_task_user_id_parent_prompt_id', 'ranking_task', ['user_id', 'parent_prompt_id']),
+]
+
+
+def upgrade():
+    # CREATE INDEX CONCURRENTLY does not block writes on PostgreSQL but cannot run in a transaction
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            op.create_index(name, table, columns, unique=False, postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for name, table, columns in reversed(INDEXES):
+            op.drop_index(name, table_name=table, postgresql_concurrently=True)
@@ -0,0 +1,27 @@
+"""Prompt prompt_html
+
+Revision ID: 6c1e3a5b7d80
+Revises: 5b8d0f2a4c69
+Create Date: 2026-10-18 16:05:12.540391
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6c1e3a5b7d80'
+down_revision = '5b8d0f2a4c69'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Filled in for existing prompts by `flask render-markdown`
+    with op.batch_alter_table('prompt', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('prompt_html', sa.Text(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('prompt', schema=None) as batch_op:
+        batch_op.drop_column('prompt_html')
@@ -0,0 +1,29 @@
+"""Index for sampling a random conversation starter in a language
+
+Revision ID: 7d4f2b9e1c35
+Revises: 6c1e3a5b7d80
+Create Date: 2026-10-18 17:05:12.604118
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7d4f2b9e1c35'
+down_revision = '6c1e3a5b7d80'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Lets sample_prompt(language, roots_only=True) seek to `id >= start` instead of sorting every root;
+    # CREATE INDEX CONCURRENTLY does not block writes on PostgreSQL but cannot run in a transaction
+    with op.get_context().autocommit_block():
+        op.create_index('ix_prompt_language_parent_id_id', 'prompt', ['language', 'parent_id', 'id'],
+                        unique=False, postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_prompt_language_parent_id_id', table_name='prompt', postgresql_concurrently=True)
@@ -0,0 +1,51 @@
+"""At most one pending or running generation job per prompt and type
+
+Revision ID: 8e6b3c0d2f47
+Revises: 7d4f2b9e1c35
+Create Date: 2026-10-18 18:21:47.390215
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8e6b3c0d2f47'
+down_revision = '7d4f2b9e1c35'
+branch_labels = None
+depends_on = None
+
+ACTIVE = sa.text("status IN ('pending', 'running')")
+
+generation_job = sa.table('generation_job',
+    sa.column('id', sa.Integer),
+    sa.column('job_type', sa.String),
+    sa.column('prompt_id', sa.Integer),
+    sa.column('status', sa.String),
+    sa.column('last_error', sa.Text),
+    sa.column('finished_at', sa.DateTime)
+)
+
+
+def upgrade():
+    # Fail all but the oldest of duplicate jobs queued before enqueue_job checked for them. A worker
+    # still running one of them finds it no longer running and leaves its outcome alone.
+    first = sa.select(sa.func.min(generation_job.c.id)).where(ACTIVE).group_by(
+        generation_job.c.job_type, generation_job.c.prompt_id
+    )
+    op.execute(
+        generation_job.update().where(ACTIVE, generation_job.c.id.notin_(first)).values(
+            status='failed', last_error='Duplicate of an earlier job', finished_at=sa.func.now()
+        )
+    )
+
+    # CREATE INDEX CONCURRENTLY does not block writes on PostgreSQL but cannot run in a transaction
+    with op.get_context().autocommit_block():
+        op.create_index('ix_generation_job_active_job_type_prompt_id', 'generation_job', ['job_type', 'prompt_id'],
+                        unique=True, postgresql_where=ACTIVE, sqlite_where=ACTIVE, postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_generation_job_active_job_type_prompt_id', table_name='generation_job',
+                      postgresql_concurrently=True)
@@ -0,0 +1,85 @@
+"""Prompt root_id and path
+
+Revision ID: b10a2cddc5de
+Revises: a011fc0c3bb5
+Create Date: 2026-10-18 09:12:41.305118
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b10a2cddc5de'
+down_revision = 'a011fc0c3bb5'
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 1000
+
+prompt = sa.table('prompt',
+    sa.column('id', sa.Integer),
+    sa.column('parent_id', sa.Integer),
+    sa.column('root_id', sa.Integer),
+    sa.column('path', sa.String)
+)
+
+
+def tree_path_segment(prompt_id):
+    return f"{prompt_id:010d}/"
+
+
+def backfill_tree_positions(connection):
+    update = prompt.update().where(prompt.c.id == sa.bindparam('b_id')).values(
+        root_id=sa.bindparam('b_root_id'), path=sa.bindparam('b_path'))
+
+    # Conversation starters are their own roots
+    while True:
+        ids = connection.execute(
+            sa.select(prompt.c.id).where(prompt.c.parent_id.is_(None), prompt.c.path.is_(None)).limit(BATCH_SIZE)
+        ).scalars().all()
+        if not ids:
+            break
+        connection.execute(update, [
+            {'b_id': prompt_id, 'b_root_id': prompt_id, 'b_path': tree_path_segment(prompt_id)}
+            for prompt_id in ids
+        ])
+
+    # Then fill in children whose parent already has a path, one batch at a time
+    parent = prompt.alias('parent')
+    while True:
+        rows = connection.execute(
+            sa.select(prompt.c.id, parent.c.root_id, parent.c.path)
+            .join(parent, parent.c.id == prompt.c.parent_id)
+            .where(prompt.c.path.is_(None), parent.c.path.isnot(None))
+            .limit(BATCH_SIZE)
+        ).all()
+        if not rows:
+            break
+        connection.execute(update, [
+            {'b_id': prompt_id, 'b_root_id': root_id, 'b_path': path + tree_path_segment(prompt_id)}
+            for prompt_id, root_id, path in rows
+        ])
+
+
+def upgrade():
+    with op.batch_alter_table('prompt', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('root_id', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('path', sa.Text(), nullable=True))
+
+    backfill_tree_positions(op.get_bind())
+
+    with op.batch_alter_table('prompt', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_prompt_root_id'), ['root_id'], unique=False)
+        batch_op.create_index(batch_op.f('ix_prompt_path'), ['path'], unique=False,
+                              postgresql_ops={'path': 'text_pattern_ops'})
+        batch_op.create_foreign_key(batch_op.f('fk_prompt_root_id_prompt'), 'prompt', ['root_id'], ['id'])
+
+
+def downgrade():
+    with op.batch_alter_table('prompt', schema=None) as batch_op:
+        batch_op.drop_constraint(batch_op.f('fk_prompt_root_id_prompt'), type_='foreignkey')
+        batch_op.drop_index(batch_op.f('ix_prompt_path'))
+        batch_op.drop_index(batch_op.f('ix_prompt_root_id'))
+        batch_op.drop_column('path')
+        batch_op.drop_column('root_id')
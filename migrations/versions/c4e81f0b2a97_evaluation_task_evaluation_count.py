@@ -0,0 +1,42 @@
+"""EvaluationTask evaluation_count
+
+Revision ID: c4e81f0b2a97
+Revises: b10a2cddc5de
+Create Date: 2026-10-18 10:03:17.482913
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4e81f0b2a97'
+down_revision = 'b10a2cddc5de'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('evaluation_task', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('evaluation_count', sa.Integer(), server_default='0', nullable=False))
+
+    # Backfill the counters from the existing evaluations
+    op.execute(
+        "UPDATE evaluation_task SET evaluation_count = "
+        "(SELECT COUNT(evaluation.id) FROM evaluation WHERE evaluation.task_id = evaluation_task.id)"
+    )
+
+    with op.batch_alter_table('evaluation_task', schema=None) as batch_op:
+        batch_op.create_index('ix_evaluation_task_language_task_type_evaluation_count', ['language', 'task_type', 'evaluation_count'], unique=False)
+
+    with op.batch_alter_table('evaluation', schema=None) as batch_op:
+        batch_op.create_index('ix_evaluation_task_id_user_id', ['task_id', 'user_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('evaluation', schema=None) as batch_op:
+        batch_op.drop_index('ix_evaluation_task_id_user_id')
+
+    with op.batch_alter_table('evaluation_task', schema=None) as batch_op:
+        batch_op.drop_index('ix_evaluation_task_language_task_type_evaluation_count')
+        batch_op.drop_column('evaluation_count')
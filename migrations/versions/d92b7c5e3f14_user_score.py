@@ -0,0 +1,50 @@
+"""User score
+
+Revision ID: d92b7c5e3f14
+Revises: c4e81f0b2a97
+Create Date: 2026-10-18 10:41:52.906311
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd92b7c5e3f14'
+down_revision = 'c4e81f0b2a97'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('user_score',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('prompts_ranked', sa.Integer(), nullable=False),
+    sa.Column('evaluations_performed', sa.Integer(), nullable=False),
+    sa.Column('total_score', sa.Integer(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], name=op.f('fk_user_score_user_id_user')),
+    sa.PrimaryKeyConstraint('user_id', name=op.f('pk_user_score'))
+    )
+
+    # Backfill from existing revisions and evaluations
+    op.execute(
+        "INSERT INTO user_score (user_id, prompts_ranked, evaluations_performed, total_score, updated_at) "
+        "SELECT user_id, SUM(prompts_ranked), SUM(evaluations_performed), "
+        "SUM(prompts_ranked) + SUM(evaluations_performed), CURRENT_TIMESTAMP FROM ("
+        "SELECT revision_author_id AS user_id, 1 AS prompts_ranked, 0 AS evaluations_performed "
+        "FROM prompt WHERE revision_author_id IS NOT NULL AND is_revision "
+        "UNION ALL "
+        "SELECT user_id, 0, 1 FROM evaluation"
+        ") AS contributions GROUP BY user_id"
+    )
+
+    with op.batch_alter_table('user_score', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_user_score_total_score'), ['total_score'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('user_score', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_user_score_total_score'))
+
+    op.drop_table('user_score')
@@ -0,0 +1,45 @@
+"""Generation job
+
+Revision ID: e57a0d913c68
+Revises: d92b7c5e3f14
+Create Date: 2026-10-18 11:26:05.117394
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e57a0d913c68'
+down_revision = 'd92b7c5e3f14'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('generation_job',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('job_type', sa.String(length=50), nullable=False),
+    sa.Column('prompt_id', sa.Integer(), nullable=False),
+    sa.Column('status', sa.String(length=20), nullable=False),
+    sa.Column('attempts', sa.Integer(), nullable=False),
+    sa.Column('max_attempts', sa.Integer(), nullable=False),
+    sa.Column('available_at', sa.DateTime(), nullable=False),
+    sa.Column('locked_by', sa.String(length=128), nullable=True),
+    sa.Column('lease_expires_at', sa.DateTime(), nullable=True),
+    sa.Column('last_error', sa.Text(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('started_at', sa.DateTime(), nullable=True),
+    sa.Column('finished_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['prompt_id'], ['prompt.id'], name=op.f('fk_generation_job_prompt_id_prompt')),
+    sa.PrimaryKeyConstraint('id', name=op.f('pk_generation_job'))
+    )
+    with op.batch_alter_table('generation_job', schema=None) as batch_op:
+        batch_op.create_index('ix_generation_job_status_available_at', ['status', 'available_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('generation_job', schema=None) as batch_op:
+        batch_op.drop_index('ix_generation_job_status_available_at')
+
+    op.drop_table('generation_job')
@@ -0,0 +1,32 @@
+"""Indexes for loading evaluations and rankings by prompt
+
+Revision ID: f3a6c19d8e20
+Revises: e57a0d913c68
+Create Date: 2026-10-18 12:14:52.107345
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3a6c19d8e20'
+down_revision = 'e57a0d913c68'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('evaluation_task', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_evaluation_task_prompt_id'), ['prompt_id'], unique=False)
+
+    with op.batch_alter_table('ranking_task', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_ranking_task_parent_prompt_id'), ['parent_prompt_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('ranking_task', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_ranking_task_parent_prompt_id'))
+
+    with op.batch_alter_table('evaluation_task', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_evaluation_task_prompt_id'))